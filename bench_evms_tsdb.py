@@ -0,0 +1,67 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: bench_evms_tsdb.py
+#
+#   Benchmark for the long term telemetry store (evms_tsdb.py). Writes hours of simulated 10 Hz records into a
+#   scratch database through Tsdb.record() (the 10 Hz task side), then times the range queries the GUI and the trip
+#   screen make on every tier, and reports the database size.
+#
+#   usage: python3 bench_evms_tsdb.py [hours, default 24] [scratch file, default /tmp/bench_evms_tsdb.sqlite]
+#
+######################################################################################################################
+
+import os
+import sys
+import time
+import numpy as np
+from evms_data_holder import DataHolder
+from evms_tsdb import Tsdb
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+    hours = float(sys.argv[1]) if len(sys.argv) > 1 else 24
+    filename = sys.argv[2] if len(sys.argv) > 2 else '/tmp/bench_evms_tsdb.sqlite'
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(filename + suffix):
+            os.remove(filename + suffix)
+
+    dat = DataHolder()
+    tsdb = Tsdb(filename)
+    rng = np.random.default_rng(1)
+    count = int(hours * 3600 * 10)
+    t0 = time.time() - hours * 3600
+    elapsed = 0.0
+    for i in range(count):
+        if i % 10 == 0:  # a trip like signal: slow rpm / power changes plus noise
+            dat.rpm = 800 + 600 * np.sin(i / 20000) + rng.normal(0, 5)
+            dat.pwr = dat.rpm / 150 + rng.normal(0, 0.1)
+            dat.soc = 100 - 50 * i / count
+            dat.pack_amps = dat.pwr * 20
+            dat.latitude = 41.5 + i / count / 10
+            dat.publish()
+        start = time.perf_counter()
+        tsdb.record(dat.get_record, t0 + i / 10)
+        elapsed += time.perf_counter() - start
+    tsdb.close()
+    print('record():  %6.1f us per 10 Hz record (%d records)' % (elapsed / count * 1e6, count))
+    print('database:  %6.1f MB for %.1f hours' % (os.path.getsize(filename) / 1e6, hours))
+
+    tsdb = Tsdb(filename)
+    end = t0 + hours * 3600
+    for label, span, tier in (('last 5 min', 300, 'raw'), ('last 10 min', 600, 'raw'), ('last 2 hours', 7200, 'min'),
+                              ('whole run', hours * 3600, 'min'), ('whole run', hours * 3600, 'hrs')):
+        query_time, result = timed(lambda: tsdb.query(('rpm', 'pwr', 'soc'), end - span, end, tier), 20)
+        print('%-13s %-3s %8.2f ms (%6d points)' % (label, tier, query_time * 1000, len(result.t)))
+    auto_time, result = timed(lambda: tsdb.query('pwr', t0, end), 20)
+    print('%-13s %-3s %8.2f ms (%6d points, tier picked by query)' % ('whole run', result.tier, auto_time * 1000,
+                                                                      len(result.t)))
+    tsdb.close()
@@ -0,0 +1,149 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: bench_mapPlots.py
+#
+#   Benchmark for the trip map data preparation (everything plot_coords does before the plotly figure is built).
+#   Runs the original per element pipeline (kept below as legacy_points, reading the log with the original
+#   _tmp file + np.genfromtxt step) and mapPlots.trip_points on the same log, and reports time per call for both.
+#   The log is copied into a temporary directory first, so the index cache (<log>.idx.npz) and the _tmp file
+#   are written there and not next to the log.
+#
+#   usage: python3 bench_mapPlots.py [logs/2022-05-14__saved_evms_system.log] [repeat]
+#
+######################################################################################################################
+
+import math
+import os
+import sys
+import time
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from mapPlots import mapPlots, map_stats
+
+DEFAULT_LOG = 'logs/2022-05-14__saved_evms_system.log'
+
+
+def is_str_Float(string):
+    try:
+        float(string)
+        return True
+    except ValueError:
+        return False
+
+
+# plot_coords parts 1 - 4 as they were before trip_points, up to the plotly call
+def legacy_points(filename, stat, convert_to_DDmmmmm=True):
+    tmp = filename + '_tmp'
+    file = open(filename, 'r+')
+    tmp_file = open(tmp, 'w+')
+    line = file.readline()
+    count = 0
+    while line != '':
+        if count >= 9:
+            if line[0] == 'a':
+                l = len(line.split(','))
+                if l == 21:
+                    tmp_file.write(line)
+        line = file.readline()
+        count += 1
+    tmp_file.close()
+    file.close()
+
+    table = np.genfromtxt(tmp, dtype=str, delimiter=',', skip_header=1, invalid_raise=False)
+    os.remove(tmp)
+    lats = table[:, 3]
+    lons = table[:, 4]
+    ibats = table[:, 9]
+    vbats = table[:, 10]
+    socs = table[:, 8]
+    spds = table[:, 5]
+    pack_amp_hrs_list = table[:, 13]
+
+    for idx, lat in enumerate(lats):
+        if is_str_Float(lat):
+            lat = float(lat)
+            if convert_to_DDmmmmm == True:
+                lat = float(lat) / 100
+                DD = math.trunc(lat)
+                mmmmm = lat - DD
+                ddddd = mmmmm * 100 / 60
+                lats[idx] = DD + ddddd
+            else:
+                lats[idx] = float(lat)
+
+    for idx, lon in enumerate(lons):
+        if is_str_Float(lon):
+            lon = float(lon)
+            if convert_to_DDmmmmm == True:
+                lon = float(lon) / 100
+                DD = math.trunc(lon)
+                mmmmm = lon - DD
+                ddddd = mmmmm * 100 / 60
+                lons[idx] = (DD + ddddd) * -1
+            else:
+                lons[idx] = float(lon)
+
+    colors = []
+    if stat == 'pwr':
+        stat_symbol = "kW"
+        for idx, ibat in enumerate(ibats):
+            if is_str_Float(ibat):
+                colors.append(abs((float(ibat) * float(vbats[idx])) / 1000))
+            else:
+                colors.append(0)
+    else:
+        stat_symbol = stat
+        column = {'soc': socs, 'spd': spds, 'pack_amp_hrs': pack_amp_hrs_list}[stat]
+        for idx, value in enumerate(column):
+            if is_str_Float(value):
+                colors.append(float(value))
+            else:
+                colors.append(0)
+
+    df = pd.DataFrame({'lats': lats, 'lons': lons, stat_symbol: colors})
+    df = df.dropna()
+    df = df[df.lats != '']
+    df = df[df.lons != '']
+    df = df[df.lats != 0.0]
+    df = df[df.lons != 0.0]
+    df = df[df.lats != 'None']
+    df = df[df.lons != 'None']
+    df = df[df.lats != 'lat']
+    df = df[df.lons != 'lon']
+    df.lats = df.lats.astype(float)
+    df.lons = df.lons.astype(float)
+    df[stat_symbol] = df[stat_symbol].astype(float)
+    df = df.iloc[2::10, :]
+    return df
+
+
+def timed(function, repeat):
+    start = time.perf_counter()
+    for _ in range(repeat):
+        result = function()
+    return (time.perf_counter() - start) / repeat, result
+
+
+if __name__ == "__main__":
+    source = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_LOG
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    maps = mapPlots('/dev/null', '')
+    scratch = tempfile.mkdtemp(prefix='bench_mapPlots_')
+    filename = os.path.join(scratch, os.path.basename(source))
+    shutil.copyfile(source, filename)
+    cold, _ = timed(lambda: maps.trip_points(filename, 'pwr'), 1)
+    print('trip_points, no cached index: %8.1f ms' % (cold * 1000))
+
+    for stat in map_stats:
+        old_time, df = timed(lambda: legacy_points(filename, stat), repeat)
+        new_time, (lats, lons, values, symbol, name) = timed(lambda: maps.trip_points(filename, stat), repeat)
+        print('%-14s legacy: %8.1f ms (%5d points)   vectorized: %8.1f ms (%5d points)   (x%.0f)'
+              % (stat, old_time * 1000, len(df), new_time * 1000, len(lats), old_time / new_time))
+        print('               lat %.5f .. %.5f / %.5f .. %.5f   lon %.5f .. %.5f / %.5f .. %.5f'
+              % (df.lats.min(), df.lats.max(), lats.min(), lats.max(),
+                 df.lons.min(), df.lons.max(), lons.min(), lons.max()))
+    shutil.rmtree(scratch)
@@ -32,11 +32,20 @@ import serial, can
 import time
 from time import sleep, tzname, timezone
 import concurrent.futures
+import asyncio
 from sys import argv
 import os
 import numpy as np
 from evms_data_holder import DataHolder
 from evms_can import evms_can
+from evms_cells import text as cells_text
+from evms_syslog import BinarySysLog, csv_column_headers, SYSLOG_COLUMNS
+from evms_canlog import CanRingLog
+from evms_aio import IoCore, SerialLineReader, JbdClient
+from evms_gui_binding import GuiBinder, field_format
+from evms_charts import BarHistoryChart, fill_rectangles
+from evms_log import log_ring, LogConsole, start_logging
+from evms_tsdb import Tsdb
 from mapPlots import mapPlots
 from datetime import datetime, timedelta
 import subprocess
@@ -49,17 +58,13 @@ import json
 
 
 
-log_window_buffer = ''
 appStartDateString = datetime.now().strftime("%Y-%m-%d")
 appStartTimeString = datetime.now().strftime("%H:%M:%S")
 
-logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO, handlers=[
-    logging.FileHandler('logs/' + appStartDateString + '_evms_app.log'),
-    logging.StreamHandler(sys.stdout)])
+# the one logging setup of the process: log() and the module loggers only queue the record (see evms_log.py)
+log_writer = start_logging('logs/' + appStartDateString + '_evms_app.log')
 
 def log(message):
-    global log_window_buffer
-    log_window_buffer += message + '\n'
     logging.info(message)
 
 
@@ -80,7 +85,21 @@ class App:
         self.debug_wo_gps = False #<--- SHOULD BE FALSE unless debugging ****************
         self.app_logging_enabled = True  # ALWAYS TRUE
         self.sys_logging_enabled = True
-        self.can_tx_msgs = False
+        self.sys_log_format = 'csv'  # 'csv' (a/b/c text lines) or 'binary' (evms_syslog records)
+        self.can_tx_period = 0.2  # transmit outbound can message(s) every 200 ms
+        self.can_capture_all = False  # True: no kernel CAN id filters (diagnostics)
+        self.can_ring_segments = 16  # CAN capture ring: segment count and size, caps disk use at 256 MB
+        self.can_ring_segment_mb = 16
+        self.can_bitrate = 250000  # for the bus load estimate, as set up by evms.sh / evms-start.sh
+        self.can_bus_ids = {}  # channel: arbitration ids decoded on that bus (cfg: can_bus_ids), all ids if not listed
+        self.io_core = 'threads'  # 'threads' or 'asyncio' (one event loop for CAN, GPS, JBD and timers, evms_aio.py)
+        self.aio = None
+        self.tsdb = None
+        self.tsdb_enabled = True  # long term telemetry store (evms_tsdb.py)
+        self.tsdb_file = 'logs/evms_tsdb.sqlite'
+        self.tsdb_raw_days = 7  # full rate records kept this many days
+        self.tsdb_min_days = 0  # 1 min aggregates kept this many days, 0: until the size limit
+        self.tsdb_max_mb = 2048
         self.lfp_banks = 1
         self.pack_1_capacity = 10000
         self.pack_2_capacity = 15000 #defualt value
@@ -88,16 +107,7 @@ class App:
         self.config_info = self.read_evms_cfg_settings()
         self.dat = DataHolder()#'logs/' + appStartDateString + '_evms_app.log', log_window_buffer)
 
-        # - initialze variables used for pack 2 (JBD BMS) so they are available for calculations...
-        self.dat.pack2_volts    = 0
-        self.dat.pack2_amps     = 0
-        self.dat.pack2_soc      = 0
-        self.dat.pack2_full_cap = 0
-        self.dat.jbd_cell_mv    = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-        self.dat.jbd_bal        = [0,0,0,0,0,0,0,0,0,0,0,0,0,0,0,0]
-
-        self.mapPlots = mapPlots('logs/' + appStartDateString + '_evms_app.log', log_window_buffer)
-        self.evms_can = evms_can('logs/' + appStartDateString + '_evms_app.log', log_window_buffer)
+        self.mapPlots = mapPlots('logs/' + appStartDateString + '_evms_app.log', log_ring)
         self.evms_about_top_text = 'The EVMS system is for display and monitoring the electric propulsion system status. Motor control is not affected by the EMVS setings.'
 
         if '_PYIBoot_SPLASH' in os.environ and importlib.util.find_spec("pyi_splash"):
@@ -112,12 +122,22 @@ class App:
             self.init_SysLog()
         except Exception as e:
             log('App / SysLog init ERROR: ' + str(e))
+        self.init_tsdb()
 
         # --- argv parsing -----
         try:
-            self.can_if_name = argv[1]
+            self.can_if_names = argv[1].split(',')  # several buses at once: evms.py can0,can1 usb
         except Exception as e:
+            self.can_if_names = [None]
             log('Exception __init__ argv[1]' + str(e))
+        self.can_if_name = self.can_if_names[0]
+        self.can_buses = []
+        for name in self.can_if_names:
+            bus = evms_can('logs/' + appStartDateString + '_evms_app.log', log_ring, name,
+                           self.can_bus_ids.get(name))
+            bus.stats.bitrate = self.can_bitrate
+            self.can_buses.append(bus)
+        self.evms_can = self.can_buses[0]  # primary bus: LFP bank select TX
         try:
             self.syslog_replay_file = argv[3]
             self.replaying_logfile = True
@@ -142,10 +162,6 @@ class App:
             self.init_gps_serial()
             self.init_can_interface()
 
-            self.a_data = ''
-            self.b_data = ''
-            self.c_data = ''
-
         except Exception as e:
             log('Exception __init__ part 2: ' + str(e))
         try:
@@ -160,13 +176,6 @@ class App:
 
         try:
             self.dat.max_y_scale_bar_hist = 220 #150  # widow height is 220+80
-            self.dat.y_offset = 0  # 10 pix margin at bottom and top
-            self.dat.pwr_graph_x_ofst = 0
-            self.dat.pwr_graph_width_pix = 1280
-            self.dat.pwr_bin_width = 22
-            self.dat.pwr_bin_shade = 18
-            self.dat.GPS_FORMAT = 'DECIMAL'
-            self.dat.HDG_UNITS = 'MAG'
             self.builder.connect_signals(self)
             self.window = self.builder.get_object("evms_window")
             self.bar_history_combobox = self.builder.get_object('id_bar_history_combobox')
@@ -210,6 +219,7 @@ class App:
             self.bar_history_type = 'Power'
             self.wifi_txtbox = self.builder.get_object('id_wifi_txtbox')
             self.text_log_buffer = self.wifi_txtbox.get_buffer()
+            self.log_console = LogConsole(self.text_log_buffer)  # last 500 log lines
             self.about_top_buffer = self.id_about_txtbox_top.get_buffer()
             self.scroll_window = self.builder.get_object('id_wifi_scrolled_window')
             self.shift = False
@@ -267,12 +277,14 @@ class App:
 
         def get_trip_logs():
             model = gtk.ListStore(str)
-            list_of_files = glob.glob('logs/*system.log')
+            list_of_files = glob.glob('logs/*system.log') + glob.glob('logs/*system.bin')
             list_of_files.sort(key=os.path.getctime, reverse=True)
             for idx, file in enumerate(list_of_files):
                 model.append([file])
             self.triplog_select.set_model(model)
             self.triplog_select.set_active(1)
+            # the log of the running trip keeps changing, only finished logs are worth rendering ahead of time
+            self.mapPlots.prerender([file for file in list_of_files if file != self.SysLogName])
 
         def on_switch_tab(notebook, tab, index):
             if index > 5:
@@ -1175,11 +1187,9 @@ class App:
             log("can_logging_enabled = " + str(self.can_logging_enabled))
             try:
                 if self.can_logging_enabled == True:
-                    os.system("candump -L " + argv[1] + " >> " + self.CANLogName + " & ")
-                    log("started candump process")
+                    self.start_can_capture()
                 else:
-                    os.system("killall candump")
-                    log("killing candump process")
+                    self.stop_can_capture()
             except Exception as e:
                 log("on_can_logging ERROR: " + str(e))
 
@@ -1321,11 +1331,69 @@ class App:
         self.lbl_eng_longitude = self.builder.get_object("lbl_eng_longitude")
         self.lbl_eng_kts = self.builder.get_object("lbl_eng_kts")
         self.lbl_eng_hdg = self.builder.get_object("lbl_eng_hdg")
+        self.lbl_eng_busStats = self.builder.get_object("lbl_eng_busStats")
         self.lbl_eng_sysDatetime = self.builder.get_object("lbl_eng_sysDatetime")
         self.lbl_eng_gpsDatetime = self.builder.get_object("lbl_eng_gpsDatetime")
         self.lbl_eng_timeDelta = self.builder.get_object("lbl_eng_timeDelta")
         self.lbl_eng_timezone = self.builder.get_object("lbl_eng_timezone")
         self.lbl_eng_offsetFromUtc = self.builder.get_object("lbl_eng_offsetFromUtc")
+        # CAN Data tab labels showing a telemetry field as is, updated by on_eng_signals when the field changes
+        self.eng_labels = {
+            'mot_rpm': (self.lbl_eng_rpm,),
+            'mot_temp': (self.lbl_eng_motTemp,),
+            'mot_ctrl_temp': (self.lbl_eng_CtrlTemp,),
+            'mot_amps': (self.lbl_eng_motAmps,),
+            'mot_volts': (self.lbl_eng_motVolts,),
+            'mot_stator_freq': (self.lbl_eng_motStatFreq,),
+            'ctrl_fault_1': (self.lbl_eng_ctrlFault1, self.lbl_eng_pidErr1),
+            'ctrl_fault_2': (self.lbl_eng_ctrlFault2, self.lbl_eng_pidErr2),
+            'thrtl_inp': (self.lbl_eng_throttleInput,),
+            'brake_inp': (self.lbl_eng_brakeInput,),
+            'econ_bit': (self.lbl_eng_econBit,),
+            'regen_bit': (self.lbl_eng_regenBit,),
+            'rev_bit': (self.lbl_eng_revBit,),
+            'brake_light_bit': (self.lbl_eng_brakeLightBit,),
+            'pack_lo_cell_v': (self.lbl_eng_packLoCellV,),
+            'pack_hi_cell_v': (self.lbl_eng_packHiCellV,),
+            'pack_avg_cell_v': (self.lbl_eng_PackAvgCellV,),
+            'pack_max_cell_num': (self.lbl_eng_packMaxCellNum,),
+            'pack_pop_cells': (self.lbl_eng_packPopCells,),
+            'dsch_rly_enbl': (self.lbl_eng_dischRlyEnbl,),
+            'chg_rly_enbl': (self.lbl_eng_chgRlyEnbl,),
+            'chg_sfty_enbl': (self.lbl_eng_chgSftyEnbl,),
+            'mlfctn_ind_active': (self.lbl_eng_mlfctnIndActive,),
+            'multi_prps_inp_sig': (self.lbl_eng_mltprpsInpSig,),
+            'alws_on_sig_stat': (self.lbl_eng_alwaysOnSigStat,),
+            'is_rdy_sig_stat': (self.lbl_eng_isRdySigStat,),
+            'charging': (self.lbl_eng_charging,),
+            'pack_12volt': (self.lbl_eng_pack12v,),
+            'pack_amps': (self.lbl_eng_packAmps,),
+            'pack_volts': (self.lbl_eng_packVolts,),
+            'pack_amp_hrs': (self.lbl_eng_packAh,),
+            'pack_hi_tmp': (self.lbl_eng_packHiTemp,),
+            'pack_lo_tmp': (self.lbl_eng_packLoTemp,),
+            'soc': (self.lbl_eng_packSoc,),
+            'resistance': (self.lbl_eng_packRes,),
+            'pack_hlth': (self.lbl_eng_packHealth,),
+            'pack_open_v': (self.lbl_eng_packOpenV,),
+            'pack_total_cyc': (self.lbl_eng_packTotCyc,),
+            'pack_ccl': (self.lbl_eng_packCcl,),
+            'pack_dcl': (self.lbl_eng_packDcl,),
+            'pack_max_cell_v': (self.lbl_eng_packMaxCellV,),
+            'pack_min_cell_v': (self.lbl_eng_packMinCellV,),
+            'pid_resp_min': (self.lbl_eng_pidRespMin,),
+            'pid_resp_max': (self.lbl_eng_pidRespMax,),
+            'pid_fault_cnt': (self.lbl_eng_pidFaultCnt,),
+            'time': (self.lbl_eng_gpsTime,),
+            'date': (self.lbl_eng_gpsDate,),
+            'spd': (self.lbl_eng_kts,),
+            'hdg': (self.lbl_eng_hdg,),
+        }
+        self.gui = GuiBinder(self.notebook, log)
+        self.bind_gui_labels()
+        self.dat.subscribe('eng_tab', self.eng_labels, self.on_eng_signals, min_interval=0.25)
+        self.dat.subscribe('syslog', set().union(*SYSLOG_COLUMNS.values()), self.on_syslog_signals,
+                           min_interval=1.0)
 
         # -----------------------------------------------------------------------------------------------
         self.window.set_title('Electric Vessel Monitoring System')
@@ -1333,6 +1401,7 @@ class App:
         self.window.connect_after('destroy', self.on_window_destroy)
 
         # -----------------------------------------------------------------------------------------------
+        self.bar_charts = {}  # drawing area: BarHistoryChart, see evms_charts.py
         self.plotRingGaugeArea.connect('draw', self.on_draw_ring_gauge)
         self.plotGaugeKeyArea.connect('draw', self.on_draw_gauge_key)
         self.plotMotTempArea.connect('draw', self.on_draw_mot_temp)
@@ -1355,12 +1424,17 @@ class App:
 
         with concurrent.futures.ThreadPoolExecutor() as executor:
             #executor.submit(self.applog_thread)
-            if self.syslog_replay_file is None:
+            if self.syslog_replay_file is None and self.io_core == 'asyncio':
+                executor.submit(gtk.main)
+                executor.submit(self.io_core_thread)
+            elif self.syslog_replay_file is None:
                 if self.debug_wo_gps == True:
                     pass
                 else:
                     executor.submit(self.gps_reader_thread)
-                executor.submit(self.can_processing_thread, self.CANInterface)
+                for bus in self.can_buses:
+                    if bus.interface is not None:
+                        executor.submit(self.can_processing_thread, bus.interface, bus)
                 executor.submit(gtk.main)
                 executor.submit(self.tenHz_timer_thread)
                 executor.submit(self.jbd_bms_monitor_thread)
@@ -1375,6 +1449,14 @@ class App:
         self.stop_gps_thread = True
         self.stop_can_thread = True
         self.stop_timing_thread = True
+        if self.aio is not None:
+            self.aio.stop()
+        self.evms_can.can_stop_select_LFP()
+        if self.sys_log_format == 'binary' and self.SysLog is not None:
+            self.SysLog.close()
+        if self.tsdb is not None:
+            self.tsdb.close()
+        self.stop_can_capture()
         gtk.main_quit()
 
     def update_pwr_histogram(self):
@@ -1401,7 +1483,7 @@ class App:
                     pwrhist = np.fromstring(line, dtype=int, sep=',')
 
             #print(pwrhist)
-            pwrhistogram, bin_edges = np.histogram([self.dat.pwr_min[0] * self.max_pwr/25+.5], range(0, bincount+1))
+            pwrhistogram, bin_edges = np.histogram([self.dat.histories['pwr'].last('min') * self.max_pwr/25+.5], range(0, bincount+1))
             #print(pwrhistogram)
             pwrhistogram = pwrhist + pwrhistogram
             #print(pwrhistogram)
@@ -1435,7 +1517,7 @@ class App:
                     rpmhist = np.fromstring(line, dtype=int, sep=',')
 
             #print(rpmhist)
-            rpmhistogram, bin_edges = np.histogram([self.dat.rpm_min[0] / 75], range(0, bincount+1))
+            rpmhistogram, bin_edges = np.histogram([self.dat.histories['rpm'].last('min') / 75], range(0, bincount+1))
             #print(rpmhistogram)
             rpmhistogram = rpmhist + rpmhistogram
             #print(rpmhistogram)
@@ -1508,13 +1590,49 @@ class App:
                         self.can_logging_enabled = True
                     elif line[1] == 'False':
                         self.can_logging_enabled = False
+                elif line[0] == 'can_capture_all':
+                    if line[1] == 'True':
+                        self.can_capture_all = True
+                    else:
+                        self.can_capture_all = False
+                elif line[0] == 'sys_log_format':
+                    if line[1] == 'binary':
+                        self.sys_log_format = 'binary'
+                    else:
+                        self.sys_log_format = 'csv'
+                elif line[0] == 'can_ring_segments':
+                    self.can_ring_segments = int(line[1])
+                elif line[0] == 'can_ring_segment_mb':
+                    self.can_ring_segment_mb = int(line[1])
+                elif line[0] == 'can_bitrate':
+                    self.can_bitrate = int(line[1])
+                elif line[0] == 'can_bus_ids':
+                    self.can_bus_ids[line[1]] = [int(i, 0) for i in line[2:] if i != '']
+                elif line[0] == 'io_core':
+                    if line[1] == 'asyncio':
+                        self.io_core = 'asyncio'
+                    else:
+                        self.io_core = 'threads'
+                elif line[0] == 'tsdb_enabled':
+                    if line[1] == 'True':
+                        self.tsdb_enabled = True
+                    else:
+                        self.tsdb_enabled = False
+                elif line[0] == 'tsdb_file':
+                    self.tsdb_file = line[1]
+                elif line[0] == 'tsdb_raw_days':
+                    self.tsdb_raw_days = float(line[1])
+                elif line[0] == 'tsdb_min_days':
+                    self.tsdb_min_days = float(line[1])
+                elif line[0] == 'tsdb_max_mb':
+                    self.tsdb_max_mb = int(line[1])
                 elif line[0] == 'gps_logging_enabled':
                     if line[1] == 'True':
                         self.gps_logging_enabled = True
                     else:
                         self.gps_logging_enabled = False
                 elif line[0] == 'lfp_banks':
-                    self.lfp_banks == float(line[1])
+                    self.lfp_banks = float(line[1])
                 elif line[0] == 'pack_1_capacity':
                     self.pack_1_capacity == float(line[1])
                 elif line[0] == 'pack_2_capacity':
@@ -1526,227 +1644,109 @@ class App:
     def jbd_status(self):
 
         if self.jbd_read_state == 0:
-            #print("\n\nreading Basic Info:")  # ======================================================================
-            basicInfo = self.j.readBasicInfo()
-            # print(json.dumps(basicInfo, indent = 2))
-
-            # if False:
-            #     for name, value in basicInfo.items():
-            #         try:
-            #             match name:
-            #                 case 'cur_cap':
-            #                     print(name, f'{value:7.3f}')
-            #                 case 'full_cap':
-            #                     print(name, f'{value:7.3f}')
-            #                 case 'bal16' | 'bal17' | 'bal18' | 'bal19' | 'bal20' | 'bal21' | 'bal22' | 'bal23' | 'bal24' | 'bal25' | 'bal26' | 'bal27' | 'bal28' | 'bal29' | 'bal30' | 'bal31':
-            #                     pass  # print("skipping " + name)
-            #                 case 'ntc3' | 'ntc4' | 'ntc5' | 'ntc6' | 'ntc7':
-            #                     pass  # print("skipping " + name)
-            #                 case other:
-            #                     print(name, value)
-            #         except Exception as e:
-            #             print(e)
-            # else:
-            #get variables for SOC bar graph, etc..
-            self.dat.pack2_volts = basicInfo["pack_mv"] / 1000
-            self.dat.pack2_amps  = basicInfo["pack_ma"] / 1000
-            self.dat.pack2_soc   = basicInfo["cur_cap"] / 1000
-            self.dat.pack2_full_cap = basicInfo["full_cap"] / 1000
-
-            # load lables on JBD Battery Tab
-            self.jbd_basicInfo_v1.set_label(f'{basicInfo["pack_mv"]/1000:7.3f}')
-            self.jbd_basicInfo_v2.set_label(f'{basicInfo["pack_ma"]/1000:7.3f}')
-            self.jbd_basicInfo_v3.set_label(f'{basicInfo["cur_cap"]/1000:7.3f}')
-            self.jbd_basicInfo_v4.set_label(f'{basicInfo["full_cap"]/1000:7.3f}')
-            self.jbd_basicInfo_v5.set_label('{x}'.format(x=basicInfo['cycle_cnt']))
-            self.jbd_basicInfo_v6.set_label('{x}'.format(x=basicInfo['year']))
-            self.jbd_basicInfo_v7.set_label('{x}'.format(x=basicInfo['month']))
-            self.jbd_basicInfo_v8.set_label('{x}'.format(x=basicInfo['day']))
-
-            for i in range(0,15):
-                bal_str = 'bal' + str(i)
-                self.dat.jbd_bal[i] = basicInfo[bal_str]
-
-                self.jbd_basicInfo_v9.set_label('{x}'.format(x=basicInfo['bal0']))
-                self.jbd_basicInfo_v10.set_label('{x}'.format(x=basicInfo['bal1']))
-                self.jbd_basicInfo_v11.set_label('{x}'.format(x=basicInfo['bal2']))
-                self.jbd_basicInfo_v12.set_label('{x}'.format(x=basicInfo['bal3']))
-                self.jbd_basicInfo_v13.set_label('{x}'.format(x=basicInfo['bal4']))
-                self.jbd_basicInfo_v14.set_label('{x}'.format(x=basicInfo['bal5']))
-                self.jbd_basicInfo_v15.set_label('{x}'.format(x=basicInfo['bal6']))
-                self.jbd_basicInfo_v16.set_label('{x}'.format(x=basicInfo['bal7']))
-                self.jbd_basicInfo_v17.set_label('{x}'.format(x=basicInfo['bal8']))
-                self.jbd_basicInfo_v18.set_label('{x}'.format(x=basicInfo['bal9']))
-                self.jbd_basicInfo_v19.set_label('{x}'.format(x=basicInfo['bal10']))
-                self.jbd_basicInfo_v20.set_label('{x}'.format(x=basicInfo['bal11']))
-                self.jbd_basicInfo_v21.set_label('{x}'.format(x=basicInfo['bal12']))
-                self.jbd_basicInfo_v22.set_label('{x}'.format(x=basicInfo['bal13']))
-                self.jbd_basicInfo_v23.set_label('{x}'.format(x=basicInfo['bal14']))
-                self.jbd_basicInfo_v24.set_label('{x}'.format(x=basicInfo['bal15']))
+            self.jbd_basic_info(self.j.readBasicInfo())
 
         if self.jbd_read_state == 1:
-            #print("\n\nreading Cell Info:")  # ======================================================================
-            cellInfo = self.j.readCellInfo()
-            # print(json.dumps(cellInfo, indent = 2))
-            # if False:
-            #     for name, value in cellInfo.items():
-            #         try:
-            #             value = value / 1000
-            #             print(name, f'{value:7.3f}')
-            #         except Exception as e:
-            #             print(e)
-            # else:
-            for i in range(0,15):
-                self.dat.jbd_cell_mv[i] = cellInfo["cell"+str(i)+"_mv"] / 1000 # save these values for the cell graph
-
-            self.jbd_cell_volts_v0.set_label(f'{cellInfo["cell0_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v1.set_label(f'{cellInfo["cell1_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v2.set_label(f'{cellInfo["cell2_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v3.set_label(f'{cellInfo["cell3_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v4.set_label(f'{cellInfo["cell4_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v5.set_label(f'{cellInfo["cell5_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v6.set_label(f'{cellInfo["cell6_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v7.set_label(f'{cellInfo["cell7_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v8.set_label(f'{cellInfo["cell8_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v9.set_label(f'{cellInfo["cell9_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v10.set_label(f'{cellInfo["cell10_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v11.set_label(f'{cellInfo["cell11_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v12.set_label(f'{cellInfo["cell12_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v13.set_label(f'{cellInfo["cell13_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v14.set_label(f'{cellInfo["cell14_mv"]/1000:7.3f}')
-            self.jbd_cell_volts_v15.set_label(f'{cellInfo["cell15_mv"]/1000:7.3f}')
-
-
-            # print("\n\nDevice Info:")  # ======================================================================
-            # deviceInfo = self.j.readDeviceInfo()
-            # # print(json.dumps(deviceInfo, indent = 2))
-            #
-            # for name, value in deviceInfo.items():
-            #     try:
-            #         match name:
-            #             case 'cur_cap':
-            #                 print(name, f'{value:7.3f}')
-            #             case other:
-            #                 print(name, value)
-            #
-            #     except Exception as e:
-            #         print(e)
+            self.jbd_cell_info(self.j.readCellInfo())
 
         if self.jbd_read_state == 2:
-            #print("\n\nreading EEPROM Info:")  # ======================================================================
-            eepromInfo = self.j.readEeprom()
-            #for name, value in eepromInfo.items():
-            try:
-                self.jbd_eeprom_v1.set_label(f'{eepromInfo["covp"]/1000:7.3f}')
-                self.jbd_eeprom_v2.set_label(f'{eepromInfo["covp_rel"]/100:7.3f}')
-                self.jbd_eeprom_v3.set_label(f'{eepromInfo["cuvp"]/1000:7.3f}')
-                self.jbd_eeprom_v4.set_label(f'{eepromInfo["cuvp_rel"]/1000:7.3f}')
-                self.jbd_eeprom_v5.set_label(f'{eepromInfo["povp"]/100:7.3f}')
-                self.jbd_eeprom_v6.set_label(f'{eepromInfo["povp_rel"]/100:7.3f}')
-                self.jbd_eeprom_v7.set_label(f'{eepromInfo["puvp"]/100:7.3f}')
-                self.jbd_eeprom_v8.set_label(f'{eepromInfo["puvp_rel"]/100:7.3f}')
-                self.jbd_eeprom_v9.set_label(f'{eepromInfo["chgot"]/100:7.3f}')
-                self.jbd_eeprom_v10.set_label(f'{eepromInfo["chgot_rel"]/100:7.3f}')
-                self.jbd_eeprom_v11.set_label(f'{eepromInfo["chgut"]/100:7.3f}')
-                self.jbd_eeprom_v12.set_label(f'{eepromInfo["chgut_rel"]/100:7.3f}')
-                self.jbd_eeprom_v13.set_label(f'{eepromInfo["dsgot"]/100:7.3f}')
-                self.jbd_eeprom_v14.set_label(f'{eepromInfo["dsgot_rel"]/100:7.3f}')
-                self.jbd_eeprom_v15.set_label(f'{eepromInfo["dsgut"]/100:7.3f}')
-                self.jbd_eeprom_v16.set_label(f'{eepromInfo["dsgut_rel"]/100:7.3f}')
-                self.jbd_eeprom_v17.set_label(f'{eepromInfo["chgoc"]/100:7.3f}')
-                self.jbd_eeprom_v18.set_label(f'{eepromInfo["dsgoc"]/100:7.3f}')
-                self.jbd_eeprom_v19.set_label(f'{eepromInfo["cuvp_delay"]/100:7.3f}')
-                self.jbd_eeprom_v20.set_label(f'{eepromInfo["covp_delay"]/100:7.3f}')
-                self.jbd_eeprom_v21.set_label(f'{eepromInfo["puvp_delay"]/100:7.3f}')
-                self.jbd_eeprom_v22.set_label(f'{eepromInfo["povp_delay"]/100:7.3f}')
-                self.jbd_eeprom_v23.set_label(f'{eepromInfo["chgut_delay"]/100:7.3f}')
-                self.jbd_eeprom_v24.set_label(f'{eepromInfo["chgot_delay"]/100:7.3f}')
-                self.jbd_eeprom_v25.set_label(f'{eepromInfo["dsgut_delay"]/100:7.3f}')
-                self.jbd_eeprom_v26.set_label(f'{eepromInfo["dsgot_delay"]/100:7.3f}')
-                self.jbd_eeprom_v27.set_label(f'{eepromInfo["chgoc_delay"]/100:7.3f}')
-                self.jbd_eeprom_v28.set_label(f'{eepromInfo["chgoc_rel"]/100:7.3f}')
-                self.jbd_eeprom_v29.set_label(f'{eepromInfo["dsgoc_delay"]/100:7.3f}')
-                self.jbd_eeprom_v30.set_label(f'{eepromInfo["dsgoc_rel"]/100:7.3f}')
-                self.jbd_eeprom_v31.set_label(f'{eepromInfo["covp_high"]/100:7.3f}')
-                self.jbd_eeprom_v32.set_label(f'{eepromInfo["cuvp_high"]/100:7.3f}')
-
-                self.jbd_eeprom_v33.set_label(f'{eepromInfo["sc"]}')
-                self.jbd_eeprom_v34.set_label(f'{eepromInfo["sc_delay"]}')
-                self.jbd_eeprom_v35.set_label(f'{eepromInfo["dsgoc2"]}')
-                self.jbd_eeprom_v36.set_label(f'{eepromInfo["dsgoc2_delay"]}')
-                self.jbd_eeprom_v37.set_label(f'{eepromInfo["sc_dsgoc_x2"]}')
-                self.jbd_eeprom_v38.set_label(f'{eepromInfo["cuvp_high_delay"]}')
-                self.jbd_eeprom_v39.set_label(f'{eepromInfo["covp_high_delay"]}')
-                self.jbd_eeprom_v40.set_label(f'{eepromInfo["sc_rel"]}')
-                self.jbd_eeprom_v41.set_label(f'{eepromInfo["switch"]}')
-                self.jbd_eeprom_v42.set_label(f'{eepromInfo["scrl"]}')
-
-                # print("DEBUGGING\n") #!@#
-                # print(str(eepromInfo["scrl"]))
-                # print(str(eepromInfo["balance_en"]))
-                # print(str(eepromInfo["chg_balance_en"]))
-                # print(str(eepromInfo["led_en"]))
-
-                self.jbd_eeprom_v43.set_label(f'{eepromInfo["balance_en"]}')
-                self.jbd_eeprom_v44.set_label(f'{eepromInfo["chg_balance_en"]}')
-                self.jbd_eeprom_v45.set_label(f'{eepromInfo["led_en"]}')
-                self.jbd_eeprom_v46.set_label(f'{eepromInfo["led_num"]}')
-                self.jbd_eeprom_v47.set_label(f'{eepromInfo["ntc1"]}')
-                self.jbd_eeprom_v48.set_label(f'{eepromInfo["ntc2"]}')
-                self.jbd_eeprom_v49.set_label(f'{eepromInfo["ntc3"]}')
-                self.jbd_eeprom_v50.set_label(f'{eepromInfo["ntc4"]}')
-                self.jbd_eeprom_v51.set_label(f'{eepromInfo["ntc5"]}')
-                self.jbd_eeprom_v52.set_label(f'{eepromInfo["ntc6"]}')
-                self.jbd_eeprom_v53.set_label(f'{eepromInfo["ntc7"]}')
-                self.jbd_eeprom_v54.set_label(f'{eepromInfo["ntc8"]}')
-                self.jbd_eeprom_v55.set_label(f'{eepromInfo["bal_start"]}')
-                self.jbd_eeprom_v56.set_label(f'{eepromInfo["bal_window"]}')
-                self.jbd_eeprom_v57.set_label(f'{eepromInfo["shunt_res"]}')
-                self.jbd_eeprom_v58.set_label(f'{eepromInfo["cell_cnt"]}')
-                self.jbd_eeprom_v59.set_label(f'{eepromInfo["cycle_cnt"]}')
-                self.jbd_eeprom_v60.set_label(f'{eepromInfo["serial_num"]}')
-                self.jbd_eeprom_v61.set_label(f'{eepromInfo["mfg_name"]}')
-                self.jbd_eeprom_v62.set_label(f'{eepromInfo["device_name"]}')
-
-                self.jbd_eeprom_v63.set_label(f'{eepromInfo["barcode"]}')
-                self.jbd_eeprom_v64.set_label(f'{eepromInfo["year"]}')
-                self.jbd_eeprom_v65.set_label(f'{eepromInfo["month"]}')
-                self.jbd_eeprom_v66.set_label(f'{eepromInfo["day"]}')
-                self.jbd_eeprom_v67.set_label(f'{eepromInfo["design_cap"]}')
-                self.jbd_eeprom_v68.set_label(f'{eepromInfo["cycle_cap"]}')
-                self.jbd_eeprom_v69.set_label(f'{eepromInfo["dsg_rate"]}')
-                self.jbd_eeprom_v70.set_label(f'{eepromInfo["cap_100"]}')
-                self.jbd_eeprom_v71.set_label(f'{eepromInfo["cap_80"]}')
-                self.jbd_eeprom_v72.set_label(f'{eepromInfo["cap_60"]}')
-                self.jbd_eeprom_v73.set_label(f'{eepromInfo["cap_40"]}')
-                self.jbd_eeprom_v74.set_label(f'{eepromInfo["cap_20"]}')
-                self.jbd_eeprom_v75.set_label(f'{eepromInfo["cap_0"]}')
-                self.jbd_eeprom_v76.set_label(f'{eepromInfo["fet_ctrl"]}')
-                self.jbd_eeprom_v77.set_label(f'{eepromInfo["led_timer"]}')
-                self.jbd_eeprom_v78.set_label(f'{eepromInfo["sc_err_cnt"]}')
-                self.jbd_eeprom_v79.set_label(f'{eepromInfo["chgoc_err_cnt"]}')
-                self.jbd_eeprom_v80.set_label(f'{eepromInfo["dsgoc_err_cnt"]}')
-                self.jbd_eeprom_v81.set_label(f'{eepromInfo["covp_err_cnt"]}')
-                self.jbd_eeprom_v82.set_label(f'{eepromInfo["cuvp_err_cnt"]}')
-                self.jbd_eeprom_v83.set_label(f'{eepromInfo["chgot_err_cnt"]}')
-                self.jbd_eeprom_v84.set_label(f'{eepromInfo["chgut_err_cnt"]}')
-                self.jbd_eeprom_v85.set_label(f'{eepromInfo["dsgot_err_cnt"]}')
-                self.jbd_eeprom_v86.set_label(f'{eepromInfo["dsgut_err_cnt"]}')
-                self.jbd_eeprom_v87.set_label(f'{eepromInfo["povp_err_cnt"]}')
-                self.jbd_eeprom_v88.set_label(f'{eepromInfo["puvp_err_cnt"]}')
-
-            except Exception as e:
-                print(e)
-
-
-
-        # print("\n\nSaving EEPROM to file...")
-        # self.j.saveEepromFile("myNewEEpromfile.dat", eepromInfo)
+            self.jbd_eeprom_info()
+
+    # pack 2 values and JBD Battery Tab labels from a JBD basic info read (bmstools BasicInfoReg)
+    def jbd_basic_info(self, basicInfo):
+        #print("\n\nreading Basic Info:")  # ======================================================================
+        # print(json.dumps(basicInfo, indent = 2))
+
+        # if False:
+        #     for name, value in basicInfo.items():
+        #         try:
+        #             match name:
+        #                 case 'cur_cap':
+        #                     print(name, f'{value:7.3f}')
+        #                 case 'full_cap':
+        #                     print(name, f'{value:7.3f}')
+        #                 case 'bal16' | 'bal17' | 'bal18' | 'bal19' | 'bal20' | 'bal21' | 'bal22' | 'bal23' | 'bal24' | 'bal25' | 'bal26' | 'bal27' | 'bal28' | 'bal29' | 'bal30' | 'bal31':
+        #                     pass  # print("skipping " + name)
+        #                 case 'ntc3' | 'ntc4' | 'ntc5' | 'ntc6' | 'ntc7':
+        #                     pass  # print("skipping " + name)
+        #                 case other:
+        #                     print(name, value)
+        #         except Exception as e:
+        #             print(e)
+        # else:
+        #get variables for SOC bar graph, etc..
+        self.dat.update(pack2_volts=basicInfo["pack_mv"] / 1000,
+                        pack2_amps=basicInfo["pack_ma"] / 1000,
+                        pack2_soc=basicInfo["cur_cap"] / 1000,
+                        pack2_full_cap=basicInfo["full_cap"] / 1000,
+                        jbd_bal=tuple(basicInfo['bal' + str(i)] for i in range(0, 16)))
+
+        # load lables on JBD Battery Tab
+        self.jbd_basicInfo_v1.set_label(f'{basicInfo["pack_mv"]/1000:7.3f}')
+        self.jbd_basicInfo_v2.set_label(f'{basicInfo["pack_ma"]/1000:7.3f}')
+        self.jbd_basicInfo_v3.set_label(f'{basicInfo["cur_cap"]/1000:7.3f}')
+        self.jbd_basicInfo_v4.set_label(f'{basicInfo["full_cap"]/1000:7.3f}')
+        self.jbd_basicInfo_v5.set_label('{x}'.format(x=basicInfo['cycle_cnt']))
+        self.jbd_basicInfo_v6.set_label('{x}'.format(x=basicInfo['year']))
+        self.jbd_basicInfo_v7.set_label('{x}'.format(x=basicInfo['month']))
+        self.jbd_basicInfo_v8.set_label('{x}'.format(x=basicInfo['day']))
+
+        for i in range(0,15):
+            self.jbd_basicInfo_v9.set_label('{x}'.format(x=basicInfo['bal0']))
+            self.jbd_basicInfo_v10.set_label('{x}'.format(x=basicInfo['bal1']))
+            self.jbd_basicInfo_v11.set_label('{x}'.format(x=basicInfo['bal2']))
+            self.jbd_basicInfo_v12.set_label('{x}'.format(x=basicInfo['bal3']))
+            self.jbd_basicInfo_v13.set_label('{x}'.format(x=basicInfo['bal4']))
+            self.jbd_basicInfo_v14.set_label('{x}'.format(x=basicInfo['bal5']))
+            self.jbd_basicInfo_v15.set_label('{x}'.format(x=basicInfo['bal6']))
+            self.jbd_basicInfo_v16.set_label('{x}'.format(x=basicInfo['bal7']))
+            self.jbd_basicInfo_v17.set_label('{x}'.format(x=basicInfo['bal8']))
+            self.jbd_basicInfo_v18.set_label('{x}'.format(x=basicInfo['bal9']))
+            self.jbd_basicInfo_v19.set_label('{x}'.format(x=basicInfo['bal10']))
+            self.jbd_basicInfo_v20.set_label('{x}'.format(x=basicInfo['bal11']))
+            self.jbd_basicInfo_v21.set_label('{x}'.format(x=basicInfo['bal12']))
+            self.jbd_basicInfo_v22.set_label('{x}'.format(x=basicInfo['bal13']))
+            self.jbd_basicInfo_v23.set_label('{x}'.format(x=basicInfo['bal14']))
+            self.jbd_basicInfo_v24.set_label('{x}'.format(x=basicInfo['bal15']))
+
+    # JBD cell voltages, for the cell graph and the JBD Battery Tab
+    def jbd_cell_info(self, cellInfo):
+        #print("\n\nreading Cell Info:")  # ======================================================================
+        # print(json.dumps(cellInfo, indent = 2))
+        # if False:
+        #     for name, value in cellInfo.items():
+        #         try:
+        #             value = value / 1000
+        #             print(name, f'{value:7.3f}')
+        #         except Exception as e:
+        #             print(e)
+        # else:
+        cell_mv = tuple(cellInfo["cell"+str(i)+"_mv"] / 1000 for i in range(0, 16)) # save these values for the cell graph
+        self.dat.update(jbd_cell_mv=cell_mv)
+
+        self.jbd_cell_volts_v0.set_label(f'{cellInfo["cell0_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v1.set_label(f'{cellInfo["cell1_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v2.set_label(f'{cellInfo["cell2_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v3.set_label(f'{cellInfo["cell3_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v4.set_label(f'{cellInfo["cell4_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v5.set_label(f'{cellInfo["cell5_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v6.set_label(f'{cellInfo["cell6_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v7.set_label(f'{cellInfo["cell7_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v8.set_label(f'{cellInfo["cell8_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v9.set_label(f'{cellInfo["cell9_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v10.set_label(f'{cellInfo["cell10_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v11.set_label(f'{cellInfo["cell11_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v12.set_label(f'{cellInfo["cell12_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v13.set_label(f'{cellInfo["cell13_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v14.set_label(f'{cellInfo["cell14_mv"]/1000:7.3f}')
+        self.jbd_cell_volts_v15.set_label(f'{cellInfo["cell15_mv"]/1000:7.3f}')
+
+
+        # print("\n\nDevice Info:")  # ======================================================================
+        # deviceInfo = self.j.readDeviceInfo()
+        # # print(json.dumps(deviceInfo, indent = 2))
         #
-        # print("\n\nLoading EEPROM from file...")
-        # eepromDat = self.j.loadEepromFile("myEEpromfile.dat")
-        #
-        # for name, value in eepromDat.items():
+        # for name, value in deviceInfo.items():
         #     try:
         #         match name:
         #             case 'cur_cap':
@@ -1756,13 +1756,139 @@ class App:
         #
         #     except Exception as e:
         #         print(e)
-        #
-        # print("\n\nWriting EEPROM...")
-        #
-        # try:
-        #     self.j.writeEeprom(eepromDat)
-        # except Exception as e:
-        #     print(e)
+
+    # reads the JBD EEPROM settings (a blocking bmstools transaction) and shows them on the JBD Battery Tab
+    def jbd_eeprom_info(self):
+        #print("\n\nreading EEPROM Info:")  # ======================================================================
+        eepromInfo = self.j.readEeprom()
+        #for name, value in eepromInfo.items():
+        try:
+            self.jbd_eeprom_v1.set_label(f'{eepromInfo["covp"]/1000:7.3f}')
+            self.jbd_eeprom_v2.set_label(f'{eepromInfo["covp_rel"]/100:7.3f}')
+            self.jbd_eeprom_v3.set_label(f'{eepromInfo["cuvp"]/1000:7.3f}')
+            self.jbd_eeprom_v4.set_label(f'{eepromInfo["cuvp_rel"]/1000:7.3f}')
+            self.jbd_eeprom_v5.set_label(f'{eepromInfo["povp"]/100:7.3f}')
+            self.jbd_eeprom_v6.set_label(f'{eepromInfo["povp_rel"]/100:7.3f}')
+            self.jbd_eeprom_v7.set_label(f'{eepromInfo["puvp"]/100:7.3f}')
+            self.jbd_eeprom_v8.set_label(f'{eepromInfo["puvp_rel"]/100:7.3f}')
+            self.jbd_eeprom_v9.set_label(f'{eepromInfo["chgot"]/100:7.3f}')
+            self.jbd_eeprom_v10.set_label(f'{eepromInfo["chgot_rel"]/100:7.3f}')
+            self.jbd_eeprom_v11.set_label(f'{eepromInfo["chgut"]/100:7.3f}')
+            self.jbd_eeprom_v12.set_label(f'{eepromInfo["chgut_rel"]/100:7.3f}')
+            self.jbd_eeprom_v13.set_label(f'{eepromInfo["dsgot"]/100:7.3f}')
+            self.jbd_eeprom_v14.set_label(f'{eepromInfo["dsgot_rel"]/100:7.3f}')
+            self.jbd_eeprom_v15.set_label(f'{eepromInfo["dsgut"]/100:7.3f}')
+            self.jbd_eeprom_v16.set_label(f'{eepromInfo["dsgut_rel"]/100:7.3f}')
+            self.jbd_eeprom_v17.set_label(f'{eepromInfo["chgoc"]/100:7.3f}')
+            self.jbd_eeprom_v18.set_label(f'{eepromInfo["dsgoc"]/100:7.3f}')
+            self.jbd_eeprom_v19.set_label(f'{eepromInfo["cuvp_delay"]/100:7.3f}')
+            self.jbd_eeprom_v20.set_label(f'{eepromInfo["covp_delay"]/100:7.3f}')
+            self.jbd_eeprom_v21.set_label(f'{eepromInfo["puvp_delay"]/100:7.3f}')
+            self.jbd_eeprom_v22.set_label(f'{eepromInfo["povp_delay"]/100:7.3f}')
+            self.jbd_eeprom_v23.set_label(f'{eepromInfo["chgut_delay"]/100:7.3f}')
+            self.jbd_eeprom_v24.set_label(f'{eepromInfo["chgot_delay"]/100:7.3f}')
+            self.jbd_eeprom_v25.set_label(f'{eepromInfo["dsgut_delay"]/100:7.3f}')
+            self.jbd_eeprom_v26.set_label(f'{eepromInfo["dsgot_delay"]/100:7.3f}')
+            self.jbd_eeprom_v27.set_label(f'{eepromInfo["chgoc_delay"]/100:7.3f}')
+            self.jbd_eeprom_v28.set_label(f'{eepromInfo["chgoc_rel"]/100:7.3f}')
+            self.jbd_eeprom_v29.set_label(f'{eepromInfo["dsgoc_delay"]/100:7.3f}')
+            self.jbd_eeprom_v30.set_label(f'{eepromInfo["dsgoc_rel"]/100:7.3f}')
+            self.jbd_eeprom_v31.set_label(f'{eepromInfo["covp_high"]/100:7.3f}')
+            self.jbd_eeprom_v32.set_label(f'{eepromInfo["cuvp_high"]/100:7.3f}')
+
+            self.jbd_eeprom_v33.set_label(f'{eepromInfo["sc"]}')
+            self.jbd_eeprom_v34.set_label(f'{eepromInfo["sc_delay"]}')
+            self.jbd_eeprom_v35.set_label(f'{eepromInfo["dsgoc2"]}')
+            self.jbd_eeprom_v36.set_label(f'{eepromInfo["dsgoc2_delay"]}')
+            self.jbd_eeprom_v37.set_label(f'{eepromInfo["sc_dsgoc_x2"]}')
+            self.jbd_eeprom_v38.set_label(f'{eepromInfo["cuvp_high_delay"]}')
+            self.jbd_eeprom_v39.set_label(f'{eepromInfo["covp_high_delay"]}')
+            self.jbd_eeprom_v40.set_label(f'{eepromInfo["sc_rel"]}')
+            self.jbd_eeprom_v41.set_label(f'{eepromInfo["switch"]}')
+            self.jbd_eeprom_v42.set_label(f'{eepromInfo["scrl"]}')
+
+            # print("DEBUGGING\n") #!@#
+            # print(str(eepromInfo["scrl"]))
+            # print(str(eepromInfo["balance_en"]))
+            # print(str(eepromInfo["chg_balance_en"]))
+            # print(str(eepromInfo["led_en"]))
+
+            self.jbd_eeprom_v43.set_label(f'{eepromInfo["balance_en"]}')
+            self.jbd_eeprom_v44.set_label(f'{eepromInfo["chg_balance_en"]}')
+            self.jbd_eeprom_v45.set_label(f'{eepromInfo["led_en"]}')
+            self.jbd_eeprom_v46.set_label(f'{eepromInfo["led_num"]}')
+            self.jbd_eeprom_v47.set_label(f'{eepromInfo["ntc1"]}')
+            self.jbd_eeprom_v48.set_label(f'{eepromInfo["ntc2"]}')
+            self.jbd_eeprom_v49.set_label(f'{eepromInfo["ntc3"]}')
+            self.jbd_eeprom_v50.set_label(f'{eepromInfo["ntc4"]}')
+            self.jbd_eeprom_v51.set_label(f'{eepromInfo["ntc5"]}')
+            self.jbd_eeprom_v52.set_label(f'{eepromInfo["ntc6"]}')
+            self.jbd_eeprom_v53.set_label(f'{eepromInfo["ntc7"]}')
+            self.jbd_eeprom_v54.set_label(f'{eepromInfo["ntc8"]}')
+            self.jbd_eeprom_v55.set_label(f'{eepromInfo["bal_start"]}')
+            self.jbd_eeprom_v56.set_label(f'{eepromInfo["bal_window"]}')
+            self.jbd_eeprom_v57.set_label(f'{eepromInfo["shunt_res"]}')
+            self.jbd_eeprom_v58.set_label(f'{eepromInfo["cell_cnt"]}')
+            self.jbd_eeprom_v59.set_label(f'{eepromInfo["cycle_cnt"]}')
+            self.jbd_eeprom_v60.set_label(f'{eepromInfo["serial_num"]}')
+            self.jbd_eeprom_v61.set_label(f'{eepromInfo["mfg_name"]}')
+            self.jbd_eeprom_v62.set_label(f'{eepromInfo["device_name"]}')
+
+            self.jbd_eeprom_v63.set_label(f'{eepromInfo["barcode"]}')
+            self.jbd_eeprom_v64.set_label(f'{eepromInfo["year"]}')
+            self.jbd_eeprom_v65.set_label(f'{eepromInfo["month"]}')
+            self.jbd_eeprom_v66.set_label(f'{eepromInfo["day"]}')
+            self.jbd_eeprom_v67.set_label(f'{eepromInfo["design_cap"]}')
+            self.jbd_eeprom_v68.set_label(f'{eepromInfo["cycle_cap"]}')
+            self.jbd_eeprom_v69.set_label(f'{eepromInfo["dsg_rate"]}')
+            self.jbd_eeprom_v70.set_label(f'{eepromInfo["cap_100"]}')
+            self.jbd_eeprom_v71.set_label(f'{eepromInfo["cap_80"]}')
+            self.jbd_eeprom_v72.set_label(f'{eepromInfo["cap_60"]}')
+            self.jbd_eeprom_v73.set_label(f'{eepromInfo["cap_40"]}')
+            self.jbd_eeprom_v74.set_label(f'{eepromInfo["cap_20"]}')
+            self.jbd_eeprom_v75.set_label(f'{eepromInfo["cap_0"]}')
+            self.jbd_eeprom_v76.set_label(f'{eepromInfo["fet_ctrl"]}')
+            self.jbd_eeprom_v77.set_label(f'{eepromInfo["led_timer"]}')
+            self.jbd_eeprom_v78.set_label(f'{eepromInfo["sc_err_cnt"]}')
+            self.jbd_eeprom_v79.set_label(f'{eepromInfo["chgoc_err_cnt"]}')
+            self.jbd_eeprom_v80.set_label(f'{eepromInfo["dsgoc_err_cnt"]}')
+            self.jbd_eeprom_v81.set_label(f'{eepromInfo["covp_err_cnt"]}')
+            self.jbd_eeprom_v82.set_label(f'{eepromInfo["cuvp_err_cnt"]}')
+            self.jbd_eeprom_v83.set_label(f'{eepromInfo["chgot_err_cnt"]}')
+            self.jbd_eeprom_v84.set_label(f'{eepromInfo["chgut_err_cnt"]}')
+            self.jbd_eeprom_v85.set_label(f'{eepromInfo["dsgot_err_cnt"]}')
+            self.jbd_eeprom_v86.set_label(f'{eepromInfo["dsgut_err_cnt"]}')
+            self.jbd_eeprom_v87.set_label(f'{eepromInfo["povp_err_cnt"]}')
+            self.jbd_eeprom_v88.set_label(f'{eepromInfo["puvp_err_cnt"]}')
+
+        except Exception as e:
+            print(e)
+
+
+
+    # print("\n\nSaving EEPROM to file...")
+    # self.j.saveEepromFile("myNewEEpromfile.dat", eepromInfo)
+    #
+    # print("\n\nLoading EEPROM from file...")
+    # eepromDat = self.j.loadEepromFile("myEEpromfile.dat")
+    #
+    # for name, value in eepromDat.items():
+    #     try:
+    #         match name:
+    #             case 'cur_cap':
+    #                 print(name, f'{value:7.3f}')
+    #             case other:
+    #                 print(name, value)
+    #
+    #     except Exception as e:
+    #         print(e)
+    #
+    # print("\n\nWriting EEPROM...")
+    #
+    # try:
+    #     self.j.writeEeprom(eepromDat)
+    # except Exception as e:
+    #     print(e)
 
     # ---------------------------------------------------------------------------------------------------------------
     def jbd_bms_monitor_thread(self):
@@ -1926,6 +2052,7 @@ class App:
                             #       because we step at 1hz rather than 10hz when replaying logfiles...
                             self.dat.runTime_100ms = self.dat.runTime_100ms + 9
                             self.update_runTimer()
+                            self.dat.publish(compare=True)  # the replayed fields are not marked on the signal bus
                             if self.dat.OneSecTick == True:  # -------------- One Hz Tasks --------------
                                 self.do_OneSecTasks()
 
@@ -1957,119 +2084,118 @@ class App:
             while True:
                 if self.stop_timing_thread:
                     break
+                self.tenHz_tasks()
+                sleep(0.1)
 
-                try:
-                    if self.lfp_banks > 1:
-                        if self.dat.runTime_100ms % 2 == 0:  # transmit outbound can message(s) every 200 ms
-                            self.can_tx_msgs = True
-
-                    if self.dat.get_dataholder_log() != '': # -------------- process any data_holder logs --------------
-                        dhlog_entry = self.dat.get_dataholder_log()
-                        log(dhlog_entry)
-                        self.dat.clear_dataholder_log()
-
-                    # -- motor power calculations --
-                    self.dat.pwr = self.dat.get_motor_pwr()[0] #power in kW (consumed by the motor from the battery)
-                    # print("self.dat.runTime_100ms={:.d}".format(self.dat.runTime_100ms))
-                    self.dat.pwr_10hz = np.roll(self.dat.pwr_10hz, 1)
-                    self.dat.pwr_10hz[0] = self.dat.pwr
-                    self.dat.rpm_10hz = np.roll(self.dat.rpm_10hz, 1)
-                    self.dat.rpm_10hz[0] = self.dat.rpm
-                    self.dat.spd_10hz = np.roll(self.dat.spd_10hz, 1)
-                    self.dat.spd_10hz[0] = self.dat.spd
-                    # print("self.dat.pwr_10hz[{:d}] = {:0.4f}".format(self.dat.runTime_100ms,self.dat.pwr_10hz[self.dat.runTime_100ms]))
-
-                    self.update_runTimer()
-
-                    if self.dat.OneSecTick == True:  # -------------- One Hz Tasks --------------
-                        self.do_OneSecTasks()
-                    if self.dat.OneMinTick == True:  # -------------- One Min Tasks --------------
-                        self.do_OneMinTasks()
-                    if self.dat.OneHrTick == True:  # -------------- One Hr Tasks --------------
-                        self.do_OneHrTasks()
+    # one 100 ms cycle on live data: 10 Hz histories, run timer, snapshot publish, 1 Hz / 1 min / 1 hr tasks, GUI
+    def tenHz_tasks(self):
+        try:
+            if self.dat.get_dataholder_log() != '': # -------------- process any data_holder logs --------------
+                dhlog_entry = self.dat.get_dataholder_log()
+                log(dhlog_entry)
+                self.dat.clear_dataholder_log()
+
+            # -- motor power calculations --
+            self.dat.pwr = self.dat.get_motor_pwr()[0] #power in kW (consumed by the motor from the battery)
+            # print("self.dat.runTime_100ms={:.d}".format(self.dat.runTime_100ms))
+            # 10 Hz samples, rolled up into the sec / min / hrs histories as they complete (see evms_rollup.py)
+            self.dat.add_history_samples()
+            # print("self.dat.pwr_10hz[{:d}] = {:0.4f}".format(self.dat.runTime_100ms,self.dat.pwr_10hz[self.dat.runTime_100ms]))
+
+            self.update_runTimer()
+            if self.lfp_banks > 1:
+                self.update_lfp_select()
+            self.dat.publish()  # one consistent telemetry snapshot per 100 ms cycle
+            if self.tsdb is not None:
+                self.tsdb.record(self.dat.get_record)  # copied into the running block, written by TsdbWriter
+
+            if self.dat.OneSecTick == True:  # -------------- One Hz Tasks --------------
+                self.do_OneSecTasks()
+            if self.dat.OneMinTick == True:  # -------------- One Min Tasks --------------
+                self.do_OneMinTasks()
+            if self.dat.OneHrTick == True:  # -------------- One Hr Tasks --------------
+                self.do_OneHrTasks()
 
-                except Exception as e:
-                    log("tenHz_timer_thread: " + str(e))
+        except Exception as e:
+            log("tenHz_timer_thread: " + str(e))
 
-                self.updateGUI()
-                sleep(0.1)
+        self.updateGUI()
 
     # ---------------------------------------------------------------------------------------------------------------
     def do_OneSecTasks(self):
         self.dat.OneSecTick = False
         self.dat.UpdateBarHistPlot = True
-        self.dat.pwr_sec = np.roll(self.dat.pwr_sec, 1)
-        self.dat.rpm_sec = np.roll(self.dat.rpm_sec, 1)
-        self.dat.spd_sec = np.roll(self.dat.spd_sec, 1)
         self.dat.calc_ttd(self.dat.rpm, self.dat.pack_amps, self.dat.pack_amp_hrs)
 
         if self.dat.active_notification == True:
             self.notification_icon.show()
             self.notification_textbox.show()
 
-        if self.replaying_logfile == True:
-            self.dat.pwr_sec[0] = self.dat.pwr
-            self.dat.rpm_sec[0] = self.dat.rpm
-            self.dat.spd_sec[0] = self.dat.spd
-        else:
-            self.dat.pwr_sec[0] = np.average(self.dat.pwr_10hz)
-            self.dat.rpm_sec[0] = np.average(self.dat.rpm_10hz)
-            self.dat.spd_sec[0] = np.average(self.dat.spd_10hz)
+        if self.replaying_logfile == True:  # 1 Hz log lines, no 10 Hz samples
+            self.dat.add_history_samples('sec')
 
+        for bus in self.can_buses:
+            bus.update_cell_stats(self.dat)  # published with the next snapshot
+        bus_stats = []
         if self.CANInterface != None:
-            a_dataline = self.dat.get_SysLog_str('a')
-            b_dataline = self.dat.get_SysLog_str('b')
-            c_dataline = self.dat.get_SysLog_str('c')
-
-            try:
-                if self.a_data != a_dataline:
-                    self.a_data = a_dataline
-                    # log(a_dataline)
-                    if self.sys_logging_enabled == True:
-                        self.SysLog.write(a_dataline + '\n')
-                if self.b_data != b_dataline:
-                    self.b_data = b_dataline
-                    # log(b_dataline)
-                    if self.sys_logging_enabled == True:
-                        self.SysLog.write(b_dataline + '\n')
-                if self.c_data != c_dataline:
-                    self.c_data = c_dataline
-                    log(c_dataline)
-                    if self.sys_logging_enabled == True:
-                        self.SysLog.write(c_dataline + '\n')
-                self.SysLog.flush()
-            except Exception as e:
-                log("ERROR: do_OneSecTask: write_SysLogfile - " + str(e))
-
-        global log_window_buffer
-        log_data = log_window_buffer
-        log_window_buffer = ''
-        end_iter = self.text_log_buffer.get_end_iter()
-        self.text_log_buffer.insert(end_iter, log_data)
+            for bus in self.can_buses:
+                bus.stats.tick()
+            bus_stats = [bus.status_text() for bus in self.can_buses]
+        if self.dat.snapshot.cell_stats is not None:
+            bus_stats.append(cells_text(self.dat.snapshot.cell_stats))
+        if bus_stats:
+            self.gui.post(self.lbl_eng_busStats, '\n\n'.join(bus_stats))
+
+        GLib.idle_add(self.log_console.update)
         # position = self.scroll_window.get_vadjustment()
         # position.set_value(position.get_upper())
         # self.scroll_window.set_vadjustment(position)
 
 
 
+    # signal bus subscriber, at most once a second: writes the system log lines (a, b, c) that have a changed column
+    def on_syslog_signals(self, d, changed):
+        if self.CANInterface == None:
+            return
+        try:
+            if self.sys_log_format == 'binary':
+                if self.sys_logging_enabled == True:
+                    self.SysLog.write(d)  # buffered, fsync'ed by BinarySysLog every minute
+                if not changed.isdisjoint(SYSLOG_COLUMNS['c']):
+                    log(self.dat.get_SysLog_str('c'))
+            else:
+                for line in 'abc':
+                    if changed.isdisjoint(SYSLOG_COLUMNS[line]):
+                        continue
+                    dataline = self.dat.get_SysLog_str(line)
+                    if line == 'c':
+                        log(dataline)
+                    if self.sys_logging_enabled == True:
+                        self.SysLog.write(dataline + '\n')
+                self.SysLog.flush()
+        except Exception as e:
+            log("ERROR: on_syslog_signals: write_SysLogfile - " + str(e))
+
+    # signal bus subscriber: CAN Data tab labels of the fields that changed
+    def on_eng_signals(self, d, changed):
+        for name in changed:
+            text = str(getattr(d, name))
+            for label in self.eng_labels[name]:
+                self.gui.post(label, text)
+
     def do_OneMinTasks(self):
 
         try:
             self.dat.OneMinTick = False
             #log("OneMinTick")
-            self.dat.pwr_min = np.roll(self.dat.pwr_min, 1)
-            self.dat.pwr_min[0] = np.average(self.dat.pwr_sec)
-            self.dat.pwr_min_sum = np.sum(self.dat.pwr_sec) #total power used in the last minute (in kW)
-
-            self.dat.rpm_min = np.roll(self.dat.rpm_min, 1)
-            self.dat.rpm_min[0] = np.average(self.dat.rpm_sec)
-
-            self.dat.spd_min = np.roll(self.dat.spd_min, 1)
-            self.dat.spd_min[0] = np.average(self.dat.spd_sec)
+            self.dat.pwr_min_sum = self.dat.histories['pwr'].sum('sec') #total power used in the last minute (in kW)
             #!@#
             self.increment_odemeter()
             self.update_rpm_histogram()
             self.update_pwr_histogram()
+            if self.CANInterface != None:
+                for bus in self.can_buses:  # machine readable per id stats, see evms_can_stats.py
+                    bus.stats.dump(self.can_bus_filename(self.CANStatsName, bus))
 
             # log("pwr_min = {:04.2f}".format(float(self.dat.pwr_sec[self.dat.runTime_sec])) +
             #     ", rpm_min = {:04.0f}".format(float(self.dat.rpm_sec[self.dat.runTime_sec])) +
@@ -2083,14 +2209,6 @@ class App:
         try:
             self.dat.OneHrTick = False
             log("OneHrTick")
-            self.dat.pwr_hrs = np.roll(self.dat.pwr_hrs, 1)
-            self.dat.pwr_hrs[0] = np.average(self.dat.pwr_min)
-
-            self.dat.rpm_hrs = np.roll(self.dat.rpm_hrs, 1)
-            self.dat.rpm_hrs[0] = np.average(self.dat.rpm_min)
-
-            self.dat.spd_hrs = np.roll(self.dat.spd_hrs, 1)
-            self.dat.spd_hrs[0] = np.average(self.dat.spd_min)
             # log("pwr_min = {:04.2f}".format(float(self.dat.pwr_sec[self.dat.runTime_min])) +
             #     ", rpm_min = {:04.0f}".format(float(self.dat.rpm_sec[self.dat.runTime_min])) +
             #     ", spd_min = {:04.1f}".format(float(self.dat.spd_sec[self.dat.runTime_min])))
@@ -2119,151 +2237,70 @@ class App:
             log("update_runTime Error: " + str(e))
 
     # ------------------------------------ updateGUI --------------------------------------------------------------
+    # formatters of the labels updated from the telemetry snapshots (see evms_gui_binding.py)
+    def bind_gui_labels(self):
+        gui = self.gui
+
+        gui.bind(self.lbl_Batt_val, field_format('soc', "{:5.1f}", float))
+        gui.bind(self.lbl_MotTemp_val, field_format('mot_temp', "{:3d}"))
+        gui.bind(self.lbl_CtlrTemp_val, field_format('mot_ctrl_temp', "{:3d}"))
+        gui.bind(self.lbl_PackAmps_val, field_format('pack_amps', "{:d}", abs))
+        gui.bind(self.lbl_PackVolts_val, lambda d: None if d.pack_amps is None else str(d.pack_volts))
+        gui.bind(self.lbl_TTD_val, self.format_ttd)
+
+        gui.bind(self.lbl_DATE_val, field_format('date', "{}"))
+        gui.bind(self.lbl_TIME_val, lambda d: None if d.date is None or d.date == '' else str(d.time))
+        gui.bind(self.lbl_LAT_val, field_format('latitude', " {:11.7f}°", float))
+        gui.bind(self.lbl_LON_val, field_format('longitude', "{:11.7f}°", float))
+        gui.bind(self.lbl_spd_val, field_format('spd', "{:04.2f}", float))
+        gui.bind(self.lbl_rpm_val, lambda d: None if d.rpm is None else "{:04.0f}".format(float(d.rpm)))
+        gui.bind(self.lbl_HDG_val, lambda d: "---.-" if d.hdg is None else "{:04.1f}".format(float(d.hdg)))
+        gui.bind(self.lbl_pwr_val, lambda d: None if d.pwr is None else "{:04.2f}".format(abs(round(d.pwr, 1))))
+
+        ############## System On Time ###########
+        gui.bind(self.lbl_runTime_val, lambda d: self.dat.get_runTime() or None)
+
+        ########### Set FORWARED or REVERSE label on Ring Gauge ######
+        gui.bind(self.lbl_fwd_rev_val, self.format_fwd_rev)
+
+        ############### CAN DATA TAB #################
+        # (the labels showing a field as is are posted by on_eng_signals)
+        gui.bind(self.lbl_eng_latitude, field_format('latitude', " {:11.7f}°", float))
+        gui.bind(self.lbl_eng_longitude, field_format('longitude', "{:11.7f}°", float))
+        gui.bind(self.lbl_eng_sysDatetime, lambda d: str(datetime.utcnow().replace(microsecond=0)))
+        #GLib.idle_add(self.lbl_eng_timezone.set_label, tzname[0] + ' ' + tzname[1])
+        gui.bind(self.lbl_eng_offsetFromUtc, lambda d: str(-timezone / 60 / 60))
+        for labels in self.eng_labels.values():
+            for label in labels:
+                gui.page_of(label)
+        gui.page_of(self.lbl_eng_busStats)
+
+        # versions never change, posted once (applied when the About tab is first shown)
+        gui.post(self.evms_sw_ver, self.sw_ver_evms)
+        gui.post(self.data_sw_ver, self.dat.sw_ver_data)
+        gui.post(self.can_sw_ver, self.evms_can.sw_ver_can)
+        gui.post(self.map_sw_ver, self.mapPlots.sw_ver_maps)
+        #GLib.idle_add(self.net_sw_ver.set_label, self.remote.sw_ver_net) #remote needs to be setup as a class before we can reference this.
+
+    def format_ttd(self, d):
+        if d.ttd is None:
+            return " - "
+        if d.ttd < 0:
+            return None  # don't update the value if the TTD is <0
+        ttd_str = max(self.ttd_min, abs(d.ttd))
+        return str(int(ttd_str)) + ':' + str(round((ttd_str % 1) * 60)).zfill(2)
+
+    def format_fwd_rev(self, d):
+        if d.rpm is None or d.rpm == '':
+            return " "
+        if d.rpm > 2:
+            return "REV" if d.rev_bit == True else "FWD"
+        return None
+
+    # queues the changed labels of the visible tab, one idle callback per cycle
     def updateGUI(self):
-
         try:
-            #if self.dat.update_about_page == True:
-                #self.dat.update_about_page = False
-            GLib.idle_add(self.evms_sw_ver.set_label, self.sw_ver_evms)
-            GLib.idle_add(self.data_sw_ver.set_label, self.dat.sw_ver_data)
-            GLib.idle_add(self.can_sw_ver.set_label, self.evms_can.sw_ver_can)
-            GLib.idle_add(self.map_sw_ver.set_label, self.mapPlots.sw_ver_maps)
-            #GLib.idle_add(self.net_sw_ver.set_label, self.remote.sw_ver_net) #remote needs to be setup as a class before we can reference this.
-
-
-            if self.dat.soc is not None and self.dat.soc != '':
-                GLib.idle_add(self.lbl_Batt_val.set_label, "{:5.1f}".format(float(self.dat.soc)))
-            if self.dat.mot_temp is not None and self.dat.mot_temp != '':
-                GLib.idle_add(self.lbl_MotTemp_val.set_label, "{:3d}".format(self.dat.mot_temp))
-            if self.dat.mot_ctrl_temp is not None and self.dat.mot_ctrl_temp != '':
-                GLib.idle_add(self.lbl_CtlrTemp_val.set_label, "{:3d}".format(self.dat.mot_ctrl_temp))
-
-            if self.dat.pack_amps is not None:
-                GLib.idle_add(self.lbl_PackAmps_val.set_label, "{:d}".format(abs(self.dat.pack_amps)))
-                GLib.idle_add(self.lbl_PackVolts_val.set_label, str(self.dat.pack_volts))
-            if self.dat.ttd is not None:
-                if self.dat.ttd < 0:
-                    pass
-                #don't update the value if the TTD is <0
-                    # ttd_str = min(self.ttd_max, abs(self.dat.ttd))
-                    # ttd_str = str(int(ttd_str)) + ':' + str(round((ttd_str % 1) * 60)).zfill(2)
-                    # log("TTD: " + ttd_str)
-                    #GLib.idle_add(self.lbl_TTD_val.set_label, ttd_str)
-                    # GLib.idle_add(self.lbl_TTD.set_label, "TTD")
-                else:
-                    ttd_str = max(self.ttd_min, abs(self.dat.ttd))
-                    ttd_str = str(int(ttd_str)) + ':' + str(round((ttd_str % 1) * 60)).zfill(2)
-                    # log("TTD: " + ttd_str)
-                    GLib.idle_add(self.lbl_TTD_val.set_label, ttd_str)
-                    # GLib.idle_add(self.lbl_TTD.set_label, "TTC")
-            else:
-                # log("N/A")
-                GLib.idle_add(self.lbl_TTD_val.set_label, " - ")
-
-            if self.dat.date is not None and self.dat.date != '':
-                GLib.idle_add(self.lbl_DATE_val.set_label, str(self.dat.date))
-                GLib.idle_add(self.lbl_TIME_val.set_label, str(self.dat.time))
-
-            if self.dat.latitude is not None and self.dat.latitude != '':
-                GLib.idle_add(self.lbl_LAT_val.set_label, " {:11.7f}°".format(float(self.dat.latitude)))
-
-            if self.dat.longitude is not None and self.dat.longitude != '':
-                GLib.idle_add(self.lbl_LON_val.set_label, "{:11.7f}°".format(float(self.dat.longitude)))
-
-            if self.dat.spd is not None and not self.dat.spd == '':
-                GLib.idle_add(self.lbl_spd_val.set_label, "{:04.2f}".format(float(self.dat.spd)))
-
-            if self.dat.rpm is not None:
-                GLib.idle_add(self.lbl_rpm_val.set_label, "{:04.0f}".format(float(self.dat.rpm)))
-
-            if self.dat.hdg is not None:
-                GLib.idle_add(self.lbl_HDG_val.set_label, "{:04.1f}".format(float(self.dat.hdg)))
-            else:
-                GLib.idle_add(self.lbl_HDG_val.set_label, "---.-")
-
-            pwr = self.dat.get_motor_pwr()[0]
-            pwr = round(pwr, 1)
-            if pwr is not None and pwr != '':
-                GLib.idle_add(self.lbl_pwr_val.set_label, "{:04.2f}".format(abs(float(pwr))))
-
-            ############## System On Time ###########
-            if self.dat.get_runTime() is not None and self.dat.get_runTime() != '':
-                GLib.idle_add(self.lbl_runTime_val.set_label, self.dat.get_runTime())
-
-            ########### Set FORWARED or REVERSE label on Ring Gauge ######
-            if self.dat.rpm is not None and self.dat.rpm != '':
-                if self.dat.rpm > 2:
-                    if (self.dat.rev_bit == True):
-                        GLib.idle_add(self.lbl_fwd_rev_val.set_label, "REV")
-                    else:
-                        GLib.idle_add(self.lbl_fwd_rev_val.set_label, "FWD")
-            else:
-                GLib.idle_add(self.lbl_fwd_rev_val.set_label, " ")
-
-            ############### CAN DATA TAB #################
-            GLib.idle_add(self.lbl_eng_rpm.set_label, str(self.dat.mot_rpm))
-            GLib.idle_add(self.lbl_eng_motTemp.set_label, str(self.dat.mot_temp))
-            GLib.idle_add(self.lbl_eng_CtrlTemp.set_label, str(self.dat.mot_ctrl_temp))
-            GLib.idle_add(self.lbl_eng_motAmps.set_label, str(self.dat.mot_amps))
-            GLib.idle_add(self.lbl_eng_motVolts.set_label, str(self.dat.mot_volts))
-            GLib.idle_add(self.lbl_eng_motStatFreq.set_label, str(self.dat.mot_stator_freq))
-            GLib.idle_add(self.lbl_eng_ctrlFault1.set_label, str(self.dat.ctrl_fault_1))
-            GLib.idle_add(self.lbl_eng_ctrlFault2.set_label, str(self.dat.ctrl_fault_2))
-            GLib.idle_add(self.lbl_eng_throttleInput.set_label, str(self.dat.thrtl_inp))
-            GLib.idle_add(self.lbl_eng_brakeInput.set_label, str(self.dat.brake_inp))
-            GLib.idle_add(self.lbl_eng_econBit.set_label, str(self.dat.econ_bit))
-            GLib.idle_add(self.lbl_eng_regenBit.set_label, str(self.dat.regen_bit))
-            GLib.idle_add(self.lbl_eng_revBit.set_label, str(self.dat.rev_bit))
-            GLib.idle_add(self.lbl_eng_brakeLightBit.set_label, str(self.dat.brake_light_bit))
-            GLib.idle_add(self.lbl_eng_packLoCellV.set_label, str(self.dat.pack_lo_cell_v))
-            GLib.idle_add(self.lbl_eng_packHiCellV.set_label, str(self.dat.pack_hi_cell_v))
-            GLib.idle_add(self.lbl_eng_PackAvgCellV.set_label, str(self.dat.pack_avg_cell_v))
-            GLib.idle_add(self.lbl_eng_packMaxCellNum.set_label, str(self.dat.pack_max_cell_num))
-            GLib.idle_add(self.lbl_eng_packPopCells.set_label, str(self.dat.pack_pop_cells))
-            GLib.idle_add(self.lbl_eng_dischRlyEnbl.set_label, str(self.dat.dsch_rly_enbl))
-            GLib.idle_add(self.lbl_eng_chgRlyEnbl.set_label, str(self.dat.chg_rly_enbl))
-            GLib.idle_add(self.lbl_eng_chgSftyEnbl.set_label, str(self.dat.chg_sfty_enbl))
-            GLib.idle_add(self.lbl_eng_mlfctnIndActive.set_label, str(self.dat.mlfctn_ind_active))
-            GLib.idle_add(self.lbl_eng_mltprpsInpSig.set_label, str(self.dat.multi_prps_inp_sig))
-            GLib.idle_add(self.lbl_eng_alwaysOnSigStat.set_label, str(self.dat.alws_on_sig_stat))
-            GLib.idle_add(self.lbl_eng_isRdySigStat.set_label, str(self.dat.is_rdy_sig_stat))
-            GLib.idle_add(self.lbl_eng_charging.set_label, str(self.dat.charging))
-            GLib.idle_add(self.lbl_eng_pack12v.set_label, str(self.dat.pack_12volt))
-            GLib.idle_add(self.lbl_eng_packAmps.set_label, str(self.dat.pack_amps))
-            GLib.idle_add(self.lbl_eng_packVolts.set_label, str(self.dat.pack_volts))
-            GLib.idle_add(self.lbl_eng_packAh.set_label, str(self.dat.pack_amp_hrs))
-            GLib.idle_add(self.lbl_eng_packHiTemp.set_label, str(self.dat.pack_hi_tmp))
-            GLib.idle_add(self.lbl_eng_packLoTemp.set_label, str(self.dat.pack_lo_tmp))
-            GLib.idle_add(self.lbl_eng_packSoc.set_label, str(self.dat.soc))
-            GLib.idle_add(self.lbl_eng_packRes.set_label, str(self.dat.resistance))
-            GLib.idle_add(self.lbl_eng_packHealth.set_label, str(self.dat.pack_hlth))
-            GLib.idle_add(self.lbl_eng_packOpenV.set_label, str(self.dat.pack_open_v))
-            GLib.idle_add(self.lbl_eng_packTotCyc.set_label, str(self.dat.pack_total_cyc))
-            GLib.idle_add(self.lbl_eng_packCcl.set_label, str(self.dat.pack_ccl))
-            GLib.idle_add(self.lbl_eng_packDcl.set_label, str(self.dat.pack_dcl))
-            GLib.idle_add(self.lbl_eng_packMaxCellV.set_label, str(self.dat.pack_max_cell_v))
-            GLib.idle_add(self.lbl_eng_packMinCellV.set_label, str(self.dat.pack_min_cell_v))
-            GLib.idle_add(self.lbl_eng_pidRespMin.set_label, str(self.dat.pid_resp_min))
-            GLib.idle_add(self.lbl_eng_pidRespMax.set_label, str(self.dat.pid_resp_max))
-            GLib.idle_add(self.lbl_eng_pidFaultCnt.set_label, str(self.dat.pid_fault_cnt))
-            GLib.idle_add(self.lbl_eng_pidErr1.set_label, str(self.dat.ctrl_fault_1))
-            GLib.idle_add(self.lbl_eng_pidErr2.set_label, str(self.dat.ctrl_fault_2))
-            GLib.idle_add(self.lbl_eng_gpsTime.set_label, str(self.dat.time))
-            GLib.idle_add(self.lbl_eng_gpsDate.set_label, str(self.dat.date))
-
-            if self.dat.latitude is not None and self.dat.latitude != '':
-                GLib.idle_add(self.lbl_eng_latitude.set_label, str(" {:11.7f}°".format(float(self.dat.latitude))))
-            if self.dat.longitude is not None and self.dat.longitude != '':
-                GLib.idle_add(self.lbl_eng_longitude.set_label, str("{:11.7f}°".format(float(self.dat.longitude))))
-            GLib.idle_add(self.lbl_eng_kts.set_label, str(self.dat.spd))
-            GLib.idle_add(self.lbl_eng_hdg.set_label, str(self.dat.hdg))
-
-            sys_datetime = datetime.utcnow()
-            sys_datetime = sys_datetime - timedelta(microseconds=sys_datetime.microsecond)
-            GLib.idle_add(self.lbl_eng_sysDatetime.set_label, str(sys_datetime))
-            #GLib.idle_add(self.lbl_eng_timezone.set_label, tzname[0] + ' ' + tzname[1])
-            GLib.idle_add(self.lbl_eng_offsetFromUtc.set_label, str(-timezone / 60 / 60))
-
+            self.gui.update(self.dat.snapshot)
         except Exception as e:
             log("updateGUI Error: " + str(e))
 
@@ -2279,22 +2316,25 @@ class App:
         max_y = self.dat.max_y_scale_bar_hist
         if self.bar_history.get_active_text() == 'RPM':
             bar_max = self.max_rpm
-            ctx_bar_hist.set_source_rgb(self.dat.rpm_R, self.dat.rpm_G, self.dat.rpm_B)
+            color = (self.dat.rpm_R, self.dat.rpm_G, self.dat.rpm_B)
         elif self.bar_history.get_active_text() == 'Power':
             bar_max = self.max_pwr
-            ctx_bar_hist.set_source_rgb(self.dat.pwr_R, self.dat.pwr_G, self.dat.pwr_B)
+            color = (self.dat.pwr_R, self.dat.pwr_G, self.dat.pwr_B)
         elif self.bar_history.get_active_text() == 'Speed':
             bar_max = self.max_spd
-            ctx_bar_hist.set_source_rgb(self.dat.spd_R, self.dat.spd_G, self.dat.spd_B)
+            color = (self.dat.spd_R, self.dat.spd_G, self.dat.spd_B)
 
         try:
-            for idx, var_bin in enumerate(graph_var):
-                x0 = self.dat.pwr_graph_x_ofst + self.dat.pwr_graph_width_pix - (idx * self.dat.pwr_bin_width)  - self.dat.pwr_bin_width
-                y0 = max_y - self.dat.y_offset
-                x1 = self.dat.pwr_bin_shade  # shaded part of bin
-                y1 = -1 * abs(int(var_bin / bar_max * max_y))
-                ctx_bar_hist.rectangle(x0, y0, x1, y1)
-                ctx_bar_hist.fill()
+            # bar heights in pixels, bin 0 (newest) on the right; the chart scrolls and draws only new bins
+            heights = np.abs((np.asarray(graph_var) / bar_max * max_y).astype(int))
+            chart = self.bar_charts.get(da_pwr_hist)
+            if chart is None:
+                chart = self.bar_charts[da_pwr_hist] = BarHistoryChart()
+            chart.paint(ctx_bar_hist, da_pwr_hist, (bar_max, max_y), heights,
+                        self.dat.pwr_graph_x_ofst + self.dat.pwr_graph_width_pix - self.dat.pwr_bin_width,
+                        self.dat.pwr_bin_width,
+                        self.dat.pwr_bin_shade,  # shaded part of bin
+                        max_y - self.dat.y_offset, color)
         except Exception as e:
             print("update_power_history Error: " + str(e))
 
@@ -2302,11 +2342,11 @@ class App:
     def on_draw_pwr_hist_sec(self, da_pwr_hist, ctx_bar_hist):
         try:
             if self.bar_history.get_active_text() == 'RPM':
-                graph_var = self.dat.rpm_sec
+                graph_var = self.dat.history('rpm', 'sec')
             elif self.bar_history.get_active_text() == 'Power':
-                graph_var = self.dat.pwr_sec
+                graph_var = self.dat.history('pwr', 'sec')
             elif self.bar_history.get_active_text() == 'Speed':
-                graph_var = self.dat.spd_sec
+                graph_var = self.dat.history('spd', 'sec')
 
             self.draw_bar_hist(da_pwr_hist, ctx_bar_hist, graph_var)
         except Exception as e:
@@ -2315,11 +2355,11 @@ class App:
     def on_draw_pwr_hist_min(self, da_pwr_hist, ctx_bar_hist):
         try:
             if self.bar_history.get_active_text() == 'RPM':
-                graph_var = self.dat.rpm_min
+                graph_var = self.dat.history('rpm', 'min')
             elif self.bar_history.get_active_text() == 'Power':
-                graph_var = self.dat.pwr_min
+                graph_var = self.dat.history('pwr', 'min')
             elif self.bar_history.get_active_text() == 'Speed':
-                graph_var = self.dat.spd_min
+                graph_var = self.dat.history('spd', 'min')
             self.draw_bar_hist(da_pwr_hist, ctx_bar_hist, graph_var)
         except Exception as e:
             log("on_draw_pwr_hist_min ERROR: " + str(e))
@@ -2327,11 +2367,11 @@ class App:
     def on_draw_pwr_hist_hrs(self, da_pwr_hist, ctx_bar_hist):
         try:
             if self.bar_history.get_active_text() == 'RPM':
-                graph_var = self.dat.rpm_hrs
+                graph_var = self.dat.history('rpm', 'hrs')
             elif self.bar_history.get_active_text() == 'Power':
-                graph_var = self.dat.pwr_hrs
+                graph_var = self.dat.history('pwr', 'hrs')
             elif self.bar_history.get_active_text() == 'Speed':
-                graph_var = self.dat.spd_hrs
+                graph_var = self.dat.history('spd', 'hrs')
             self.draw_bar_hist(da_pwr_hist, ctx_bar_hist, graph_var)
         except Exception as e:
             log("on_draw_pwr_hist_hrs ERROR: " + str(e))
@@ -2355,42 +2395,54 @@ class App:
         except Exception as e:
             log("Error - on_draw_gauge_key: " + str(e))
 
+    # --------------------------------------------------------- bar gauge frames -------------------
+    # 0: normal, 1: at or above warn, 2: at or above crit (below for falling_alarm, e.g. the battery SOC)
+    def alarm_level(self, value, warn, crit, falling_alarm=False):
+        if falling_alarm:
+            return 2 if value <= int(crit) else 1 if value <= int(warn) else 0
+        return 2 if value >= int(crit) else 1 if value >= int(warn) else 0
+
+    # static part of a bar gauge: the background, and the frame in frame_color while alarming
+    def draw_bar_frame(self, ctx, bg_width, frame_width, height, frame_color):
+        ctx.set_source_rgb(0.8, .8, .8)  # bar background color
+        ctx.rectangle(0, 0, bg_width, height)
+        ctx.fill()
+        if frame_color is None:
+            return
+        ctx.set_source_rgb(*frame_color)
+        ctx.set_line_width(6)
+        ctx.move_to(0, 0)
+        ctx.line_to(frame_width, 0)
+        ctx.stroke()
+        ctx.move_to(0, height)
+        ctx.line_to(frame_width, height)
+        ctx.stroke()
+        ctx.move_to(0, 0)
+        ctx.line_to(0, height)
+        ctx.stroke()
+        ctx.move_to(frame_width, 0)
+        ctx.line_to(frame_width, height)
+        ctx.stroke()
+
     # --------------------------------------------------------- draw ctrl temp bar -------------------
     def on_draw_mot_ctrl_temp(self, drawAreaCtrlTemp, ctx_ctrlTemp):
+
+        d = self.dat.snapshot
         try:
             ctx_ctrlTemp.set_source_rgb(0.8, .8, .8)  # bar background color
-            ctx_ctrlTemp.set_line_width(50)
             gauge_width = 30
             top_right = 200  # mid-point startup condition until can data available.
             battery_widget_height = 400
 
-            if self.dat.mot_ctrl_temp is not None:
+            if d.mot_ctrl_temp is not None:
                 # log("SOC = " + str(self.data_holder.soc))
-                top_right = battery_widget_height * int(self.dat.mot_ctrl_temp) / self.ctrl_temp_max_scale
-                ctx_ctrlTemp.rectangle(0, 0, gauge_width, battery_widget_height)
-                ctx_ctrlTemp.fill()
-                ctx_ctrlTemp.set_source_rgb(self.dat.tmp_R, self.dat.tmp_B, self.dat.tmp_G)  # bar color
-                if self.dat.mot_ctrl_temp >= int(self.ctrlr_temp_warn_threshold):
-                    ctx_ctrlTemp.set_source_rgb(255, 140, 0)
-                    if self.dat.mot_ctrl_temp >= int(self.ctrlr_temp_crit_threshold):
-                        ctx_ctrlTemp.set_source_rgb(255, 0, 0)
-                    ctx_ctrlTemp.set_line_width(6)  # bar color
-                    ctx_ctrlTemp.move_to(0, 0)
-                    ctx_ctrlTemp.line_to(gauge_width, 0)
-                    ctx_ctrlTemp.stroke()
-                    ctx_ctrlTemp.set_line_width(6)  # bar color
-                    ctx_ctrlTemp.move_to(0, battery_widget_height)
-                    ctx_ctrlTemp.line_to(gauge_width, battery_widget_height)
-                    ctx_ctrlTemp.set_line_width(6)  # bar color
-                    ctx_ctrlTemp.stroke()
-                    ctx_ctrlTemp.move_to(0, 0)
-                    ctx_ctrlTemp.line_to(0, battery_widget_height)
-                    ctx_ctrlTemp.stroke()
-                    ctx_ctrlTemp.set_line_width(6)  # bar color
-                    ctx_ctrlTemp.move_to(gauge_width, 0)
-                    ctx_ctrlTemp.line_to(gauge_width, battery_widget_height)
-                    ctx_ctrlTemp.stroke()  # bar color
-                    # ctx_batsoc.fill()
+                top_right = battery_widget_height * int(d.mot_ctrl_temp) / self.ctrl_temp_max_scale
+                level = self.alarm_level(d.mot_ctrl_temp, self.ctrlr_temp_warn_threshold,
+                                         self.ctrlr_temp_crit_threshold)
+                bar_color = ((self.dat.tmp_R, self.dat.tmp_B, self.dat.tmp_G), (255, 140, 0), (255, 0, 0))[level]
+                self.draw_bar_frame(ctx_ctrlTemp, gauge_width, gauge_width,
+                                    battery_widget_height, bar_color if level else None)
+                ctx_ctrlTemp.set_source_rgb(*bar_color)
 
             ctx_ctrlTemp.rectangle(4, battery_widget_height - 4, gauge_width - 8, 4 - top_right)
             ctx_ctrlTemp.fill()
@@ -2398,6 +2450,8 @@ class App:
             log("Exception - on_draw_mot_ctrl_tmp: " + str(e))
 
     def on_draw_jbd_cells(self, drawAreaJbdCells, ctx_jbd_cells):
+
+        d = self.dat.snapshot
         try:
             ctx_jbd_cells.set_source_rgb(0.8, .8, .8)  # bar background color
             ctx_jbd_cells.set_line_width(1)
@@ -2406,16 +2460,16 @@ class App:
             cell_widget_height = 150
 
             # log("SOC = " + str(self.data_holder.soc))
+            # one path per color: balancing cells, the others
+            bars = ([], [])
             for i in range(0, 15):
-                if self.dat.jbd_cell_mv[i] is not None:
-
-                    if self.dat.jbd_bal[i]:
-                        ctx_jbd_cells.set_source_rgb(0, 255, 0)
-                    else:
-                        ctx_jbd_cells.set_source_rgb(0, 200, 200)
-                    bar_height = self.dat.jbd_cell_mv[i]/3.8*cell_widget_height
-                    ctx_jbd_cells.rectangle(int(i*cell_bar_width), cell_widget_height , cell_bar_width_fill, cell_widget_height - int(bar_height))
-                    ctx_jbd_cells.fill()
+                if d.jbd_cell_mv[i] is not None:
+                    bar_height = d.jbd_cell_mv[i]/3.8*cell_widget_height
+                    bars[0 if d.jbd_bal[i] else 1].append((int(i*cell_bar_width), cell_widget_height, cell_bar_width_fill, cell_widget_height - int(bar_height)))
+            for color, rects in zip(((0, 255, 0), (0, 200, 200)), bars):
+                if rects:
+                    ctx_jbd_cells.set_source_rgb(*color)
+                    fill_rectangles(ctx_jbd_cells, rects)
 
         except Exception as e:
             log("Exception - on_draw_jbd_cells: " + str(e))
@@ -2423,40 +2477,21 @@ class App:
     # --------------------------------------------------------- draw motor temp bar -------------------
     def on_draw_mot_temp(self, drawAreaMotTemp, ctx_motTemp):
 
+        d = self.dat.snapshot
         try:
             ctx_motTemp.set_source_rgb(0.8, .8, .8)  # bar background color
-            ctx_motTemp.set_line_width(50)
             gauge_width = 42
             top_right = 200  # mid-point startup condition until can data available.
             battery_widget_height = 400
 
-            if self.dat.mot_temp is not None:
+            if d.mot_temp is not None:
                 # log("SOC = " + str(self.data_holder.soc))
-                top_right = battery_widget_height * int(self.dat.mot_temp) / self.mot_temp_max_scale
-                ctx_motTemp.rectangle(0, 0, 55, battery_widget_height)
-                ctx_motTemp.fill()
-                ctx_motTemp.set_source_rgb(self.dat.tmp_R, self.dat.tmp_B, self.dat.tmp_G)  # bar color
-                if self.dat.mot_temp >= int(self.mot_temp_warn_threshold):
-                    ctx_motTemp.set_source_rgb(255, 140, 0)
-                    if self.dat.mot_temp >= int(self.mot_temp_crit_threshold):
-                        ctx_motTemp.set_source_rgb(255, 0, 0)
-                    ctx_motTemp.set_line_width(6)  # bar color
-                    ctx_motTemp.move_to(0, 0)
-                    ctx_motTemp.line_to(gauge_width, 0)
-                    ctx_motTemp.stroke()
-                    ctx_motTemp.set_line_width(6)  # bar color
-                    ctx_motTemp.move_to(0, battery_widget_height)
-                    ctx_motTemp.line_to(gauge_width, battery_widget_height)
-                    ctx_motTemp.set_line_width(6)  # bar color
-                    ctx_motTemp.stroke()
-                    ctx_motTemp.move_to(0, 0)
-                    ctx_motTemp.line_to(0, battery_widget_height)
-                    ctx_motTemp.stroke()
-                    ctx_motTemp.set_line_width(6)  # bar color
-                    ctx_motTemp.move_to(gauge_width, 0)
-                    ctx_motTemp.line_to(gauge_width, battery_widget_height)
-                    ctx_motTemp.stroke()  # bar color
-                    # ctx_batsoc.fill()
+                top_right = battery_widget_height * int(d.mot_temp) / self.mot_temp_max_scale
+                level = self.alarm_level(d.mot_temp, self.mot_temp_warn_threshold, self.mot_temp_crit_threshold)
+                bar_color = ((self.dat.tmp_R, self.dat.tmp_B, self.dat.tmp_G), (255, 140, 0), (255, 0, 0))[level]
+                self.draw_bar_frame(ctx_motTemp, 55, gauge_width,
+                                    battery_widget_height, bar_color if level else None)
+                ctx_motTemp.set_source_rgb(*bar_color)
 
             ctx_motTemp.rectangle(4, battery_widget_height - 4, 35, 4 - top_right)
             ctx_motTemp.fill()
@@ -2466,19 +2501,19 @@ class App:
     # --------------------------------------------------------- draw battery SOC -------------------
     def on_draw_batt_soc(self, drawAreaBat, ctx_batsoc):
 
+        d = self.dat.snapshot
         try:
 
             ctx_batsoc.set_source_rgb(0.8, .8, .8)  # bar background color
-            ctx_batsoc.set_line_width(50)
             battery_widget_height = 400
             bar_height_1 = 100  # mid-point startup condition until can data available.
             bar_height_2 = 100
 
-            if self.dat.soc is not None:
+            if d.soc is not None:
                 # log("SOC = " + str(self.data_holder.soc))
 
                 pack1_capacity = 10000
-                pack2_capacity = self.dat.pack2_full_cap * 3.55*16 #total energy in watts
+                pack2_capacity = d.pack2_full_cap * 3.55*16 #total energy in watts
                 #print(pack2_capacity)
 
 
@@ -2488,33 +2523,17 @@ class App:
                 # self.dat.soc = 100
                 # self.dat.pack2_soc = 100
 
-                ctx_batsoc.rectangle(0, 0, 112, battery_widget_height)
-                ctx_batsoc.fill()
-                ctx_batsoc.set_source_rgb(self.dat.bat_R, self.dat.bat_G, self.dat.bat_B)
-
-                if self.dat.soc <= int(self.batt_warn_threshold):
-                    ctx_batsoc.set_source_rgb(255, 140, 0)
-                    if self.dat.soc <= int(self.batt_crit_threshold):
-                        ctx_batsoc.set_source_rgb(255, 0, 0)
-                    ctx_batsoc.set_line_width(6)# bar color
-                    ctx_batsoc.move_to(0, 0)
-                    ctx_batsoc.line_to(112, 0)
-                    ctx_batsoc.stroke()
-                    ctx_batsoc.set_line_width(6)  # bar color
-                    ctx_batsoc.move_to(0, battery_widget_height)
-                    ctx_batsoc.line_to(112, battery_widget_height)
-                    ctx_batsoc.set_line_width(6)  # bar color
-                    ctx_batsoc.stroke()
-                    ctx_batsoc.move_to(0, 0)
-                    ctx_batsoc.line_to(0, battery_widget_height)
-                    ctx_batsoc.stroke()
-                    ctx_batsoc.set_line_width(6)  # bar color
-                    ctx_batsoc.move_to(112, 0)
-                    ctx_batsoc.line_to(112, battery_widget_height)
-                    ctx_batsoc.stroke()  # bar color
-                    #ctx_batsoc.fill()
-
-            bar_height_1 = (battery_widget_height-4) * int(self.dat.soc) / 100 * (pack1_capacity / total_bat_capacity)
+                # pack 1 bar color, pack 2 bar color (also the frame color while alarming)
+                level = self.alarm_level(d.soc, self.batt_warn_threshold, self.batt_crit_threshold, falling_alarm=True)
+                bar_colors = (((self.dat.bat_R, self.dat.bat_G, self.dat.bat_B),
+                               (self.dat.bat_R+.2, self.dat.bat_G+.2, self.dat.bat_B-.1)),
+                              ((255, 140, 0), (255, 140, 50)),
+                              ((255, 0, 0), (255, 0, 50)))[level]
+                self.draw_bar_frame(ctx_batsoc, 112, 112, battery_widget_height,
+                                    bar_colors[1] if level else None)
+                ctx_batsoc.set_source_rgb(*bar_colors[0])
+
+            bar_height_1 = (battery_widget_height-4) * int(d.soc) / 100 * (pack1_capacity / total_bat_capacity)
             ctx_batsoc.rectangle(4, battery_widget_height-4, 104, -1*bar_height_1)
             ctx_batsoc.fill()
             # rectanle (x0,y0, x_span, y_span)
@@ -2523,31 +2542,9 @@ class App:
             # ctx_batsoc.rectangle(60,60,10,10)
 
             #update bar color for pack2 fill
-            ctx_batsoc.set_source_rgb(self.dat.bat_R+.2, self.dat.bat_G+.2, self.dat.bat_B-.1)
-
-            if self.dat.soc <= int(self.batt_warn_threshold):
-                ctx_batsoc.set_source_rgb(255, 140, 50)
-                if self.dat.soc <= int(self.batt_crit_threshold):
-                    ctx_batsoc.set_source_rgb(255, 0, 50)
-                ctx_batsoc.set_line_width(6)  # bar color
-                ctx_batsoc.move_to(0, 0)
-                ctx_batsoc.line_to(112, 0)
-                ctx_batsoc.stroke()
-                ctx_batsoc.set_line_width(6)  # bar color
-                ctx_batsoc.move_to(0, battery_widget_height)
-                ctx_batsoc.line_to(112, battery_widget_height)
-                ctx_batsoc.set_line_width(6)  # bar color
-                ctx_batsoc.stroke()
-                ctx_batsoc.move_to(0, 0)
-                ctx_batsoc.line_to(0, battery_widget_height)
-                ctx_batsoc.stroke()
-                ctx_batsoc.set_line_width(6)  # bar color
-                ctx_batsoc.move_to(112, 0)
-                ctx_batsoc.line_to(112, battery_widget_height)
-                ctx_batsoc.stroke()  # bar color
-                # ctx_batsoc.fill()
-
-            bar_height_2 = (battery_widget_height-4-1) * int(self.dat.pack2_soc) / 100 * (pack2_capacity / total_bat_capacity)
+            ctx_batsoc.set_source_rgb(*bar_colors[1])
+
+            bar_height_2 = (battery_widget_height-4-1) * int(d.pack2_soc) / 100 * (pack2_capacity / total_bat_capacity)
             ctx_batsoc.rectangle(4, battery_widget_height-4-1-bar_height_1, 104, -1*bar_height_2)
             ctx_batsoc.fill()
         except Exception as e:
@@ -2556,6 +2553,7 @@ class App:
     # -=======================================================-- draw ring gauge ---==============================----
     def on_draw_ring_gauge(self, da, ctx):
 
+        d = self.dat.snapshot
         radius = 275
         gaugeWidth = 1180 / 4
         line_width = radius / 6
@@ -2567,24 +2565,24 @@ class App:
         pegged = 0.8
 
         try:
-            if self.dat.spd is not None:
-                percent_spd = self.dat.spd / self.max_spd
+            if d.spd is not None:
+                percent_spd = d.spd / self.max_spd
                 spd_end_angle = start_angle + min(0.99, percent_spd) * (2 * pi) * pegged  # max angle at 80% for speed
 
-            if self.dat.rpm is not None:
-                percent_rpm = self.dat.rpm / self.max_rpm
-                if (self.dat.rev_bit == False):
+            if d.rpm is not None:
+                percent_rpm = d.rpm / self.max_rpm
+                if (d.rev_bit == False):
                     rpm_end_angle = start_angle + min(0.99, percent_rpm) * (2 * pi) * pegged
                 else: # THE PROP IS SPINNING IN REVERSE
                     rpm_end_angle = start_angle - min(0.99, percent_rpm) * (2 * pi) * pegged
 
-            if self.dat.pwr is not None:
-                percent_pwr = self.dat.pwr / self.max_pwr
-                if self.dat.pwr < 0:  # we're adding power to the battery
+            if d.pwr is not None:
+                percent_pwr = d.pwr / self.max_pwr
+                if d.pwr < 0:  # we're adding power to the battery
                     pwr_end_angle = start_angle - percent_pwr * (2 * pi) * pegged
                 else:  # we're pulling power from the battery
                     pwr_end_angle = start_angle + percent_pwr * (2 * pi) * pegged
-                if self.dat.spd is not None:
+                if d.spd is not None:
                     # NOTE: min(self.dat.pwr,.1) used for now, to limit eff angle
                     eff_end_angle = spd_end_angle - pwr_end_angle
 
@@ -2630,14 +2628,14 @@ class App:
 
             ########## RING 2 : RPM ##########
 
-            if self.dat.rpm >= 0:
+            if d.rpm >= 0:
                 ctx.set_source_rgb(self.dat.rpm_R, self.dat.rpm_G, self.dat.rpm_B)
             else:
                 ctx.set_source_rgb(255, 0, 0)
 
             ctx.set_line_width(line_width)
             ctx.set_tolerance(0.1)
-            if (self.dat.rev_bit == False):
+            if (d.rev_bit == False):
                 ctx.arc(gaugeWidth,
                         radius,
                         radius * 0.7,
@@ -2654,7 +2652,7 @@ class App:
             ctx.set_source_rgb(1, 1, 1)
             ctx.fill()
 
-            if self.dat.charging == 1:
+            if d.charging == 1:
                 ctx.set_source_rgb(0, self.dat.pwr_G, 0)
                 ctx.set_line_width(line_width)
                 ctx.set_tolerance(0.1)
@@ -2665,7 +2663,7 @@ class App:
                         start_angle)
             ########## RING 3 : POWER ##########
             else:
-                if self.dat.regen_bit == 1:
+                if d.regen_bit == 1:
                     ctx.set_source_rgb(0,1,0)
                 else:
                     ctx.set_source_rgb(self.dat.pwr_R, self.dat.pwr_G, self.dat.pwr_B)
@@ -2705,19 +2703,7 @@ class App:
     # ---------------------------------- Logging  ----------------------------------
 
     def print_can_column_headers(self):
-
-        header_string = str('\n\n*************** Newport Electric Boats, LLC ***************'
-                        + '\nEVMS version ' + self.sw_ver_evms + ')\n\n')
-
-        header_string = header_string + str('CAN bus columns are defined as:\n' +
-                        'A_HEADER,date,time,lat,lon,spd,hdg,rpm,soc,ibat,vbat,motor_tmp,mot_ctrl_temp,' +
-                        'pack_amp_hrs,thrtl_inp,brake_inp,mot_amps,rev,charging,econ_bit,regen_bit' + '\n'
-                        'B_HEADER,pack_status,pack_hlth,pack_cycles,pack_open_v,pack_avg_cell_v,lo_cell_v,hi_cell_v,' +
-                        'pack_lo_tmp,pack_hi_tmp,pack_max_cell_v,pack_min_cell_v,dsch_rly_enbl,chg_rly_enbl,chg_sfty_enbl,' +
-                        'alws_on_sig_stat,is_rdy_sig_stat,pack_12volt,pack_limits,pack_ccl,pack_dcl,pack_max_cell_num,pack_pop_cells' + '\n'
-                        'C_HEADER,pack_alert_status,mlfctn_ind_active,multi_ptps_inp_sig,pid_resp_min,' +
-                        'pid_resp_max,pid_fault_cnt,pid_err_one,pid_err_two \n' )
-        return header_string
+        return csv_column_headers(self.sw_ver_evms)
 
     def init_AppLog(self):
 
@@ -2729,17 +2715,38 @@ class App:
                   '\nDat version: '  + self.dat.sw_ver_data +
                   '\nCan version: '  + self.evms_can.sw_ver_can + '\n\n')
 
-            self.SysLogName = 'logs/' + self.appStartDateString + '_evms_system.log'
-            self.CANLogName = 'logs/' + self.appStartDateString + '_evms_can.log'
+            if self.sys_log_format == 'binary':
+                self.SysLogName = 'logs/' + self.appStartDateString + '_evms_system.bin'
+            else:
+                self.SysLogName = 'logs/' + self.appStartDateString + '_evms_system.log'
+            self.CANRingDir = 'logs/canring'
+            self.CANStatsName = 'logs/evms_can_stats.json'
             self.GPSLogName = 'logs/' + self.appStartDateString + '_evms_gps.log'
             log('SystemLog = ' + str(self.SysLogName))
 
         except Exception as e:
             log("init_AppLog ERROR: " + str(e))
 
+    # long term telemetry store: full rate records for tsdb_raw_days, 1 min / 1 hr aggregates for the life of the
+    # boat, at most tsdb_max_mb on disk
+    def init_tsdb(self):
+        if not self.tsdb_enabled:
+            return
+        try:
+            self.tsdb = Tsdb(self.tsdb_file, raw_days=self.tsdb_raw_days, min_days=self.tsdb_min_days,
+                             max_mb=self.tsdb_max_mb, log=log)
+            log('TSDB = ' + self.tsdb_file)
+        except Exception as e:
+            self.tsdb = None
+            log('init_tsdb ERROR: ' + str(e))
+
     def init_SysLog(self):
         # setup time string with local time, to be used as base of logfile names
         try:
+            if self.sys_log_format == 'binary':
+                self.SysLog = BinarySysLog(self.SysLogName, self.sw_ver_evms)
+                return
+
             if os.path.exists(self.SysLogName):
                 add_header = False
             else:
@@ -2800,24 +2807,23 @@ class App:
 
                 # log(msg)
                 if msg.datestamp != None:
-                    self.dat.date = msg.datestamp
                     from_zone = tz.tzutc()
                     to_zone = tz.tzlocal()
                     utc = datetime.strptime(str(msg.timestamp), '%H:%M:%S')
                     utc = utc.replace(tzinfo=from_zone)
                     local_time = utc.astimezone(to_zone)
                     local_time = local_time.time()
-                    self.dat.time = local_time
-                    self.dat.gps_datetime = str(msg.datestamp) + ',' + str(local_time)
-                    self.dat.lat = msg.lat
-                    self.dat.lon = msg.lon
-                    self.dat.spd = msg.spd_over_grnd
-                    self.dat.hdg = msg.true_course
+                    self.dat.update(date=msg.datestamp,
+                                    time=local_time,
+                                    gps_datetime=str(msg.datestamp) + ',' + str(local_time),
+                                    lat=msg.lat,
+                                    lon=msg.lon,
+                                    spd=msg.spd_over_grnd,
+                                    hdg=msg.true_course)
                     self.dat.true_course = msg.true_course
                 # self.dat.magnetic_variation = msg.s
 
-                self.dat.latitude = msg.latitude
-                self.dat.longitude = msg.longitude
+                self.dat.update(latitude=msg.latitude, longitude=msg.longitude)
 
                 # log(self.dat.lat)
                 # log(self.dat.lon)
@@ -2835,37 +2841,7 @@ class App:
 
         if self.gpsPort is not None:
             try:
-                s = self.gpsPort.readline()
-                if self.gps_logging_enabled == True:
-                    if self.GPSLog is not None:
-                        self.GPSLog.write(s) #send raw gps sentence to gps logfile
-
-                if self.gps_from_file == True:
-                    first_chr = s[0]
-                else:
-                    first_chr = chr(s[0])
-                if self.gps_from_file == True:
-                    if s[3:6] != 'RMC':
-                        return
-                    else:
-                        sleep(1)
-                if self.gps_logging_enabled == True:
-                    # log('gps_readline: ' + str(s))
-                    if self.GPSLog != None:
-                        if self.gps_from_file == False:
-                            self.GPSLog.write(s.decode('utf-8'))
-                        elif s != '' and s != '\n' and s[0] == '$':
-                            self.GPSLog.write(s)
-                if s != '' and s != '\n' and first_chr == '$':  # Get data from serial port
-                    s = s.strip()
-                    if self.gps_from_file == False:
-                        s = s.decode('utf-8')
-                    self.parse_gps_message(s)
-                    #log('DEBUG ' + "gps_readline, parsed GPS: " + str(s))
-                else:
-                    if self.gps_from_file == False:
-                        pass
-                        #log("NMEA Parse ERROR : " + s.decode('utf-8'))
+                self.process_gps_line(self.gpsPort.readline())
             except Exception as e:
                 log("Exception gps_readline: " + str(e))
                 gpsPort = None
@@ -2874,12 +2850,92 @@ class App:
             log('GPS connection failed. Rechecking.')
             self.init_gps_serial()
 
+    # one line read from the GPS (bytes from a serial port, str from a file): GPS log and NMEA parsing
+    def process_gps_line(self, s):
+
+        if self.gps_logging_enabled == True:
+            if self.GPSLog is not None:
+                self.GPSLog.write(s) #send raw gps sentence to gps logfile
+
+        if self.gps_from_file == True:
+            first_chr = s[0]
+        else:
+            first_chr = chr(s[0])
+        if self.gps_from_file == True:
+            if s[3:6] != 'RMC':
+                return
+            else:
+                sleep(1)
+        if self.gps_logging_enabled == True:
+            # log('gps_readline: ' + str(s))
+            if self.GPSLog != None:
+                if self.gps_from_file == False:
+                    self.GPSLog.write(s.decode('utf-8'))
+                elif s != '' and s != '\n' and s[0] == '$':
+                    self.GPSLog.write(s)
+        if s != '' and s != '\n' and first_chr == '$':  # Get data from serial port
+            s = s.strip()
+            if self.gps_from_file == False:
+                s = s.decode('utf-8')
+            self.parse_gps_message(s)
+            #log('DEBUG ' + "gps_readline, parsed GPS: " + str(s))
+        else:
+            if self.gps_from_file == False:
+                pass
+                #log("NMEA Parse ERROR : " + s.decode('utf-8'))
+
+    # file name of a per bus file: unchanged with one bus, with the channel name appended with several
+    def can_bus_filename(self, filename, bus):
+        if len(self.can_buses) == 1:
+            return filename
+        root, ext = os.path.splitext(filename)
+        return root + '_' + str(bus.channel) + ext
+
+    # raw capture of every frame on the bus into the CAN ring (see evms_canlog.py), one ring per bus
+    def start_can_capture(self):
+        for bus in self.can_buses:
+            if bus.capture is not None:
+                continue
+            bus.capture = CanRingLog(self.CANRingDir, str(bus.channel),
+                                     prefix=self.can_bus_filename('evms_can', bus),
+                                     segment_bytes=self.can_ring_segment_mb * 1024 * 1024,
+                                     segment_count=self.can_ring_segments, log=log)
+            if bus.interface is not None and not self.can_capture_all:
+                bus.can_set_capture_all(bus.interface, True)
+            log("started CAN capture of " + str(bus.channel) + " to " + self.CANRingDir)
+
+    def stop_can_capture(self):
+        for bus in self.can_buses:
+            capture = bus.capture
+            if capture is None:
+                continue
+            bus.capture = None
+            if bus.interface is not None and not self.can_capture_all:
+                bus.can_set_capture_all(bus.interface, False)
+            capture.close()
+            log("stopped CAN capture of " + str(bus.channel) + ", " + str(capture.frames_written) + " frames written")
+
     def init_can_interface(self):
+        for bus in self.can_buses:
+            self.open_can_bus(bus)
+        self.start_lfp_select()
+        # the primary bus, or the first bus that opened (CANInterface != None: live CAN data)
+        self.CANInterface = next((bus.interface for bus in self.can_buses if bus.interface is not None), None)
 
-        log("Opening CAN interface: " + str(self.can_if_name))
+    def open_can_bus(self, bus):
+
+        log("Opening CAN interface: " + str(bus.channel))
         try:
-            self.CANInterface = can.interface.Bus(channel=self.can_if_name, bustype='socketcan_ctypes', timeout=1)
-            log("CAN interface opened.")
+            bus.stats.capture_all = self.can_capture_all or bus.capture is not None
+            if bus.stats.capture_all:
+                can_filters = None
+                log("CAN capture all enabled, no receive filters installed")
+            else:
+                can_filters = bus.can_filters()
+                log("CAN receive filters: " + ', '.join(str(f["can_id"]) for f in can_filters))
+            bus.interface = can.interface.Bus(channel=bus.channel, bustype='socketcan_ctypes', timeout=1,
+                                              can_filters=can_filters)
+            log("CAN interface " + str(bus.channel) + " opened.")
         except Exception as e:
             log("Exception init_can_interface: " + str(e))
 
@@ -2894,33 +2950,153 @@ class App:
         except Exception as e:
             log("Exception gps_reader_thread: " + str(e))
 
-    def can_processing_thread(self, interface):
+    # LFP bank selection, from the 10 Hz tasks. The frame itself is sent by the cyclic task started in
+    # start_lfp_select (or by the CAN thread when the interface has no cyclic transmit)
+    def update_lfp_select(self):
+        if self.dat.runTime_sec % 5 == 0: # toggle every 5 sec... TODO: update business logic
+            self.select_lfp_bank_2 = True
+            #log("LFP Bank switch: select_lfp_bank_2 = " + str(self.select_lfp_bank_2))
+        else:
+            self.select_lfp_bank_2 = False #if this is zero, select_lfp_bank_1
+            #log("LFP Bank switch: select_lfp_bank_2 = " + str(self.select_lfp_bank_2))
+
+        # if (self.select_lfp_bank_2 != selectbank2):
+        #     self.select_lfp_bank_2 = selectbank2
+        #     log("LFP Bank switch: select_lfp_bank_2 = " + str(self.select_lfp_bank_2))
+        self.evms_can.can_update_select_LFP(self.select_lfp_bank_2)
 
+    def start_lfp_select(self):
+        if self.lfp_banks <= 1 or self.evms_can.interface is None:
+            return
         try:
-            log("starting CAN thread")
-            while True:
-                if self.can_tx_msgs == True:
-                    self.can_tx_msgs = False
-                    if self.dat.runTime_sec % 5 == 0: # toggle every 5 sec... TODO: update business logic
-                        self.select_lfp_bank_2 = True
-                        #log("LFP Bank switch: select_lfp_bank_2 = " + str(self.select_lfp_bank_2))
-                    else:
-                        self.select_lfp_bank_2 = False #if this is zero, select_lfp_bank_1
-                        #log("LFP Bank switch: select_lfp_bank_2 = " + str(self.select_lfp_bank_2))
+            self.evms_can.can_start_select_LFP(self.evms_can.interface, self.select_lfp_bank_2, self.can_tx_period)
+        except Exception as e:
+            log("LFP bank select cyclic transmit not available, sending from the CAN thread: " + str(e))
 
-                    # if (self.select_lfp_bank_2 != selectbank2):
-                    #     self.select_lfp_bank_2 = selectbank2
-                    #     log("LFP Bank switch: select_lfp_bank_2 = " + str(self.select_lfp_bank_2))
+    # LFP bank select from the receive loop, only when the cyclic task could not be started
+    def lfp_select_polled(self, bus):
+        return bus is self.evms_can and self.lfp_banks > 1 and bus.lfp_task is None
 
-                    #send can messages first, if it is time to do so (for consistant outbound message timing)
-                    self.evms_can.can_send_select_LFP(interface, self.select_lfp_bank_2)
+    # receive worker of one bus (the primary bus when bus is None), the primary bus also sends the LFP bank select
+    def can_processing_thread(self, interface, bus=None):
 
-                #read incomming can messages
-                self.evms_can.can_read_data(interface, self.dat)
+        if bus is None:
+            bus = self.evms_can
+        try:
+            log("starting CAN thread " + str(bus.channel))
+            next_tx = time.monotonic()
+            while True:
+                if self.stop_can_thread:
+                    break
+                try:
+                    rx_timeout = 1
+                    if self.lfp_select_polled(bus):
+                        now = time.monotonic()
+                        if now >= next_tx:
+                            #send can messages on their own schedule (for consistant outbound message timing)
+                            bus.can_send_select_LFP(interface, self.select_lfp_bank_2)
+                            next_tx = next_tx + self.can_tx_period
+                            if next_tx < now:  # we stalled for more than a period, don't send a burst to catch up
+                                next_tx = now + self.can_tx_period
+                        rx_timeout = max(0, next_tx - time.monotonic())
+
+                    #read all pending incomming can messages, waiting no longer than the next TX slot
+                    bus.can_read_batch(interface, self.dat, rx_timeout)
+                except Exception as e:
+                    bus.rx_errors += 1
+                    log("Exception can_processing_thread loop " + str(bus.channel) + ": " + str(e))
+                    sleep(0.1)
 
         except Exception as e:
             log("Exception can_processing_thread: " + str(e))
 
+    # -------------------------------asyncio acquisition core (io_core, asyncio) ----------------------------------
+    # replaces gps_reader_thread, can_processing_thread, jbd_bms_monitor_thread and tenHz_timer_thread with one
+    # event loop (see evms_aio.py)
+    def io_core_thread(self):
+
+        log("starting asyncio I/O core")
+        self.aio = IoCore(log)
+        try:
+            for bus in self.can_buses:
+                if bus.interface is not None:
+                    self.aio_start_can(bus)
+            self.aio.every(1.0, self.flush_can_capture, 'CAN capture flush')
+            if self.debug_wo_gps == False:
+                self.aio_start_gps()
+            self.aio.start(self.jbd_poll(), 'JBD BMS')
+            self.aio.every(0.1, self.tenHz_tasks, '10 Hz tasks')
+            self.aio.run()
+        except Exception as e:
+            log("Exception io_core_thread: " + str(e))
+
+    def aio_start_can(self, bus):
+        interface = bus.interface
+        if self.aio.add_reader(interface, lambda: self.aio_read_can(bus)):
+            if self.lfp_select_polled(bus):
+                self.aio.every(self.can_tx_period,
+                               lambda: bus.can_send_select_LFP(interface, self.select_lfp_bank_2), 'LFP select')
+        else:
+            log("CAN bus " + str(bus.channel) + " has no pollable socket, reading it in a thread")
+            self.aio.run_blocking(self.can_processing_thread, interface, bus)
+
+    def aio_read_can(self, bus):
+        try:
+            bus.can_read_batch(bus.interface, self.dat, 0)
+        except Exception as e:
+            bus.rx_errors += 1
+            log("Exception aio_read_can " + str(bus.channel) + ": " + str(e))
+
+    def flush_can_capture(self):
+        for bus in self.can_buses:
+            capture = bus.capture
+            if capture is not None:
+                capture.flush_if_due()
+
+    # GPS on the event loop; without a port the search is retried every 5 s, a GPS log file is read in a thread
+    def aio_start_gps(self):
+        if self.gps_from_file == True:
+            self.aio.run_blocking(self.gps_reader_thread)
+        elif self.gpsPort is not None:
+            reader = SerialLineReader(self.aio, self.gpsPort, self.process_gps_line)
+            if not reader.attached:
+                self.aio.run_blocking(self.gps_reader_thread)
+        else:
+            self.aio.loop.call_later(5, self.aio_retry_gps)
+
+    def aio_retry_gps(self):
+        log('GPS connection failed. Rechecking.')
+        self.init_gps_serial()
+        self.aio_start_gps()
+
+    # jbd_bms_monitor_thread as a coroutine: basic info and cell info are read without blocking, the EEPROM
+    # settings (a multi step bmstools transaction) on the executor
+    async def jbd_poll(self):
+
+        log("starting JBD BMS polling")
+        client = JbdClient(self.aio, self.j)
+        while True:
+            try:
+                if self.jbd_read_state == 2:
+                    client.detach()
+                    await self.aio.run_blocking(self.jbd_eeprom_info)
+                else:
+                    if not client.attached:
+                        client.attach()
+                    if self.jbd_read_state == 0:
+                        info = await client.read_reg(self.j.basicInfoReg)
+                        GLib.idle_add(self.jbd_basic_info, info)
+                    else:
+                        info = await client.read_reg(self.j.cellInfoReg)
+                        GLib.idle_add(self.jbd_cell_info, info)
+            except Exception as e:
+                log("ERROR: jbd_poll: jbd_status - " + str(e))
+            await asyncio.sleep(2)
+            #update the read state for the next read cycle
+            self.jbd_read_state = self.jbd_read_state + 1
+            if self.jbd_read_state > 2:
+                self.jbd_read_state = 0
+
 
 # ---------------------------------------- main ----------------------------------------------
 if __name__ == "__main__":
@@ -29,6 +29,16 @@ elif [[ $1 = "can2" ]]; then
 		printf "starting evms.py can2\n"
 	sudo python3 ./evms.py can2
 
+elif [[ $1 = can*,* ]]; then
+  # several buses at once, e.g. ./evms.sh can0,can1 (one receive worker and decode table per bus)
+  for canif in ${1//,/ }; do
+    printf "setting up ip link on $canif\n"
+	sudo ip link set $canif type can bitrate 250000
+	sudo ip link set up $canif
+  done
+	printf "starting evms.py $1\n"
+	sudo python3 ./evms.py $1 usb
+
 elif [[ $1 = "link" ]]; then
   printf "setting up link for vcan0\n"
   sudo ip link add dev vcan0 type vcan
@@ -49,6 +59,6 @@ elif [[ $1 = "sim" ]]; then
 else
   printf "Usage: ./evms.sh <can-interface> <simulation-file>\n"
   printf "   where, \n"
-  printf "      arg1 can be: can0, can1, can2, link, sim\n"
+  printf "      arg1 can be: can0, can1, can2, a list like can0,can1, link, sim\n"
   printf "      arg2 is the filename if replaying from a previously generated systemLog file\n\n"
 fi
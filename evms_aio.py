@@ -0,0 +1,210 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_aio.py
+#
+#   asyncio acquisition core (cfg: io_core, asyncio). One event loop thread replaces the GPS, CAN, JBD and timer
+#   threads: the SocketCAN socket and the serial ports are watched with loop.add_reader() and read without
+#   blocking when data is ready, the 10 Hz task runs from a drift free timer and the JBD BMS is polled with
+#   request / response coroutines. Nothing in the loop sleeps or busy waits, so the GTK thread (which still gets
+#   its updates through GLib.idle_add) only competes with the loop when there is actual work to do.
+#
+######################################################################################################################
+
+import asyncio
+import threading
+
+sw_ver_aio = '0.1.0'
+
+
+class IoCore:
+    def __init__(self, log):
+        self.log = log
+        self.loop = asyncio.new_event_loop()
+        self.thread = None
+
+    # runs the loop in the calling thread until stop()
+    def run(self):
+        self.thread = threading.current_thread()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_forever()
+        finally:
+            for task in asyncio.all_tasks(self.loop):
+                task.cancel()
+            self.loop.close()
+
+    # may be called from any thread
+    def stop(self):
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+
+    def start(self, coroutine, name):
+        return self.loop.create_task(self.guard(coroutine, name))
+
+    async def guard(self, coroutine, name):
+        try:
+            await coroutine
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log("IoCore: " + name + " stopped: " + str(e))
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # callback() every period seconds, on a fixed schedule (a late call does not shift the following ones, a stall
+    # longer than a period skips the missed calls instead of running them in a burst)
+    def every(self, period, callback, name):
+        return self.start(self.periodic(period, callback, name), name)
+
+    async def periodic(self, period, callback, name):
+        loop = self.loop
+        next_time = loop.time()
+        while True:
+            try:
+                callback()
+            except Exception as e:
+                self.log("IoCore: " + name + ": " + str(e))
+            next_time += period
+            delay = next_time - loop.time()
+            if delay < 0:
+                next_time = loop.time()
+                delay = 0
+            await asyncio.sleep(delay)
+
+    # callback() whenever fileobj (anything with fileno(), e.g. a can bus or a serial port) is readable. Returns
+    # False when fileobj has no pollable file descriptor.
+    def add_reader(self, fileobj, callback):
+        try:
+            fd = fileobj.fileno()
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            return False
+        self.loop.add_reader(fd, callback)
+        return True
+
+    def remove_reader(self, fileobj):
+        try:
+            self.loop.remove_reader(fileobj.fileno())
+        except (AttributeError, NotImplementedError, OSError, ValueError):
+            pass
+
+    # a blocking function on the default executor, for the few calls that have no non-blocking form
+    def run_blocking(self, function, *args):
+        return self.loop.run_in_executor(None, function, *args)
+
+
+class SerialLineReader:
+    # hands every complete line (bytes, with its b'\n', like serial.readline()) read from a pyserial port to
+    # on_line(line), reading only what the port has buffered
+    def __init__(self, core, port, on_line, max_line=4096):
+        self.core = core
+        self.port = port
+        self.on_line = on_line
+        self.max_line = max_line
+        self.buffer = bytearray()
+        port.timeout = 0
+        self.attached = core.add_reader(port, self.on_readable)
+
+    def on_readable(self):
+        try:
+            data = self.port.read(self.port.in_waiting or 1)
+        except Exception as e:
+            self.core.log("SerialLineReader: " + str(e))
+            self.close()
+            return
+        self.buffer += data
+        start = 0
+        while True:
+            end = self.buffer.find(b'\n', start)
+            if end < 0:
+                break
+            line = bytes(self.buffer[start:end + 1])
+            start = end + 1
+            try:
+                self.on_line(line)
+            except Exception as e:
+                self.core.log("SerialLineReader: " + str(e))
+        del self.buffer[:start]
+        if len(self.buffer) > self.max_line:
+            self.buffer.clear()  # no line end in sight, garbage on the port
+
+    def close(self):
+        if self.attached:
+            self.core.remove_reader(self.port)
+            self.attached = False
+
+
+class JbdClient:
+    # non-blocking request / response on the JBD BMS serial port, using the packet layout and the register
+    # decoders of bmstools.jbd: DD reg status len payload[len] checksum(2) 77
+    START = 0xDD
+    END = 0x77
+
+    def __init__(self, core, jbd, timeout=1.0):
+        self.core = core
+        self.jbd = jbd
+        self.timeout = timeout
+        self.buffer = bytearray()
+        self.pending = None
+        self.pending_reg = None
+        self.attached = False
+
+    def attach(self):
+        port = self.jbd.s
+        port.timeout = 0
+        if not port.is_open:
+            port.open()
+        self.attached = self.core.add_reader(port, self.on_readable)
+        return self.attached
+
+    # releases the port, e.g. for a blocking bmstools transaction (which opens and closes it itself)
+    def detach(self):
+        if self.attached:
+            self.core.remove_reader(self.jbd.s)
+            self.attached = False
+        self.jbd.s.close()
+        self.jbd.s.timeout = 0.5
+
+    def on_readable(self):
+        try:
+            self.buffer += self.jbd.s.read(self.jbd.s.in_waiting or 1)
+        except Exception as e:
+            self.core.log("JbdClient: " + str(e))
+            return
+        while True:
+            start = self.buffer.find(self.START)
+            if start < 0:
+                self.buffer.clear()
+                return
+            del self.buffer[:start]
+            if len(self.buffer) < 4:
+                return
+            length = 7 + self.buffer[3]
+            if len(self.buffer) < length:
+                return
+            packet = bytes(self.buffer[:length])
+            if packet[-1] != self.END:
+                del self.buffer[:1]  # not a packet start after all
+                continue
+            del self.buffer[:length]
+            if self.pending is not None and not self.pending.done() and packet[1] == self.pending_reg:
+                self.pending.set_result(packet)
+
+    # sends a read command for register reg, returns the payload of the response
+    async def read(self, reg):
+        self.buffer.clear()
+        self.pending = self.core.loop.create_future()
+        self.pending_reg = reg
+        self.jbd.s.write(self.jbd.readCmd(reg))
+        try:
+            packet = await asyncio.wait_for(self.pending, self.timeout)
+        finally:
+            self.pending = None
+        if packet[2] != 0:
+            raise IOError('JBD register 0x%02X read error %d' % (reg, packet[2]))
+        return packet[4:4 + packet[3]]
+
+    # reads and decodes a bmstools register object (e.g. jbd.basicInfoReg), returns it as a dict
+    async def read_reg(self, reg):
+        reg.unpack(await self.read(reg.adx))
+        return dict(reg)
@@ -0,0 +1,356 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_can_decoder.py
+#
+#   Table driven CAN frame decoder. Every frame layout is declared once (using the same start|length@order sign
+#   (factor, offset) notation as a DBC file) and compiled into a struct.Struct based unpacker, so decoding a frame
+#   is one unpack call plus one assignment per signal. Change detection is done once per frame on the raw payload
+#   bytes; a frame with a new payload marks all of its signals (CanFrame.signal_names) as changed in one set update.
+#
+######################################################################################################################
+
+import struct
+
+LITTLE_ENDIAN = 1   # DBC '@1' (Intel)
+BIG_ENDIAN = 0      # DBC '@0' (Motorola)
+
+# lookup tables used to build the raw payload strings that are stored in the DataHolder (and written to the syslog)
+HEX_STR = [hex(i) + ' ' for i in range(256)]
+BIN_STR = [bin(i) + ' ' for i in range(256)]
+
+
+class CanSignal:
+    #  name        : DataHolder attribute the decoded value is written to
+    #  start_bit   : DBC start bit (lsb for little endian signals, msb for big endian signals)
+    #  length      : signal length in bits
+    #  byte_order  : LITTLE_ENDIAN (@1) or BIG_ENDIAN (@0)
+    #  signed      : DBC '-' (True) or '+' (False)
+    #  factor, offset : physical value = raw * factor + offset
+    #  digits      : optional round() applied to the physical value
+    def __init__(self, name, start_bit, length, byte_order=LITTLE_ENDIAN, signed=False, factor=1, offset=0,
+                 digits=None):
+        self.name = name
+        self.start_bit = start_bit
+        self.length = length
+        self.byte_order = byte_order
+        self.signed = signed
+        self.factor = factor
+        self.offset = offset
+        self.digits = digits
+
+    def __repr__(self):
+        return '%s: %d | %d @ %d %s (%r, %r)' % (self.name, self.start_bit, self.length, self.byte_order,
+                                                '-' if self.signed else '+', self.factor, self.offset)
+
+    # first byte covered by the signal and the bit position of its lsb inside that byte
+    def lsb_position(self):
+        if self.byte_order == LITTLE_ENDIAN:
+            return self.start_bit // 8, self.start_bit % 8
+        return self.start_bit // 8, self.start_bit % 8 - self.length + 1
+
+    # 10**k when the factor is 10**-k and the value is rounded to at least k digits, otherwise None
+    def decimal_divisor(self):
+        if self.digits is None or self.offset != 0:
+            return None
+        for k in range(1, self.digits + 1):
+            if self.factor == 10.0 ** -k:
+                return 10 ** k
+        return None
+
+    # (first byte, byte count) when the signal is a byte aligned 8/16/32/64 bit integer, otherwise None
+    def byte_span(self):
+        if self.length not in (8, 16, 32, 64):
+            return None
+        if self.byte_order == LITTLE_ENDIAN:
+            if self.start_bit % 8 != 0:
+                return None
+        elif self.start_bit % 8 != 7:
+            return None
+        return self.start_bit // 8, self.length // 8
+
+
+class CanFrame:
+    #  arbitration_id : CAN id of the frame
+    #  name           : human readable name, used in log messages
+    #  signals        : list of CanSignal
+    #  raw_attr       : DataHolder attribute that receives the raw payload string (None to skip)
+    #  raw_fmt        : 'hex' or 'bin' formatting of the raw payload string
+    #  log_changes    : log every new payload of this frame (used for error responses)
+    #  dlc            : payload length the layout expects
+    def __init__(self, arbitration_id, name, signals, raw_attr=None, raw_fmt='hex', log_changes=False, dlc=8,
+                 is_extended_id=False):
+        self.arbitration_id = arbitration_id
+        self.name = name
+        self.signals = signals
+        self.raw_attr = raw_attr
+        self.raw_fmt = raw_fmt
+        self.raw_table = BIN_STR if raw_fmt == 'bin' else HEX_STR
+        self.log_changes = log_changes
+        self.dlc = dlc
+        self.is_extended_id = is_extended_id
+        self.unpack = None
+        self.source = ''
+        # every DataHolder attribute the frame writes, added to the changed signals when its payload changes
+        self.signal_names = frozenset([sig.name for sig in signals] + ([raw_attr] if raw_attr is not None else []))
+
+    def raw_str(self, data):
+        return ''.join(map(self.raw_table.__getitem__, data))
+
+    # generated code that writes value to v.<name>
+    @staticmethod
+    def store_lines(name, value):
+        return ['    v.%s = %s' % (name, value)]
+
+    # ----------------------------------------------------------------------------------------------------------
+    # Builds a struct format string covering the whole payload, then generates a small python function that
+    # unpacks it once and writes every signal (with sign, factor, offset and rounding applied), plus the raw
+    # payload string, to the target object. Signals that are not byte aligned are masked out of their byte, or
+    # out of the whole payload when they cross a byte boundary.
+    def compile(self):
+        items = {}      # first byte -> [byte count, signed, byte order]
+        byte_owner = [None] * self.dlc
+        bit_signals = []
+        wide_signals = []
+        multi_byte_order = None
+
+        for sig in self.signals:
+            span = sig.byte_span()
+            if span is not None and span[0] + span[1] <= self.dlc:
+                first, count = span
+                order = sig.byte_order if count > 1 else None
+                if order is not None and multi_byte_order is not None and order != multi_byte_order:
+                    wide_signals.append(sig)
+                    continue
+                owner = byte_owner[first]
+                if owner is not None and items[owner][:2] == [count, sig.signed] and owner == first:
+                    continue    # same bytes already unpacked (e.g. rpm and mot_rpm)
+                if any(byte_owner[b] is not None for b in range(first, first + count)):
+                    wide_signals.append(sig)
+                    continue
+                items[first] = [count, sig.signed, order]
+                for b in range(first, first + count):
+                    byte_owner[b] = first
+                if order is not None:
+                    multi_byte_order = order
+                continue
+
+            first, shift = sig.lsb_position()
+            if 0 <= shift and shift + sig.length <= 8 and first < self.dlc:
+                owner = byte_owner[first]
+                if owner is None:
+                    items[first] = [1, False, None]
+                    byte_owner[first] = first
+                elif not (owner == first and items[first] == [1, False, None]):
+                    wide_signals.append(sig)
+                    continue
+                bit_signals.append(sig)
+            else:
+                wide_signals.append(sig)
+
+        if multi_byte_order == BIG_ENDIAN:
+            fmt = '>'
+        else:
+            fmt = '<'
+        codes = {1: 'b', 2: 'h', 4: 'i', 8: 'q'}
+        names = []
+        b = 0
+        while b < self.dlc:
+            if byte_owner[b] is None:
+                fmt += 'x'
+                b += 1
+                continue
+            count, signed, order = items[b]
+            code = codes[count]
+            fmt += code if signed else code.upper()
+            names.append('r%d' % b)
+            b += count
+        unpacker = struct.Struct(fmt)
+
+        lines = ['def decode(data, v):']
+        if names:
+            lines.append('    %s, = _unpack(data)' % ', '.join(names))
+        if any(sig.byte_order == LITTLE_ENDIAN for sig in wide_signals):
+            lines.append("    wl = int.from_bytes(data[:%d], 'little')" % self.dlc)
+        if any(sig.byte_order == BIG_ENDIAN for sig in wide_signals):
+            lines.append("    wb = int.from_bytes(data[:%d], 'big')" % self.dlc)
+
+        for sig in self.signals:
+            span = sig.byte_span()
+            if sig in wide_signals:
+                mask = (1 << sig.length) - 1
+                if sig.byte_order == LITTLE_ENDIAN:
+                    raw = '((wl >> %d) & %d)' % (sig.start_bit, mask)
+                else:
+                    msb = (self.dlc - 1 - sig.start_bit // 8) * 8 + sig.start_bit % 8
+                    raw = '((wb >> %d) & %d)' % (msb - sig.length + 1, mask)
+                if sig.signed:
+                    sign_bit = 1 << (sig.length - 1)
+                    raw = '((%s ^ %d) - %d)' % (raw, sign_bit, sign_bit)
+            elif sig in bit_signals:
+                first, shift = sig.lsb_position()
+                raw = 'r%d' % first
+                if shift:
+                    raw = '(%s >> %d)' % (raw, shift)
+                if sig.length < 8 - shift:
+                    raw = '(%s & %d)' % (raw, (1 << sig.length) - 1)
+                if sig.signed:
+                    sign_bit = 1 << (sig.length - 1)
+                    raw = '((%s ^ %d) - %d)' % (raw, sign_bit, sign_bit)
+            else:
+                raw = 'r%d' % span[0]
+
+            value = raw
+            divisor = sig.decimal_divisor()
+            if divisor is not None:
+                # round(raw * 0.1, 1) == raw / 10 for integer raw values, and the division is much cheaper
+                value = '%s / %d' % (value, divisor)
+            else:
+                if sig.factor != 1:
+                    value = '%s * %r' % (value, sig.factor)
+                if sig.offset != 0:
+                    value = '%s + %r' % (value, sig.offset)
+                if sig.digits is not None:
+                    value = 'round(%s, %d)' % (value, sig.digits)
+            lines.extend(self.store_lines(sig.name, value))
+        if self.raw_attr is not None:
+            lines.extend(self.store_lines(self.raw_attr, "''.join(map(_raw_str, data))"))
+        if len(lines) == 1:
+            lines.append('    pass')
+
+        self.source = '\n'.join(lines) + '\n'
+        namespace = {'_unpack': unpacker.unpack_from, '_raw_str': self.raw_table.__getitem__}
+        exec(compile(self.source, '<can frame 0x%x %s>' % (self.arbitration_id, self.name), 'exec'), namespace)
+        self.unpack = namespace['decode']
+        return self
+
+
+class CanDecoder:
+    # Registry of compiled frame layouts keyed by arbitration id. decode() only touches the target object
+    # when the payload of a frame differs from the last payload seen for that id, and then adds the names of
+    # the frame's signals to changed (DataHolder.bus.changed, see evms_signal_bus.py).
+    def __init__(self, frames):
+        self.frames = {}
+        self.last_data = {}
+        for frame in frames:
+            self.add_frame(frame)
+
+    def add_frame(self, frame):
+        if frame.unpack is None:
+            frame.compile()
+        self.frames[frame.arbitration_id] = frame
+        self.last_data.pop(frame.arbitration_id, None)
+
+    def arbitration_ids(self):
+        return sorted(self.frames)
+
+    # the CanFrame when data is a new payload for a known id (and is remembered as the last one), None otherwise
+    def changed_frame(self, arbitration_id, data):
+        frame = self.frames.get(arbitration_id)
+        if frame is None:
+            return None
+        if self.last_data.get(arbitration_id) == data:
+            return None
+        if len(data) < frame.dlc:
+            return None
+        self.last_data[arbitration_id] = data
+        return frame
+
+    # returns the CanFrame when the payload changed and was decoded, None otherwise
+    def decode(self, arbitration_id, data, v, changed=None):
+        frame = self.changed_frame(arbitration_id, data)
+        if frame is None:
+            return None
+        frame.unpack(data, v)
+        if changed is not None:
+            changed |= frame.signal_names
+        return frame
+
+
+# ------------------------------------------- EVMS frame layouts -----------------------------------------------------
+#   https://andromedaint.atlassian.net/wiki/spaces/DOC/pages/28737773/CAN+Messaging+Maps
+#   http://socialledge.com/sjsu/index.php/DBC_Format
+
+def evms_frames():
+    return [
+        CanFrame(1537, 'AC1239 STATUS 1', [
+            CanSignal('mot_rpm', 7, 16, BIG_ENDIAN),
+            CanSignal('rpm', 7, 16, BIG_ENDIAN, factor=0.5),                          # prop rpm
+            CanSignal('mot_temp', 16, 8),
+            CanSignal('mot_ctrl_temp', 24, 8, signed=True),
+            CanSignal('mot_amps', 39, 16, BIG_ENDIAN, factor=0.1, digits=1),
+            CanSignal('mot_volts', 55, 16, BIG_ENDIAN, factor=0.1, digits=2),
+        ], raw_attr='ac1239_status_1'),
+
+        CanFrame(1538, 'AC1239 STATUS 2', [
+            CanSignal('mot_stator_freq', 7, 16, BIG_ENDIAN, signed=True),
+            CanSignal('ctrl_fault_1', 16, 8),
+            CanSignal('ctrl_fault_2', 24, 8),
+            CanSignal('thrtl_inp', 32, 8),
+            CanSignal('brake_inp', 40, 8),
+            CanSignal('econ_bit', 52, 1),
+            CanSignal('regen_bit', 51, 1),
+            CanSignal('rev_bit', 50, 1),
+            CanSignal('brake_light_bit', 49, 1),
+        ], raw_attr='ac1239_status_2', raw_fmt='bin'),
+
+        CanFrame(1617, 'PACK CELL STATUS', [
+            CanSignal('pack_lo_cell_v', 0, 16, signed=True, factor=0.001, digits=2),
+            CanSignal('pack_hi_cell_v', 16, 16, signed=True, factor=0.001, digits=2),
+            CanSignal('pack_avg_cell_v', 32, 16, signed=True, factor=0.001),
+            CanSignal('pack_max_cell_num', 48, 8),
+            CanSignal('pack_pop_cells', 56, 8),
+        ], raw_attr='pack_cell_status'),
+
+        CanFrame(1619, 'PACK ALERT STATUS', [
+            CanSignal('dsch_rly_enbl', 0, 1),
+            CanSignal('chg_rly_enbl', 1, 1),
+            CanSignal('chg_sfty_enbl', 2, 1),
+            CanSignal('mlfctn_ind_active', 3, 1),
+            CanSignal('multi_prps_inp_sig', 4, 1),
+            CanSignal('alws_on_sig_stat', 5, 1),
+            CanSignal('is_rdy_sig_stat', 6, 1),
+            CanSignal('charging', 7, 1),
+            CanSignal('pack_12volt', 8, 16, signed=True, factor=0.1),
+        ], raw_attr='pack_alert_status'),
+
+        CanFrame(336, 'PACK CRITICAL DATA', [
+            CanSignal('pack_amps', 0, 16, signed=True, factor=-1),
+            CanSignal('pack_volts', 16, 16, signed=True, factor=0.1, digits=1),
+            CanSignal('pack_amp_hrs', 32, 16),
+            CanSignal('pack_hi_tmp', 48, 8),
+            CanSignal('pack_lo_tmp', 56, 8),
+        ], raw_attr='pack_critical_data'),
+
+        CanFrame(1616, 'PACK STATUS', [
+            CanSignal('soc', 0, 8, factor=0.5),
+            CanSignal('resistance', 8, 16),
+            CanSignal('pack_hlth', 24, 8),
+            CanSignal('pack_open_v', 32, 16),
+            CanSignal('pack_total_cyc', 48, 16),
+        ], raw_attr='pack_status'),
+
+        CanFrame(1618, 'PACK LIMITS', [
+            CanSignal('pack_ccl', 0, 16, signed=True),
+            CanSignal('pack_dcl', 16, 16, signed=True),
+            CanSignal('pack_max_cell_v', 32, 16, signed=True, factor=0.001, digits=3),
+            CanSignal('pack_min_cell_v', 48, 16, signed=True, factor=0.001, digits=3),
+        ], raw_attr='pack_limits'),
+
+        CanFrame(2027, 'PACK ERROR RESPONSE', [
+            CanSignal('pid_resp_min', 8, 8),
+            CanSignal('pid_resp_max', 16, 8),
+            CanSignal('pid_fault_cnt', 24, 8),
+            CanSignal('pid_err_one', 32, 16),
+            CanSignal('pid_err_two', 48, 16),
+        ], raw_attr='pack_error_responses', log_changes=True),
+
+        CanFrame(54, 'PACK CELL BROADCAST', [
+            CanSignal('cell_id', 0, 8),
+            CanSignal('cell_inst_volt', 15, 16, BIG_ENDIAN, signed=True, factor=0.0001),
+            CanSignal('cell_internal_resist', 31, 16, BIG_ENDIAN, signed=True, factor=1E-005),
+            CanSignal('cell_open_volt', 47, 16, BIG_ENDIAN, signed=True, factor=0.0001),
+            CanSignal('cell_checksum', 56, 8),
+        ], raw_attr='pack_cell_broadcast'),
+    ]
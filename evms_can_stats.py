@@ -0,0 +1,184 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_can_stats.py
+#
+#   Per arbitration id CAN statistics and bus load. evms_can calls CanBusStats.update_batch() for every received
+#   batch, before it takes the DataHolder lock; per frame the update is a dict lookup, a few counter increments and
+#   a bisect into a fixed jitter histogram (no objects are allocated once an id has been seen), so the counters can
+#   stay on in production. The counters have a lock of their own, taken once per batch. tick() turns the counters
+#   into rates and load once a second, text() formats them for the CAN Data tab and as_dict() / dump() give the
+#   same numbers as JSON.
+#
+#   The load counts the received frames only: with the kernel id filters installed (see evms_can.can_filters) it is
+#   the load of the accepted ids, and is labelled so; only with capture all (or CAN logging) enabled, capture_all
+#   True, it is the load of the whole bus.
+#
+######################################################################################################################
+
+import os
+import json
+import threading
+from bisect import bisect_right
+from time import monotonic, time
+
+sw_ver_can_stats = '0.1.0'
+
+# inter-arrival jitter (|interval - average period|) histogram bucket edges, ms. Bucket i counts jitter below
+# JITTER_EDGES_MS[i], the last bucket everything above JITTER_EDGES_MS[-1]
+JITTER_EDGES_MS = (0.5, 1, 2, 5, 10, 20, 50, 100, 200)
+JITTER_EDGES = tuple(edge / 1000.0 for edge in JITTER_EDGES_MS)
+
+# frame length in bits without data and bit stuffing: SOF, id, control, CRC, ACK, EOF and interframe space
+STD_FRAME_BITS = 47
+EXT_FRAME_BITS = 67
+PERIOD_WEIGHT = 1 / 16.0  # EWMA weight of a new interval in the average period
+
+
+class CanIdStats:
+    __slots__ = ('arbitration_id', 'is_extended_id', 'count', 'changed', 'last_t', 'last_seen', 'last_data',
+                 'period', 'jitter', 'tick_count', 'rate')
+
+    def __init__(self, arbitration_id, is_extended_id):
+        self.arbitration_id = arbitration_id
+        self.is_extended_id = is_extended_id
+        self.count = 0
+        self.changed = 0
+        self.last_t = None  # frame timestamp, for the interval
+        self.last_seen = monotonic()  # of the last tick the id was seen in, for the age
+        self.last_data = None
+        self.period = 0.0
+        self.jitter = [0] * (len(JITTER_EDGES) + 1)
+        self.tick_count = 0
+        self.rate = 0.0
+
+    def as_dict(self, now):
+        return {'id': self.arbitration_id,
+                'extended': self.is_extended_id,
+                'count': self.count,
+                'rate': round(self.rate, 2),
+                'period_ms': round(self.period * 1000, 3),
+                'age': round(now - self.last_seen, 3),
+                'changed_ratio': round(self.changed / self.count, 4) if self.count else 0.0,
+                'jitter_ms': dict(zip([str(edge) for edge in JITTER_EDGES_MS] + ['inf'], self.jitter))}
+
+
+class CanBusStats:
+    def __init__(self, bitrate=250000):
+        self.lock = threading.Lock()  # the counters, shared by the receive worker and the 1 Hz tick
+        self.bitrate = bitrate
+        self.capture_all = False  # no kernel id filters: the load is the load of the whole bus
+        self.ids = {}
+        self.frames = 0
+        self.bits = 0
+        self.tick_frames = 0
+        self.tick_bits = 0
+        self.last_tick = monotonic()
+        self.frame_rate = 0.0
+        self.load = 0.0
+        self.peak_load = 0.0
+
+    def update(self, message):
+        self.update_batch((message,))
+
+    # the frames of one received batch, called by the receive worker of the bus (not under the DataHolder lock)
+    def update_batch(self, batch):
+        ids = self.ids
+        bits = 0
+        with self.lock:
+            for message in batch:
+                stats = ids.get(message.arbitration_id)
+                if stats is None:
+                    stats = ids[message.arbitration_id] = CanIdStats(message.arbitration_id, message.is_extended_id)
+                t = message.timestamp
+                last_t = stats.last_t
+                if last_t is not None:
+                    interval = t - last_t
+                    period = stats.period
+                    if period == 0.0:
+                        period = interval
+                    stats.jitter[bisect_right(JITTER_EDGES, abs(interval - period))] += 1
+                    stats.period = period + (interval - period) * PERIOD_WEIGHT
+                stats.last_t = t
+                data = message.data
+                if data != stats.last_data:
+                    stats.changed += 1
+                    stats.last_data = data  # every received message has its own data buffer, keeping it is safe
+                stats.count += 1
+                bits += (EXT_FRAME_BITS if message.is_extended_id else STD_FRAME_BITS) + 8 * message.dlc
+            self.frames += len(batch)
+            self.bits += bits
+
+    # rates, last seen times and bus load since the previous tick, called once a second
+    def tick(self):
+        now = monotonic()
+        with self.lock:
+            elapsed = now - self.last_tick
+            if elapsed <= 0:
+                return
+            self.last_tick = now
+            for stats in self.ids.values():
+                frames = stats.count - stats.tick_count
+                stats.tick_count = stats.count
+                stats.rate = frames / elapsed
+                if frames:
+                    stats.last_seen = now
+            self.frame_rate = (self.frames - self.tick_frames) / elapsed
+            self.load = (self.bits - self.tick_bits) / (elapsed * self.bitrate)
+            self.peak_load = max(self.peak_load, self.load)
+            self.tick_frames = self.frames
+            self.tick_bits = self.bits
+
+    # what the load measures, see the header comment
+    def load_label(self):
+        return 'bus load' if self.capture_all else 'load of accepted IDs'
+
+    # ---------------------------------------------------------------------------------------------------------------
+    def as_dict(self):
+        now = monotonic()
+        with self.lock:
+            return {'time': time(),
+                    'bitrate': self.bitrate,
+                    'frames': self.frames,
+                    'frame_rate': round(self.frame_rate, 1),
+                    'load': round(self.load, 4),
+                    'load_scope': 'bus' if self.capture_all else 'accepted ids',
+                    'peak_load': round(self.peak_load, 4),
+                    'ids': [self.ids[i].as_dict(now) for i in sorted(self.ids)]}
+
+    # writes as_dict() as JSON, replacing the file atomically so a reader never sees half a dump
+    def dump(self, filename):
+        tmp = filename + '.tmp'
+        with open(tmp, 'w') as file:
+            json.dump(self.as_dict(), file, indent=1)
+        os.replace(tmp, filename)
+
+    # one line per id for the CAN Data tab: id, rate, changed payload %, jitter p90 bucket, age
+    def text(self):
+        now = monotonic()
+        with self.lock:
+            lines = ['%s %4.1f%% (peak %4.1f%%) %6.0f fr/s' % (self.load_label(), self.load * 100,
+                                                              self.peak_load * 100, self.frame_rate),
+                     '     id    fr/s chg%  jit90   age']
+            for arbitration_id in sorted(self.ids):
+                stats = self.ids[arbitration_id]
+                lines.append('%7s %7.1f %4.0f %6s %5.1f' % (('%08X' if stats.is_extended_id else '%03X')
+                                                            % arbitration_id, stats.rate,
+                                                            100.0 * stats.changed / stats.count,
+                                                            jitter_p90(stats.jitter), now - stats.last_seen))
+        return '\n'.join(lines)
+
+
+# upper edge of the histogram bucket holding the 90th percentile, as text
+def jitter_p90(histogram):
+    total = sum(histogram)
+    if total == 0:
+        return '-'
+    limit = total * 0.9
+    running = 0
+    for idx, count in enumerate(histogram):
+        running += count
+        if running >= limit:
+            return '<%gms' % JITTER_EDGES_MS[idx] if idx < len(JITTER_EDGES_MS) else '>%gms' % JITTER_EDGES_MS[-1]
+    return '-'
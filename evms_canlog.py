@@ -0,0 +1,277 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_canlog.py
+#
+#   Raw CAN capture into a ring of preallocated, fixed size binary segment files. evms_can hands every received
+#   batch to CanRingLog.write_messages(), which only packs the frames into a preallocated numpy record buffer. A
+#   full buffer (batch_frames frames, or whatever arrived in flush_interval seconds) is queued to the
+#   CanRingWriter thread, which writes it with one large write, so the CAN receive thread never waits for the SD
+#   card; written buffers go back to a free queue for reuse. A segment is closed when it is full or older than
+#   max_age, and the ring then moves on to (and overwrites) the oldest segment, so disk use never exceeds
+#   segment_count * segment_bytes.
+#
+#   usage: python3 evms_canlog.py <ring directory | segment files> [--out file.log] [--iface can0]
+#          converts the capture, oldest frame first, into the candump -L text format (as read by canplayer)
+#
+#   Segment file layout:
+#       header    64 bytes: magic b'EVMSCANR', version, record size, sequence number, created (unix time),
+#                 valid record count, channel name
+#       records   CAN_RECORD_DTYPE
+#
+######################################################################################################################
+
+import os
+import sys
+import glob
+import queue
+import struct
+import threading
+import numpy as np
+from time import monotonic, time
+
+sw_ver_canlog = '0.2.0'
+
+MAGIC = b'EVMSCANR'
+HEADER = struct.Struct('<8sIIQdQ16s')
+HEADER_SIZE = 64
+COUNT_OFFSET = 8 + 4 + 4 + 8 + 8
+
+FLAG_EXTENDED = 0x01
+FLAG_REMOTE = 0x02
+FLAG_ERROR = 0x04
+
+CAN_RECORD_DTYPE = np.dtype([('t', '<f8'), ('id', '<u4'), ('dlc', 'u1'), ('flags', 'u1'), ('pad', 'u1', (2,)),
+                             ('data', 'S8')])
+
+
+def segment_names(directory, prefix, segment_count):
+    return [os.path.join(directory, '%s_%02d.canring' % (prefix, i)) for i in range(segment_count)]
+
+
+def read_segment_header(filename):
+    with open(filename, 'rb') as file:
+        magic, version, record_size, seq, created, count, channel = HEADER.unpack(file.read(HEADER.size))
+    if magic != MAGIC or record_size != CAN_RECORD_DTYPE.itemsize:
+        raise ValueError(filename + ' is not an EVMS CAN ring segment')
+    return {'seq': seq, 'created': created, 'count': count, 'channel': channel.rstrip(b'\0').decode()}
+
+
+class CanRingLog:
+    def __init__(self, directory, channel, prefix='evms_can', segment_bytes=16 * 1024 * 1024, segment_count=16,
+                 max_age=3600, batch_frames=4096, flush_interval=1.0, spare_buffers=3, log=None):
+        os.makedirs(directory, exist_ok=True)
+        self.channel = channel
+        self.max_age = max_age
+        self.flush_interval = flush_interval
+        self.records_per_segment = (segment_bytes - HEADER_SIZE) // CAN_RECORD_DTYPE.itemsize
+        self.segment_bytes = HEADER_SIZE + self.records_per_segment * CAN_RECORD_DTYPE.itemsize
+        self.names = segment_names(directory, prefix, segment_count)
+        self.log = log
+        self.batch_frames = batch_frames
+        self.buffer = np.zeros(batch_frames, dtype=CAN_RECORD_DTYPE)
+        self.buffered = 0
+        self.free = queue.SimpleQueue()  # written buffers, reused by the receive side
+        for _ in range(spare_buffers):
+            self.free.put(np.zeros(batch_frames, dtype=CAN_RECORD_DTYPE))
+        self.lock = threading.Lock()  # the filling buffer, shared by the receive thread and the flush timer
+        self.fd = None
+        self.frames_written = 0
+
+        # continue after the newest segment of a previous capture
+        self.seq = 0
+        self.index = -1
+        for idx, name in enumerate(self.names):
+            try:
+                header = read_segment_header(name)
+                if header['seq'] >= self.seq:
+                    self.seq, self.index = header['seq'], idx
+            except (OSError, ValueError, struct.error):
+                pass
+        self.next_flush = monotonic() + flush_interval
+        self.open_next_segment()
+        self.writer = CanRingWriter(self)
+        self.writer.start()
+
+    # closes the current segment and (re)initialises the next one in the ring (writer thread)
+    def open_next_segment(self):
+        if self.fd is not None:
+            os.close(self.fd)
+        self.index = (self.index + 1) % len(self.names)
+        self.seq += 1
+        self.count = 0
+        self.opened = monotonic()
+        self.fd = os.open(self.names[self.index], os.O_RDWR | os.O_CREAT, 0o644)
+        os.ftruncate(self.fd, self.segment_bytes)  # preallocate, also cuts a segment left over from a bigger ring
+        try:
+            os.posix_fallocate(self.fd, 0, self.segment_bytes)
+        except (AttributeError, OSError):
+            pass
+        os.pwrite(self.fd, HEADER.pack(MAGIC, 1, CAN_RECORD_DTYPE.itemsize, self.seq, time(), 0,
+                                       self.channel.encode()[:16]).ljust(HEADER_SIZE, b'\0'), 0)
+
+    # receive thread: packs the frames into the filling buffer, no disk access
+    def write_messages(self, messages):
+        with self.lock:
+            buf = self.buffer
+            if buf is None:
+                return
+            for message in messages:
+                if self.buffered == len(buf):
+                    self.end_buffer()
+                    buf = self.buffer
+                flags = 0
+                if message.is_extended_id:
+                    flags |= FLAG_EXTENDED
+                if message.is_remote_frame:
+                    flags |= FLAG_REMOTE
+                if message.is_error_frame:
+                    flags |= FLAG_ERROR
+                buf[self.buffered] = (message.timestamp, message.arbitration_id, message.dlc, flags, (0, 0),
+                                      bytes(message.data))
+                self.buffered += 1
+            if monotonic() >= self.next_flush:
+                self.end_buffer()
+
+    # queues the buffered frames to the writer if flush_interval has passed (call while the bus is idle)
+    def flush_if_due(self):
+        if monotonic() >= self.next_flush:
+            self.flush()
+
+    # queues the buffered frames to the writer, does not wait for the write
+    def flush(self):
+        with self.lock:
+            if self.buffer is not None:
+                self.end_buffer()
+
+    # hands the filling buffer to the writer and continues in a free one (call with self.lock held)
+    def end_buffer(self):
+        self.next_flush = monotonic() + self.flush_interval
+        if not self.buffered:
+            return
+        self.writer.buffers.put((self.buffer, self.buffered))
+        try:
+            self.buffer = self.free.get_nowait()
+        except queue.Empty:  # writer behind (slow card): one more buffer rather than a stall
+            self.buffer = np.zeros(self.batch_frames, dtype=CAN_RECORD_DTYPE)
+        self.buffered = 0
+
+    # writer thread: the first count records of buf, across segment boundaries
+    def write_records(self, buf, count):
+        done = 0
+        while done < count:
+            if self.count == self.records_per_segment or monotonic() - self.opened > self.max_age:
+                self.open_next_segment()
+            n = min(count - done, self.records_per_segment - self.count)
+            os.pwrite(self.fd, buf[done:done + n].tobytes(), HEADER_SIZE + self.count * CAN_RECORD_DTYPE.itemsize)
+            self.count += n
+            done += n
+            os.pwrite(self.fd, struct.pack('<Q', self.count), COUNT_OFFSET)
+        self.frames_written += count
+
+    # writes what is buffered and queued, waits for the writer and closes the segment
+    def close(self):
+        with self.lock:
+            if self.buffer is None:
+                return
+            self.end_buffer()
+            self.buffer = None
+        self.writer.stop()
+        if self.fd is not None:
+            os.fsync(self.fd)
+            os.close(self.fd)
+            self.fd = None
+
+
+class CanRingWriter(threading.Thread):
+    def __init__(self, ring):
+        super().__init__(name='CanRingWriter', daemon=True)
+        self.ring = ring
+        self.buffers = queue.SimpleQueue()
+
+    def run(self):
+        while True:
+            item = self.buffers.get()
+            if item is None:
+                break
+            buf, count = item
+            try:
+                self.ring.write_records(buf, count)
+            except Exception as e:
+                if self.ring.log is not None:
+                    self.ring.log('CanRingWriter ERROR: ' + str(e))
+            self.ring.free.put(buf)
+
+    def stop(self):
+        if self.is_alive():
+            self.buffers.put(None)
+            self.join(10)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# all valid records of the given segment files (or ring directories), oldest segment first
+def load_segments(paths):
+    segments = []
+    for path in paths:
+        names = sorted(glob.glob(os.path.join(path, '*.canring'))) if os.path.isdir(path) else [path]
+        for name in names:
+            try:
+                segments.append((read_segment_header(name), name))
+            except (OSError, ValueError, struct.error):
+                print('evms_canlog: skipping ' + name)
+    segments.sort(key=lambda segment: segment[0]['seq'])
+    for header, name in segments:
+        if header['count'] > 0:
+            yield header, np.memmap(name, dtype=CAN_RECORD_DTYPE, mode='r', offset=HEADER_SIZE,
+                                    shape=(header['count'],))
+
+
+HEX_BYTE = ['%02X' % i for i in range(256)]
+
+
+def candump_line(record, iface):
+    flags = int(record['flags'])
+    if flags & FLAG_EXTENDED:
+        can_id = '%08X' % record['id']
+    else:
+        can_id = '%03X' % record['id']
+    if flags & FLAG_REMOTE:
+        data = 'R'
+    else:
+        data = ''.join([HEX_BYTE[b] for b in record['data'].ljust(8, b'\0')[:record['dlc']]])
+    t = float(record['t'])
+    return '(%017.6f) %s %s#%s\n' % (t, iface, can_id, data)
+
+
+def to_candump(paths, out, iface=None):
+    count = 0
+    for header, records in load_segments(paths):
+        channel = iface or header['channel'] or 'can0'
+        out.writelines(candump_line(record, channel) for record in records)
+        count += len(records)
+    return count
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    out_filename = None
+    iface = None
+    paths = []
+    while args:
+        arg = args.pop(0)
+        if arg == '--out' and args:
+            out_filename = args.pop(0)
+        elif arg == '--iface' and args:
+            iface = args.pop(0)
+        else:
+            paths.append(arg)
+    if not paths:
+        print('USAGE: python3 evms_canlog.py <ring directory | segment files> [--out file.log] [--iface can0]')
+        sys.exit(1)
+    if out_filename is None:
+        count = to_candump(paths, sys.stdout, iface)
+    else:
+        with open(out_filename, 'w') as out:
+            count = to_candump(paths, out, iface)
+        print('wrote %d frames to %s' % (count, out_filename))
@@ -0,0 +1,111 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_cells.py
+#
+#   Per cell table filled from the Orion BMS cell broadcast (CAN id 54 / 0x36, one frame per cell):
+#       byte 0      cell id
+#       byte 1-2    instantaneous voltage, 0.1 mV, big endian
+#       byte 3-4    internal resistance, 0.01 mOhm, big endian, bit 15 set while the cell is shunting (balancing)
+#       byte 5-6    open circuit voltage, 0.1 mV, big endian
+#       byte 7      checksum: low byte of 0x36 + 8 (length) + bytes 0-6
+#   The table is a set of preallocated numpy columns indexed by cell id; pack wide statistics are computed over
+#   all cells at once by stats(), once a second, so the cost does not depend on python objects per cell. Cells not
+#   updated for max_age seconds drop out of the statistics, also when the broadcasts stop altogether.
+#   text() formats the statistics for the CAN Data tab.
+#
+######################################################################################################################
+
+import numpy as np
+from collections import namedtuple
+from time import monotonic
+
+sw_ver_cells = '0.1.0'
+
+CELL_BROADCAST_ID = 54
+MAX_CELLS = 256  # the cell id is one byte
+
+CellStats = namedtuple('CellStats', (
+    'cells',            # cells seen within max_age
+    'min_v', 'min_cell', 'max_v', 'max_cell', 'mean_v', 'std_v', 'spread_v',
+    'worst_low',        # ids of the n lowest voltage cells, lowest first
+    'worst_high',       # ids of the n highest voltage cells, highest first
+    'worst_resistance', # ids of the n highest internal resistance cells, highest first
+    'shunting',         # number of cells balancing
+    'bad_checksums',    # broadcast frames dropped on a checksum mismatch since start
+))
+
+
+class CellTable:
+    def __init__(self, max_cells=MAX_CELLS):
+        self.inst_v = np.full(max_cells, np.nan)
+        self.open_v = np.full(max_cells, np.nan)
+        self.resistance = np.full(max_cells, np.nan)  # ohm
+        self.shunting = np.zeros(max_cells, dtype=bool)
+        self.seen = np.zeros(max_cells, dtype=bool)
+        self.updated = np.zeros(max_cells)  # frame timestamp of the last update
+        self.last_update = 0.0
+        self.last_rx = None  # monotonic time of the last update
+        self.bad_checksums = 0
+
+    # one cell broadcast payload, returns False when it was dropped (short frame, bad checksum)
+    def update(self, data, timestamp):
+        if len(data) < 8:
+            return False
+        if (CELL_BROADCAST_ID + 8 + sum(data[:7])) & 0xFF != data[7]:
+            self.bad_checksums += 1
+            return False
+        cell = data[0]
+        if cell >= len(self.inst_v):
+            return False
+        resistance = (data[3] << 8) | data[4]
+        self.inst_v[cell] = ((data[1] << 8) | data[2]) * 0.0001
+        self.resistance[cell] = (resistance & 0x7FFF) * 0.00001
+        self.shunting[cell] = resistance > 0x7FFF
+        self.open_v[cell] = ((data[5] << 8) | data[6]) * 0.0001
+        self.seen[cell] = True
+        self.updated[cell] = timestamp
+        self.last_update = timestamp
+        self.last_rx = monotonic()
+        return True
+
+    # cells updated within max_age seconds, in frame time (so this also works on replayed logs): the newest update
+    # plus the time passed since it was received
+    def active(self, max_age=10.0):
+        if self.last_rx is None:
+            return self.seen
+        now = self.last_update + (monotonic() - self.last_rx)
+        return self.seen & (self.updated >= now - max_age)
+
+    def stats(self, worst=5, max_age=10.0):
+        ids = np.flatnonzero(self.active(max_age))
+        if len(ids) == 0:
+            return None
+        volts = self.inst_v[ids]
+        n = min(worst, len(ids))
+        by_volts = np.argsort(volts, kind='stable')
+        by_resistance = np.argsort(-self.resistance[ids], kind='stable')
+        low = int(by_volts[0])
+        high = int(by_volts[-1])
+        return CellStats(cells=len(ids),
+                         min_v=float(volts[low]), min_cell=int(ids[low]),
+                         max_v=float(volts[high]), max_cell=int(ids[high]),
+                         mean_v=float(volts.mean()), std_v=float(volts.std()),
+                         spread_v=float(volts[high] - volts[low]),
+                         worst_low=tuple(ids[by_volts[:n]].tolist()),
+                         worst_high=tuple(ids[by_volts[::-1][:n]].tolist()),
+                         worst_resistance=tuple(ids[by_resistance[:n]].tolist()),
+                         shunting=int(np.count_nonzero(self.shunting[ids])),
+                         bad_checksums=self.bad_checksums)
+
+
+# CAN Data tab text of a CellStats
+def text(stats):
+    if stats is None:
+        return 'cells: none within max age'
+    return ('cells %d  min %.4f V (#%d)  max %.4f V (#%d)  spread %.1f mV  std %.1f mV\n'
+            'lowest %s  highest %s  resistance %s  shunting %d  bad checksums %d'
+            % (stats.cells, stats.min_v, stats.min_cell, stats.max_v, stats.max_cell, stats.spread_v * 1000,
+               stats.std_v * 1000, ','.join(map(str, stats.worst_low)), ','.join(map(str, stats.worst_high)),
+               ','.join(map(str, stats.worst_resistance)), stats.shunting, stats.bad_checksums))
@@ -0,0 +1,95 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_charts.py
+#
+#   Bar chart rendering for the bar history and the JBD cell charts. All bars of one color are added to a single
+#   path and filled once. BarHistoryChart keeps the rendered history in an image surface: when the history has
+#   moved on by n bins since the last draw, the surface is scrolled by n bins and only the n new bars are drawn,
+#   when nothing changed the surface is only composited, so the cost of a draw doesn't grow with the history
+#   length.
+#
+######################################################################################################################
+
+import cairo
+import numpy as np
+
+sw_ver_charts = '0.1.0'
+
+
+# fills the rectangles (x, y, width, height) as one path in the current source color
+def fill_rectangles(ctx, rects):
+    for x, y, width, height in rects:
+        ctx.rectangle(x, y, width, height)
+    ctx.fill()
+
+
+class BarHistoryChart:
+    # bar i (0: newest) is bar_width wide starting at x_right - i * bin_width, and goes up heights[i] pixels from
+    # base_y; key: anything else the rendering depends on (color, scale, geometry)
+    def __init__(self):
+        self.front = None
+        self.back = None
+        self.size = None
+        self.key = None
+        self.heights = None
+
+    def paint(self, ctx, widget, key, heights, x_right, bin_width, bar_width, base_y, color):
+        size = (max(1, widget.get_allocated_width()), max(1, widget.get_allocated_height()))
+        heights = np.asarray(heights)
+        last = self.heights
+        geometry = (key, x_right, bin_width, bar_width, base_y, color)
+        if size != self.size:
+            self.front = cairo.ImageSurface(cairo.FORMAT_ARGB32, *size)
+            self.back = cairo.ImageSurface(cairo.FORMAT_ARGB32, *size)
+            self.size = size
+            last = None
+        if last is None or geometry != self.key or len(last) != len(heights):
+            self.render(heights, x_right, bin_width, bar_width, base_y, color)
+        elif not np.array_equal(heights, last):
+            shift = self.shift_of(last, heights)
+            if shift:
+                self.scroll(shift, heights, x_right, bin_width, bar_width, base_y, color)
+            else:
+                self.render(heights, x_right, bin_width, bar_width, base_y, color)
+        self.key = geometry
+        self.heights = heights.copy()
+        ctx.save()
+        ctx.set_source_surface(self.front, 0, 0)
+        ctx.paint()
+        ctx.restore()
+
+    # n when heights is last moved on by n bins (n new bars at the front), 0 otherwise
+    @staticmethod
+    def shift_of(last, heights):
+        for n in range(1, len(heights) // 2 + 1):
+            if np.array_equal(heights[n:], last[:-n]):
+                return n
+        return 0
+
+    def bars(self, ctx, heights, indices, x_right, bin_width, bar_width, base_y, color):
+        ctx.set_source_rgb(*color)
+        fill_rectangles(ctx, ((x_right - i * bin_width, base_y, bar_width, -int(heights[i])) for i in indices))
+
+    def render(self, heights, x_right, bin_width, bar_width, base_y, color):
+        ctx = cairo.Context(self.front)
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        ctx.paint()
+        ctx.set_operator(cairo.OPERATOR_OVER)
+        self.bars(ctx, heights, range(len(heights)), x_right, bin_width, bar_width, base_y, color)
+
+    def scroll(self, n, heights, x_right, bin_width, bar_width, base_y, color):
+        ctx = cairo.Context(self.back)
+        ctx.set_operator(cairo.OPERATOR_SOURCE)
+        ctx.set_source_surface(self.front, -n * bin_width, 0)
+        ctx.paint()
+        # the n new bins, and whatever moved past the oldest bin
+        ctx.set_operator(cairo.OPERATOR_CLEAR)
+        height = self.size[1]
+        ctx.rectangle(x_right - (n - 1) * bin_width, 0, n * bin_width, height)
+        ctx.rectangle(0, 0, x_right - (len(heights) - 1) * bin_width, height)
+        ctx.fill()
+        ctx.set_operator(cairo.OPERATOR_OVER)
+        self.bars(ctx, heights, range(n), x_right, bin_width, bar_width, base_y, color)
+        self.front, self.back = self.back, self.front
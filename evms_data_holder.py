@@ -7,9 +7,98 @@
 ######################################################################################################################
 
 import numpy as np
+import threading
+from collections import namedtuple
+from operator import attrgetter
+from evms_syslog import SYSLOG_COLUMNS
+from evms_signal_bus import SignalBus
+from evms_rollup import Rollup
+
+# ---------------------------------------------------------------------------------------------------------------
+# Telemetry fields published in each snapshot. The acquisition threads (CAN, GPS, JBD, 10 Hz timer) write the
+# DataHolder attributes (the back buffer) while holding DataHolder.lock, and publish() copies these fields into an
+# immutable Telemetry tuple once per cycle. Readers (GUI, logging) use DataHolder.snapshot and never take the lock.
+# Only the read side is lock free: writers and publish() still serialize on DataHolder.lock, so a snapshot never
+# holds half of a frame's signals and no changed signal is lost between two publishes. Writers keep the hold short,
+# doing everything but the attribute stores outside it (see evms_can.can_decode_batch).
+SNAPSHOT_FIELDS = (
+    'ac1239_status_1', 'rpm', 'mot_rpm', 'mot_temp', 'mot_ctrl_temp', 'mot_amps', 'mot_volts',
+    'ac1239_status_2', 'mot_stator_freq', 'ctrl_fault_1', 'ctrl_fault_2', 'thrtl_inp', 'brake_inp', 'econ_bit',
+    'regen_bit', 'rev_bit', 'brake_light_bit',
+    'pack_cell_status', 'pack_lo_cell_v', 'pack_hi_cell_v', 'pack_avg_cell_v', 'pack_max_cell_num', 'pack_pop_cells',
+    'pack_cycles',
+    'pack_alert_status', 'dsch_rly_enbl', 'chg_rly_enbl', 'chg_sfty_enbl', 'mlfctn_ind_active', 'multi_prps_inp_sig',
+    'alws_on_sig_stat', 'is_rdy_sig_stat', 'charging', 'pack_12volt',
+    'pack_critical_data', 'pack_amps', 'pack_volts', 'pack_amp_hrs', 'pack_hi_tmp', 'pack_lo_tmp',
+    'pack_status', 'soc', 'resistance', 'pack_hlth', 'pack_open_v', 'pack_total_cyc',
+    'pack_limits', 'pack_ccl', 'pack_dcl', 'pack_max_cell_v', 'pack_min_cell_v',
+    'pack_error_responses', 'pid_resp_min', 'pid_resp_max', 'pid_fault_cnt', 'pid_err_one', 'pid_err_two',
+    'pack_cell_broadcast', 'cell_id', 'cell_checksum', 'cell_open_volt', 'cell_internal_resist', 'cell_inst_volt',
+    'cell_stats',
+    'time', 'date', 'gps_datetime', 'lat', 'lon', 'spd', 'hdg', 'latitude', 'longitude',
+    'pack2_volts', 'pack2_amps', 'pack2_soc', 'pack2_full_cap', 'jbd_cell_mv', 'jbd_bal',
+    'pwr', 'ttd',
+)
+
+Telemetry = namedtuple('Telemetry', SNAPSHOT_FIELDS)
+
+# fields computed by the timer thread rather than written by a producer; publish() compares them with the previous
+# snapshot to find out whether they changed (see evms_signal_bus.py)
+DERIVED_FIELDS = ('pwr', 'ttd')
+DERIVED_INDEX = tuple(SNAPSHOT_FIELDS.index(name) for name in DERIVED_FIELDS)
+
+# numeric telemetry channels packed into one fixed-layout record per tick (see DataHolder.get_record()). Missing
+# values (None) are stored as NaN so a record can be copied, logged or sent as a single contiguous block.
+RECORD_CHANNELS = (
+    'rpm', 'mot_rpm', 'mot_temp', 'mot_ctrl_temp', 'mot_amps', 'mot_volts',
+    'mot_stator_freq', 'ctrl_fault_1', 'ctrl_fault_2', 'thrtl_inp', 'brake_inp', 'econ_bit', 'regen_bit', 'rev_bit',
+    'brake_light_bit',
+    'pack_lo_cell_v', 'pack_hi_cell_v', 'pack_avg_cell_v', 'pack_max_cell_num', 'pack_pop_cells', 'pack_cycles',
+    'dsch_rly_enbl', 'chg_rly_enbl', 'chg_sfty_enbl', 'mlfctn_ind_active', 'multi_prps_inp_sig', 'alws_on_sig_stat',
+    'is_rdy_sig_stat', 'charging', 'pack_12volt',
+    'pack_amps', 'pack_volts', 'pack_amp_hrs', 'pack_hi_tmp', 'pack_lo_tmp',
+    'soc', 'resistance', 'pack_hlth', 'pack_open_v', 'pack_total_cyc',
+    'pack_ccl', 'pack_dcl', 'pack_max_cell_v', 'pack_min_cell_v',
+    'pid_resp_min', 'pid_resp_max', 'pid_fault_cnt', 'pid_err_one', 'pid_err_two',
+    'latitude', 'longitude', 'spd', 'hdg',
+    'pack2_volts', 'pack2_amps', 'pack2_soc', 'pack2_full_cap',
+    'pwr', 'ttd',
+)
+
+RECORD_DTYPE = np.dtype([(name, '<f8') for name in RECORD_CHANNELS] +
+                        [('jbd_cell_mv', '<f8', (16,)), ('jbd_bal', 'u1', (16,))])
+
+# channels with a 10 Hz / sec / min / hrs history (bar history charts, histograms)
+HISTORY_CHANNELS = ('pwr', 'rpm', 'spd', 'soc', 'pack_amps', 'pack_volts', 'mot_temp', 'mot_ctrl_temp')
+
+# everything else a DataHolder carries: run timer, ttd filter state, gauge colors, bar history, GUI settings
+STATE_FIELDS = (
+    'lock', 'snapshot', 'bus', 'sw_ver_data', 'gps_parse_error_count', 'true_course', 'rev', 'debugging',
+    'runTime', 'runTime_100ms', 'runTime_sec', 'runTime_min', 'runTime_hrs',
+    'rpm_threshold', 'avging_time_s', 'datapoints_needed', 'valid_datapoints', 'amps_running_avg', 'a', 'b',
+    'spd_R', 'spd_G', 'spd_B', 'rpm_R', 'rpm_G', 'rpm_B', 'pwr_R', 'pwr_G', 'pwr_B',
+    'bat_R', 'bat_G', 'bat_B', 'tmp_R', 'tmp_G', 'tmp_B',
+    'UpdateBarHistPlot', 'OneSecTick', 'OneMinTick', 'OneHrTick', 'max_y_scale_bar_hist',
+    'y_offset', 'pwr_graph_x_ofst', 'pwr_graph_width_pix', 'pwr_bin_width', 'pwr_bin_shade',
+    'GPS_FORMAT', 'HDG_UNITS',
+    'histories', 'pwr_min_sum',
+    'chk_can_logging', 'chk_gps_logging', 'active_notification', 'dataholder_log',
+)
+
 
 class DataHolder:
+    # fixed attribute set: no per-instance __dict__, and a misspelled attribute name raises instead of silently
+    # creating a new one
+    __slots__ = SNAPSHOT_FIELDS + STATE_FIELDS
+
+    snapshot_getter = attrgetter(*SNAPSHOT_FIELDS)
+    record_getter = attrgetter(*RECORD_CHANNELS)
+    syslog_getters = {line: attrgetter(*columns) for line, columns in SYSLOG_COLUMNS.items()}
+
     def __init__(self):
+        self.lock = threading.Lock()  # taken by the writers and publish(), by readers only for history(), see
+        # SNAPSHOT_FIELDS
+        self.bus = SignalBus(self.log_dataholder)
         self.sw_ver_data = "1.0.0"
         self.ac1239_status_1 = ""
         self.rpm = None
@@ -82,6 +171,7 @@ class DataHolder:
         self.cell_open_volt = None          #: 47 | 16 @ 0 - (0.0001, 0)[-6 | 6]
         self.cell_internal_resist = None    #: 31 | 16 @ 0 - (1E-005, 0)[0 | 0]
         self.cell_inst_volt = None          #: 15 | 16 @ 0 - (0.0001, 0)[-6 | 6]
+        self.cell_stats = None              # evms_cells.CellStats of the whole pack, see evms_can.update_cell_stats
 
         self.time = None
         self.date = None
@@ -93,7 +183,19 @@ class DataHolder:
         self.latitude = None
         self.longitude = None
 
+        self.true_course = None
+
         self.gps_parse_error_count = 0
+        self.debugging = False
+        self.rev = None   # reverse flag as read back from a replayed log file
+
+        ########## PACK 2 (JBD BMS) ##########
+        self.pack2_volts = 0
+        self.pack2_amps = 0
+        self.pack2_soc = 0
+        self.pack2_full_cap = 0
+        self.jbd_cell_mv = (0,) * 16   # replaced as a whole (never modified in place) so snapshots stay immutable
+        self.jbd_bal = (0,) * 16
 
         ########## RUNTIME VARIABLES ##########
         self.runTime = None
@@ -143,20 +245,17 @@ class DataHolder:
         self.rpm = 0
         self.spd = 0
         self.max_y_scale_bar_hist = 220
-
-        self.pwr_10hz = np.zeros(10)
-        self.pwr_sec = np.zeros(60)
-        self.pwr_min = np.zeros(60)
+        self.y_offset = 0  # 10 pix margin at bottom and top
+        self.pwr_graph_x_ofst = 0
+        self.pwr_graph_width_pix = 1280
+        self.pwr_bin_width = 22
+        self.pwr_bin_shade = 18
+        self.GPS_FORMAT = 'DECIMAL'
+        self.HDG_UNITS = 'MAG'
+
+        # 10 Hz / sec / min / hrs histories of HISTORY_CHANNELS, see evms_rollup.py
+        self.histories = {name: Rollup() for name in HISTORY_CHANNELS}
         self.pwr_min_sum = 0
-        self.pwr_hrs = np.zeros(60)
-        self.rpm_10hz = np.zeros(10)
-        self.rpm_sec = np.zeros(60)
-        self.rpm_min = np.zeros(60)
-        self.rpm_hrs = np.zeros(60)
-        self.spd_10hz = np.zeros(10) #
-        self.spd_sec = np.zeros(60)
-        self.spd_min = np.zeros(60)
-        self.spd_hrs = np.zeros(60)
 
 
         # ---------------- GUI logging checkboxes ------------------------
@@ -166,6 +265,61 @@ class DataHolder:
         self.active_notification = False
         self.dataholder_log = ''
 
+        self.snapshot = None
+        self.publish()
+
+    # copies the telemetry fields into a new immutable Telemetry snapshot and makes it the current one. Call once
+    # per cycle from the timer thread; the reference swap is atomic so readers always see a complete snapshot. The
+    # copy is taken under DataHolder.lock (one attrgetter call), the only time publish() blocks a writer.
+    # The signals changed since the last publish() are then dispatched to the bus subscribers. compare=True finds
+    # the changes by comparing every field with the previous snapshot, for writers that do not mark their changes
+    # (log file replay).
+    def publish(self, compare=False):
+        with self.lock:
+            values = self.snapshot_getter(self)
+            changed = self.bus.take()
+        previous = self.snapshot
+        self.snapshot = Telemetry._make(values)
+        if previous is not None:
+            if compare:
+                changed.update(name for name, old, new in zip(SNAPSHOT_FIELDS, previous, values) if old != new)
+            else:
+                for idx in DERIVED_INDEX:
+                    if previous[idx] != values[idx]:
+                        changed.add(SNAPSHOT_FIELDS[idx])
+        self.bus.dispatch(self.snapshot, changed)
+        return self.snapshot
+
+    # producer side of the signal bus: writes the given fields under the lock and marks the ones that changed
+    def update(self, **values):
+        with self.lock:
+            changed = self.bus.changed
+            for name, value in values.items():
+                if getattr(self, name) != value:
+                    setattr(self, name, value)
+                    changed.add(name)
+
+    # subscribes callback(snapshot, changed) to a set of SNAPSHOT_FIELDS (None for all of them). The first
+    # delivery, at the next publish(), carries every subscribed signal so the subscriber starts from a full state.
+    def subscribe(self, name, signals, callback, min_interval=0.0):
+        if signals is not None:
+            unknown = set(signals).difference(SNAPSHOT_FIELDS)
+            if unknown:
+                raise ValueError('not a telemetry field: ' + ', '.join(sorted(unknown)))
+        subscription = self.bus.subscribe(name, signals, callback, min_interval)
+        subscription.pending.update(SNAPSHOT_FIELDS if signals is None else signals)
+        return subscription
+
+    # packs the numeric channels of the current snapshot into a RECORD_DTYPE record. Pass a preallocated
+    # np.zeros((), RECORD_DTYPE) (or a one-row slice of a record array) as out to fill it in place.
+    def get_record(self, out=None):
+        s = self.snapshot
+        if out is None:
+            out = np.zeros((), dtype=RECORD_DTYPE)
+        values = tuple(np.nan if v is None or v == '' else v for v in self.record_getter(s))
+        out[...] = values + (s.jbd_cell_mv, s.jbd_bal)
+        return out
+
     def get_dataholder_log(self):
         return self.dataholder_log
 
@@ -177,68 +331,31 @@ class DataHolder:
 
     def get_SysLog_str(self, type):
 
+        s = self.snapshot
+        tmp_str = type
         try:
-            if type == 'a':
-                #tmp_str = str(self.gps_datetime)
-                tmp_str = type
-                tmp_str += ',' + str(self.date)
-                tmp_str += ',' + str(self.time)
-                tmp_str += ',' + str(self.latitude) #keep these this way (DD.dddddd)
-                tmp_str += ',' + str(self.longitude)#keep these this way (DD.dddddd)
-                tmp_str += ',' + str(self.spd)
-                tmp_str += ',' + str(self.hdg)
-                tmp_str += ',' + str(self.rpm)
-                tmp_str += ',' + str(self.soc)
-                tmp_str += ',' + str(self.pack_amps)
-                tmp_str += ',' + str(self.pack_volts)
-                tmp_str += ',' + str(self.mot_temp)
-                tmp_str += ',' + str(self.mot_ctrl_temp)
-                tmp_str += ',' + str(self.pack_amp_hrs)
-                tmp_str += ',' + str(self.thrtl_inp)
-                tmp_str += ',' + str(self.brake_inp)
-                tmp_str += ',' + str(self.mot_amps)
-                tmp_str += ',' + str(self.rev_bit)
-                tmp_str += ',' + str(self.charging)
-                tmp_str += ',' + str(self.econ_bit)
-                tmp_str += ',' + str(self.regen_bit)
-            elif type == 'b':
-                tmp_str = type
-                tmp_str += ',' + str(self.pack_status)
-                tmp_str += ',' + str(self.pack_hlth)
-                tmp_str += ',' + str(self.pack_cycles)
-                tmp_str += ',' + str(self.pack_open_v)
-                tmp_str += ',' + str(self.pack_avg_cell_v)
-                tmp_str += ',' + str(self.pack_lo_cell_v)
-                tmp_str += ',' + str(self.pack_hi_cell_v)
-                tmp_str += ',' + str(self.pack_lo_tmp)
-                tmp_str += ',' + str(self.pack_hi_tmp)
-                tmp_str += ',' + str(self.pack_max_cell_v)
-                tmp_str += ',' + str(self.pack_min_cell_v)
-                tmp_str += ',' + str(self.dsch_rly_enbl)
-                tmp_str += ',' + str(self.chg_rly_enbl)
-                tmp_str += ',' + str(self.chg_sfty_enbl)
-                tmp_str += ',' + str(self.alws_on_sig_stat)
-                tmp_str += ',' + str(self.is_rdy_sig_stat)
-                tmp_str += ',' + str(self.pack_12volt)
-                tmp_str += ',' + str(self.pack_limits)
-                tmp_str += ',' + str(self.pack_ccl)
-                tmp_str += ',' + str(self.pack_dcl)
-                tmp_str += ',' + str(self.pack_max_cell_num)
-                tmp_str += ',' + str(self.pack_pop_cells)
-            elif type == 'c':
-                tmp_str = type
-                tmp_str += ',' + str(self.pack_alert_status)
-                tmp_str += ',' + str(self.mlfctn_ind_active)
-                tmp_str += ',' + str(self.multi_prps_inp_sig)
-                tmp_str += ',' + str(self.pid_resp_min)
-                tmp_str += ',' + str(self.pid_resp_max)
-                tmp_str += ',' + str(self.pid_fault_cnt)
-                tmp_str += ',' + str(self.pid_err_one)
-                tmp_str += ',' + str(self.pid_err_two)
+            # columns of the a/b/c lines are listed in evms_syslog.SYSLOG_COLUMNS
+            tmp_str += ',' + ','.join(map(str, self.syslog_getters[type](s)))
         except Exception as e:
             self.log_dataholder("DataHolderError get_data_str: " + str(e))
         return tmp_str
 
+    # one sample of every history channel into tier (0: the 10 Hz tier, 'sec' when replaying a 1 Hz log); a
+    # channel without a value (None) repeats its previous sample
+    def add_history_samples(self, tier=0):
+        with self.lock:
+            for name, history in self.histories.items():
+                value = getattr(self, name)
+                if value is None or value == '':
+                    value = history.last(tier)
+                history.add(value, tier)
+
+    # a copy of the history of channel name in tier ('10hz', 'sec', 'min', 'hrs'), newest first. latest() is a view
+    # into the ring that the next add() overwrites, so the copy is taken under the lock add_history_samples() holds
+    def history(self, name, tier):
+        with self.lock:
+            return self.histories[name].latest(tier).copy()
+
     def get_motor_pwr(self):
         try:
             if (not self.pack_amps == None) and (not self.pack_volts == None):
@@ -0,0 +1,231 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_dbc.py
+#
+#   Offline DBC import for the CAN decoder tables. Reads one or more vendor .dbc files, keeps only the signals
+#   listed in a subscription map (message, signal -> DataHolder attribute) and writes them out as a generated
+#   python module (evms_can_tables.py) that evms_can imports at startup, so the DBC is never parsed at runtime.
+#
+#   usage: python3 evms_dbc.py <file.dbc> [<file.dbc> ...] [--map evms_dbc_signals.cfg] [--out evms_can_tables.py]
+#          python3 evms_dbc.py --export evms.dbc [--map evms_dbc_signals.cfg]
+#
+#   --export writes the built-in EVMS frame layouts as a DBC file plus the matching subscription map.
+#
+######################################################################################################################
+
+import re
+import sys
+from datetime import datetime
+from evms_can_decoder import CanFrame, CanSignal, evms_frames
+
+sw_ver_dbc = '0.1.0'
+
+EXTENDED_ID_FLAG = 0x80000000
+
+re_message = re.compile(r'^BO_\s+(\d+)\s+(\w+)\s*:\s*(\d+)\s+(\w+)')
+re_signal = re.compile(r'^SG_\s+(\w+)\s*(\w*)\s*:\s*(\d+)\|(\d+)@([01])([+-])\s*'
+                       r'\(\s*([^,]+?)\s*,\s*([^)]+?)\s*\)\s*\[\s*([^|]*?)\s*\|\s*([^\]]*?)\s*\]\s*"([^"]*)"')
+
+
+def dbc_number(text):
+    value = float(text)
+    if value.is_integer() and not any(c in text for c in '.eE'):
+        return int(value)
+    return value
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# DBC parsing. Returns {message_name: (arbitration_id, is_extended_id, dlc, [CanSignal, ...])} with the signals
+# named as in the DBC. Multiplexed signals are not supported by the decoder and are skipped.
+def read_dbc(filename):
+    messages = {}
+    current = None
+    with open(filename, 'r', errors='replace') as file:
+        for line in file:
+            line = line.strip()
+            m = re_message.match(line)
+            if m:
+                frame_id = int(m.group(1))
+                current = m.group(2)
+                messages[current] = (frame_id & 0x1FFFFFFF, bool(frame_id & EXTENDED_ID_FLAG), int(m.group(3)), [])
+                continue
+            m = re_signal.match(line)
+            if m and current is not None:
+                if m.group(2):
+                    print('evms_dbc: skipping multiplexed signal ' + current + '.' + m.group(1))
+                    continue
+                messages[current][3].append(CanSignal(m.group(1), int(m.group(3)), int(m.group(4)),
+                                                      int(m.group(5)), m.group(6) == '-',
+                                                      dbc_number(m.group(7)), dbc_number(m.group(8))))
+    return messages
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# Subscription map, one entry per line (same comma separated style as evms_cfg_settings.cfg):
+#   message, signal, attribute [, round_digits]     decode DBC signal into DataHolder.attribute
+#   message, *raw, attribute [, hex|bin]            store the raw payload string in DataHolder.attribute
+#   message, *log                                   log every new payload of the message
+def read_signal_map(filename):
+    signals = {}
+    raw = {}
+    logged = set()
+    with open(filename, 'r') as file:
+        for line in file:
+            line = line.split('#')[0].strip()
+            if line == '':
+                continue
+            fields = [field.strip() for field in line.split(',')]
+            if fields[1] == '*raw':
+                raw[fields[0]] = (fields[2], fields[3] if len(fields) > 3 else 'hex')
+            elif fields[1] == '*log':
+                logged.add(fields[0])
+            else:
+                digits = int(fields[3]) if len(fields) > 3 and fields[3] != '' else None
+                signals[(fields[0], fields[1])] = (fields[2], digits)
+    return signals, raw, logged
+
+
+# default subscription when no map is given: every DBC signal named like a DataHolder attribute
+def default_signal_map(messages):
+    from evms_data_holder import DataHolder
+    signals = {}
+    for message_name, (frame_id, extended, dlc, sigs) in messages.items():
+        for sig in sigs:
+            if sig.name in DataHolder.__slots__:
+                signals[(message_name, sig.name)] = (sig.name, None)
+    return signals, {}, set()
+
+
+# builds CanFrames holding only the subscribed signals, renamed to their DataHolder attributes
+def subscribed_frames(messages, signal_map):
+    signals, raw, logged = signal_map
+    frames = []
+    for message_name, (frame_id, extended, dlc, sigs) in messages.items():
+        subscribed = []
+        for sig in sigs:
+            if (message_name, sig.name) in signals:
+                sig.name, sig.digits = signals[(message_name, sig.name)]
+                subscribed.append(sig)
+        if not subscribed and message_name not in raw:
+            continue
+        raw_attr, raw_fmt = raw.get(message_name, (None, 'hex'))
+        frames.append(CanFrame(frame_id, message_name.replace('_', ' '), subscribed, raw_attr=raw_attr,
+                               raw_fmt=raw_fmt, log_changes=message_name in logged, dlc=dlc,
+                               is_extended_id=extended))
+    return frames
+
+
+# ---------------------------------------------------------------------------------------------------------------
+def write_tables_module(frames, filename, sources):
+    out = ['#' * 118,
+           '#',
+           '#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.',
+           '#   Electric Vessel Management System (EVMS)',
+           '#   Filename: ' + filename.split('/')[-1],
+           '#',
+           '#   GENERATED by evms_dbc.py ' + sw_ver_dbc + ' on ' + datetime.now().strftime('%Y-%m-%d %H:%M:%S') +
+           ' from: ' + ', '.join(sources),
+           '#   Do not edit, re-run evms_dbc.py instead.',
+           '#',
+           '#' * 118,
+           '',
+           'from evms_can_decoder import CanFrame, CanSignal',
+           '',
+           '',
+           'def frames():',
+           '    return [']
+    for frame in frames:
+        out.append('        CanFrame(%d, %r, [' % (frame.arbitration_id, frame.name))
+        for sig in frame.signals:
+            out.append('            CanSignal(%r, %d, %d, %d, %r, %r, %r, %r),'
+                       % (sig.name, sig.start_bit, sig.length, sig.byte_order, sig.signed, sig.factor, sig.offset,
+                          sig.digits))
+        out.append('        ], raw_attr=%r, raw_fmt=%r, log_changes=%r, dlc=%d, is_extended_id=%r),'
+                   % (frame.raw_attr, frame.raw_fmt, frame.log_changes, frame.dlc, frame.is_extended_id))
+    out.append('    ]')
+    with open(filename, 'w') as file:
+        file.write('\n'.join(out) + '\n')
+
+
+# writes the built-in frame layouts as a DBC file and the subscription map that maps them back onto the DataHolder
+def export_dbc(frames, dbc_filename, map_filename):
+    dbc = ['VERSION "EVMS ' + sw_ver_dbc + '"', '', 'NS_ :', '', 'BS_:', '', 'BU_: EVMS', '']
+    signal_map = ['# message, signal, attribute [, round_digits]', '# message, *raw, attribute [, hex|bin]',
+                  '# message, *log', '']
+    for frame in frames:
+        message_name = frame.name.replace(' ', '_')
+        frame_id = frame.arbitration_id | (EXTENDED_ID_FLAG if frame.is_extended_id else 0)
+        dbc.append('BO_ %d %s: %d Vector__XXX' % (frame_id, message_name, frame.dlc))
+        for sig in frame.signals:
+            dbc.append(' SG_ %s : %d|%d@%d%s (%r,%r) [0|0] "" EVMS'
+                       % (sig.name, sig.start_bit, sig.length, sig.byte_order, '-' if sig.signed else '+',
+                          sig.factor, sig.offset))
+            signal_map.append('%s, %s, %s%s' % (message_name, sig.name, sig.name,
+                                                '' if sig.digits is None else ', %d' % sig.digits))
+        if frame.raw_attr is not None:
+            signal_map.append('%s, *raw, %s, %s' % (message_name, frame.raw_attr, frame.raw_fmt))
+        if frame.log_changes:
+            signal_map.append('%s, *log' % message_name)
+        dbc.append('')
+        signal_map.append('')
+    with open(dbc_filename, 'w') as file:
+        file.write('\n'.join(dbc) + '\n')
+    with open(map_filename, 'w') as file:
+        file.write('\n'.join(signal_map))
+
+
+# ---------------------------------------------------------------------------------------------------------------
+def usage():
+    print('USAGE: python3 evms_dbc.py <file.dbc> [<file.dbc> ...] [--map evms_dbc_signals.cfg] '
+          '[--out evms_can_tables.py]')
+    print('       python3 evms_dbc.py --export evms.dbc [--map evms_dbc_signals.cfg]')
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    map_filename = None
+    out_filename = 'evms_can_tables.py'
+    export_filename = None
+    dbc_files = []
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--map':
+                map_filename = args.pop(0)
+            elif arg == '--out':
+                out_filename = args.pop(0)
+            elif arg == '--export':
+                export_filename = args.pop(0)
+            else:
+                dbc_files.append(arg)
+    except IndexError:
+        usage()
+        sys.exit(1)
+
+    if export_filename is not None:
+        export_dbc(evms_frames(), export_filename, map_filename or 'evms_dbc_signals.cfg')
+        print('exported built-in frame layouts to ' + export_filename)
+    elif not dbc_files:
+        usage()
+        sys.exit(1)
+    else:
+        messages = {}
+        for dbc_file in dbc_files:
+            messages.update(read_dbc(dbc_file))
+        if map_filename is not None:
+            signal_map = read_signal_map(map_filename)
+        else:
+            signal_map = default_signal_map(messages)
+        frames = subscribed_frames(messages, signal_map)
+        from evms_data_holder import DataHolder
+        for frame in frames:
+            frame.compile()  # fail here rather than at EVMS startup
+            for attr in [sig.name for sig in frame.signals] + [frame.raw_attr]:
+                if attr is not None and attr not in DataHolder.__slots__:
+                    print('evms_dbc: ' + frame.name + ' maps onto unknown DataHolder attribute ' + attr)
+                    sys.exit(1)
+        write_tables_module(frames, out_filename, dbc_files)
+        print('wrote %d frames / %d signals to %s' % (len(frames), sum(len(f.signals) for f in frames),
+                                                       out_filename))
@@ -0,0 +1,124 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_gui_binding.py
+#
+#   Label binding layer between the telemetry snapshots and the GTK labels. Every bound label has a formatter
+#   (snapshot -> text, None to leave the label as is) and remembers the last text it was given; update() formats
+#   only the labels on the notebook page that is showing (and the labels outside the notebook), and flush() hands
+#   the labels whose text actually changed to the GTK thread in one GLib.idle_add callback per cycle, instead of
+#   one callback per label. Text posted for a hidden page is kept and applied when that page is selected.
+#
+#   update(), post() and flush() are called from the thread that publishes the snapshots (10 Hz tasks), the GTK
+#   thread only runs apply() and the page switch handler.
+#
+######################################################################################################################
+
+from gi.repository import GLib
+
+sw_ver_gui_binding = '0.1.0'
+
+ALWAYS = -1  # page of the labels outside the notebook
+
+
+# formatter showing fmt.format(field), converted by convert first, that leaves the label unchanged while the field is
+# None or ''
+def field_format(name, fmt, convert=None):
+    def formatter(d):
+        value = getattr(d, name)
+        if value is None or value == '':
+            return None
+        return fmt.format(value if convert is None else convert(value))
+    return formatter
+
+
+class LabelBinding:
+    __slots__ = ('widget', 'formatter', 'page')
+
+    def __init__(self, widget, formatter, page):
+        self.widget = widget
+        self.formatter = formatter
+        self.page = page
+
+
+class GuiBinder:
+    def __init__(self, notebook, log=None):
+        self.notebook = notebook
+        self.log = log
+        self.page = notebook.get_current_page()
+        self.bindings = []
+        self.pages = {}  # widget: notebook page
+        self.last = {}  # widget: text last handed to the GTK thread
+        self.pending = {}  # widget: text not applied yet (its page is hidden)
+        notebook.connect('switch-page', self.on_switch_page)
+
+    def on_switch_page(self, notebook, page, page_num):
+        self.page = page_num
+
+    # notebook page holding widget, ALWAYS for widgets outside the notebook
+    def page_of(self, widget):
+        page = self.pages.get(widget)
+        if page is None:
+            page = ALWAYS
+            child = widget
+            parent = widget.get_parent()
+            while parent is not None:
+                if parent is self.notebook:
+                    page = self.notebook.page_num(child)
+                    break
+                child = parent
+                parent = parent.get_parent()
+            self.pages[widget] = page
+        return page
+
+    # formatter(snapshot) -> text, or None to leave the label unchanged
+    def bind(self, widget, formatter):
+        binding = LabelBinding(widget, formatter, self.page_of(widget))
+        self.bindings.append(binding)
+        return binding
+
+    def visible(self, page):
+        return page == ALWAYS or page == self.page
+
+    # new text for a label, applied by the next flush() while its page is showing
+    def post(self, widget, text):
+        if self.last.get(widget) == text:
+            self.pending.pop(widget, None)
+        else:
+            self.pending[widget] = text
+
+    # formats the bound labels of the visible page from snapshot d, then flushes
+    def update(self, d):
+        page = self.page
+        for binding in self.bindings:
+            if binding.page != ALWAYS and binding.page != page:
+                continue
+            try:
+                text = binding.formatter(d)
+            except Exception as e:
+                if self.log is not None:
+                    self.log("GuiBinder: " + str(binding.widget.get_name()) + ": " + str(e))
+                continue
+            if text is not None:
+                self.post(binding.widget, text)
+        self.flush()
+
+    # one idle callback with every changed label of the visible page
+    def flush(self):
+        if not self.pending:
+            return
+        changes = []
+        for widget, text in list(self.pending.items()):
+            if self.visible(self.page_of(widget)):
+                changes.append((widget, text))
+                self.last[widget] = text
+                del self.pending[widget]
+        if changes:
+            GLib.idle_add(self.apply, changes)
+
+    @staticmethod
+    def apply(changes):
+        for widget, text in changes:
+            widget.set_label(text)
+        return False  # run once
@@ -0,0 +1,176 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_log.py
+#
+#   Application logging. start_logging() installs a single QueueHandler on the root logger: a logging call only
+#   puts the record on a queue, so the CAN, GPS and timer threads never wait for the SD card. One LogWriter thread
+#   takes the records off the queue in batches and hands them to the rotating (gzip compressed) application log,
+#   to stdout and to the shared LogRing (log_ring), flushing the file and stdout once per batch.
+#
+#   log_ring is a fixed capacity ring, so the messages waiting for the console never grow past capacity however
+#   long nobody looks. LogConsole copies the messages it hasn't shown yet into the console GtkTextBuffer and keeps
+#   that buffer at max_lines, trimming the oldest lines in batches of trim_lines (one delete per batch).
+#
+######################################################################################################################
+
+import os
+import sys
+import gzip
+import queue
+import atexit
+import shutil
+import logging
+import threading
+import logging.handlers
+from collections import deque
+from itertools import islice
+
+sw_ver_log = '0.2.0'
+
+LOG_FORMAT = '%(asctime)s - %(message)s'
+LOG_MAX_BYTES = 16 * 1024 * 1024  # application log size before it is rotated
+LOG_BACKUPS = 10  # rotated, compressed logs kept (<log>.1.gz is the newest)
+LOG_BATCH = 256  # records written per batch at most
+
+
+class LogRing:
+    def __init__(self, capacity=2000):
+        self.lock = threading.Lock()
+        self.messages = deque(maxlen=capacity)
+        self.count = 0  # messages appended since start
+
+    # any thread
+    def append(self, message):
+        with self.lock:
+            self.messages.append(message)
+            self.count += 1
+
+    # (count, messages appended after the first count messages that are still in the ring)
+    def since(self, count):
+        with self.lock:
+            new = min(self.count - count, len(self.messages))
+            return self.count, list(islice(self.messages, len(self.messages) - new, None))
+
+
+log_ring = LogRing()  # shared by evms.py, evms_can and mapPlots
+
+
+class LogConsole:
+    def __init__(self, text_buffer, ring=log_ring, max_lines=500, trim_lines=100):
+        self.text_buffer = text_buffer
+        self.ring = ring
+        self.max_lines = max_lines
+        self.trim_lines = trim_lines
+        self.count = 0
+
+    # GTK thread (GLib.idle_add), returns False so an idle callback runs once
+    def update(self):
+        self.count, messages = self.ring.since(self.count)
+        if messages:
+            self.text_buffer.insert(self.text_buffer.get_end_iter(), '\n'.join(messages) + '\n')
+            lines = self.text_buffer.get_line_count()
+            if lines > self.max_lines + self.trim_lines:
+                self.text_buffer.delete(self.text_buffer.get_start_iter(),
+                                        self.text_buffer.get_iter_at_line(lines - self.max_lines))
+        return False
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# handlers for LogWriter: no flush per record, LogWriter calls flush_batch() after every batch
+class BatchFlush:
+    def flush(self):
+        pass
+
+    def flush_batch(self):
+        logging.StreamHandler.flush(self)
+
+
+class BatchStreamHandler(BatchFlush, logging.StreamHandler):
+    pass
+
+
+class BatchRotatingFileHandler(BatchFlush, logging.handlers.RotatingFileHandler):
+    # rotated files are gzip compressed, by the LogWriter thread
+    def __init__(self, filename, max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUPS):
+        super().__init__(filename, maxBytes=max_bytes, backupCount=backup_count)
+        self.namer = lambda name: name + '.gz'
+        self.rotator = self.compress
+
+    @staticmethod
+    def compress(source, dest):
+        with open(source, 'rb') as src, gzip.open(dest, 'wb') as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(source)
+
+    def close(self):
+        self.flush_batch()
+        super().close()
+
+
+class RingHandler(logging.Handler):
+    def __init__(self, ring):
+        super().__init__()
+        self.ring = ring
+
+    def emit(self, record):
+        self.ring.append(record.getMessage())
+
+    def flush_batch(self):
+        pass
+
+
+class LogWriter(threading.Thread):
+    def __init__(self, records, handlers):
+        super().__init__(name='LogWriter', daemon=True)
+        self.records = records
+        self.handlers = handlers
+
+    def run(self):
+        stop = False
+        while not stop:
+            batch = [self.records.get()]
+            while len(batch) < LOG_BATCH:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+            for record in batch:
+                if record is None:
+                    stop = True
+                    continue
+                for handler in self.handlers:
+                    if record.levelno >= handler.level:
+                        handler.handle(record)
+            for handler in self.handlers:
+                try:
+                    handler.flush_batch()
+                except Exception:
+                    pass
+
+    # writes what is queued, then ends the thread
+    def stop(self):
+        if self.is_alive():
+            self.records.put(None)
+            self.join(5)
+        for handler in self.handlers:
+            handler.close()
+
+
+# routes every logging call of the process through the queue to filename, stdout and ring; returns the LogWriter
+def start_logging(filename, ring=log_ring, level=logging.INFO):
+    records = queue.SimpleQueue()
+    formatter = logging.Formatter(LOG_FORMAT)
+    handlers = [BatchRotatingFileHandler(filename), BatchStreamHandler(sys.stdout), RingHandler(ring)]
+    for handler in handlers[:2]:
+        handler.setFormatter(formatter)
+    writer = LogWriter(records, handlers)
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(logging.handlers.QueueHandler(records))
+    root.setLevel(level)
+    writer.start()
+    atexit.register(writer.stop)
+    return writer
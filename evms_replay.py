@@ -0,0 +1,235 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_replay.py
+#
+#   CAN replay engine for candump -L logs (and evms_canlog rings). Frames are parsed as a stream and injected
+#   either straight into the evms_can decoder or onto a (v)can bus, at real time, N x speed or as fast as possible.
+#   Seeking by timestamp uses a sparse offset index built once per log (<log>.ridx.npz).
+#
+#   usage: python3 evms_replay.py <candump.log | ring dir> [--bus vcan0] [--speed 1 | --max] [--seek <unix time>]
+#          python3 evms_replay.py <candump.log> --decode      headless: push the whole log through evms_can
+#
+######################################################################################################################
+
+import os
+import sys
+import time
+import numpy as np
+
+sw_ver_replay = '0.1.0'
+
+INDEX_STEP = 1024  # one index entry per INDEX_STEP lines
+INDEX_DTYPE = np.dtype([('t', '<f8'), ('offset', '<i8')])
+
+
+class ReplayFrame:
+    # the part of can.Message that evms_can and CanRingLog use, without the per frame cost of can.Message
+    __slots__ = ('timestamp', 'arbitration_id', 'is_extended_id', 'is_remote_frame', 'is_error_frame', 'dlc',
+                 'data')
+
+    def __init__(self, timestamp, arbitration_id, is_extended_id, is_remote_frame, data):
+        self.timestamp = timestamp
+        self.arbitration_id = arbitration_id
+        self.is_extended_id = is_extended_id
+        self.is_remote_frame = is_remote_frame
+        self.is_error_frame = False
+        self.dlc = len(data)
+        self.data = data
+
+    def to_message(self):
+        import can
+        return can.Message(timestamp=self.timestamp, arbitration_id=self.arbitration_id,
+                           is_extended_id=self.is_extended_id, is_remote_frame=self.is_remote_frame, data=self.data)
+
+
+# '(1652534420.123456) can0 601#0102030405060708' -> ReplayFrame, None for anything else
+def parse_candump_line(line):
+    try:
+        stamp, iface, frame = line.split()
+        can_id, data = frame.split('#', 1)
+        if data[:1] == 'R':
+            return ReplayFrame(float(stamp[1:-1]), int(can_id, 16), len(can_id) > 3, True, b'')
+        return ReplayFrame(float(stamp[1:-1]), int(can_id, 16), len(can_id) > 3, False, bytes.fromhex(data))
+    except ValueError:
+        return None
+
+
+class CanReplay:
+    def __init__(self, filename):
+        self.filename = filename
+        self.ring = os.path.isdir(filename) or filename.endswith('.canring')
+        self.index = None
+
+    # ---------------------------------------------------------------------------------------------------------------
+    def frames(self, start=None):
+        if self.ring:
+            yield from self.ring_frames(start)
+            return
+        with open(self.filename, 'rb') as file:
+            if start is not None:
+                file.seek(self.seek_offset(start))
+            for line in file:
+                frame = parse_candump_line(line.decode('ascii', 'replace'))
+                if frame is not None and (start is None or frame.timestamp >= start):
+                    start = None
+                    yield frame
+
+    def ring_frames(self, start):
+        from evms_canlog import load_segments, FLAG_EXTENDED, FLAG_REMOTE
+        for header, records in load_segments([self.filename]):
+            if start is not None:
+                if records['t'][-1] < start:
+                    continue
+                records = records[np.searchsorted(records['t'], start):]
+                start = None
+            for t, can_id, dlc, flags, pad, data in records.tolist():
+                yield ReplayFrame(t, can_id, bool(flags & FLAG_EXTENDED), bool(flags & FLAG_REMOTE),
+                                  data.ljust(8, b'\0')[:dlc])
+
+    # ---------------------------------------------------------------------------------------------------------------
+    def index_filename(self):
+        return self.filename + '.ridx.npz'
+
+    # sparse (timestamp, byte offset) index, loaded from <log>.ridx.npz or built with one pass over the log
+    def load_index(self):
+        if self.index is not None:
+            return self.index
+        st = os.stat(self.filename)
+        try:
+            with np.load(self.index_filename()) as cached:
+                if int(cached['size']) == st.st_size and int(cached['mtime_ns']) == st.st_mtime_ns:
+                    self.index = cached['index']
+                    return self.index
+        except (OSError, KeyError, ValueError):
+            pass
+        entries = []
+        offset = 0
+        with open(self.filename, 'rb') as file:
+            for count, line in enumerate(file):
+                if count % INDEX_STEP == 0:
+                    frame = parse_candump_line(line.decode('ascii', 'replace'))
+                    if frame is not None:
+                        entries.append((frame.timestamp, offset))
+                offset += len(line)
+        self.index = np.array(entries, dtype=INDEX_DTYPE)
+        try:
+            np.savez(self.index_filename(), index=self.index, size=st.st_size, mtime_ns=st.st_mtime_ns)
+        except OSError:
+            pass
+        return self.index
+
+    def seek_offset(self, start):
+        index = self.load_index()
+        i = np.searchsorted(index['t'], start, side='right') - 1
+        return int(index['offset'][i]) if i >= 0 else 0
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # feeds the frames to send(batch) in batches. speed: 1.0 real time, N for N x, None as fast as possible.
+    # Returns the number of frames played; stops early when stop (a threading.Event) is set.
+    def play(self, send, speed=1.0, start=None, stop=None, batch_size=256):
+        count = 0
+        batch = []
+        t0_log = None
+        t0_wall = time.monotonic()
+        for frame in self.frames(start):
+            if stop is not None and stop.is_set():
+                break
+            if speed is not None:
+                if t0_log is None:
+                    t0_log = frame.timestamp
+                delay = t0_wall + (frame.timestamp - t0_log) / speed - time.monotonic()
+                if delay > 0:
+                    if batch:
+                        send(batch)
+                        count += len(batch)
+                        batch = []
+                    time.sleep(delay)
+            batch.append(frame)
+            if len(batch) >= batch_size or (speed is not None and delay > -0.001):
+                send(batch)
+                count += len(batch)
+                batch = []
+        if batch:
+            send(batch)
+            count += len(batch)
+        return count
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# sinks for CanReplay.play()
+class DecoderSink:
+    # decodes straight into a DataHolder through evms_can, as the CAN thread would
+    def __init__(self, evms_can, v_dat):
+        self.evms_can = evms_can
+        self.v_dat = v_dat
+
+    def __call__(self, batch):
+        self.evms_can.can_decode_batch(batch, self.v_dat)
+
+
+class BusSink:
+    # sends the frames on a can bus, typically vcan0 for a simulated EVMS
+    def __init__(self, bus):
+        self.bus = bus
+
+    def __call__(self, batch):
+        for frame in batch:
+            self.bus.send(frame.to_message())
+
+
+def usage():
+    print('USAGE: python3 evms_replay.py <candump.log | ring dir> [--bus vcan0] [--speed 1 | --max] [--seek <unix time>]')
+    print('       python3 evms_replay.py <candump.log | ring dir> --decode')
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    filename = None
+    bus_name = None
+    speed = 1.0
+    start = None
+    decode = False
+    try:
+        while args:
+            arg = args.pop(0)
+            if arg == '--bus':
+                bus_name = args.pop(0)
+            elif arg == '--speed':
+                speed = float(args.pop(0))
+            elif arg == '--max':
+                speed = None
+            elif arg == '--seek':
+                start = float(args.pop(0))
+            elif arg == '--decode':
+                decode = True
+            else:
+                filename = arg
+    except (IndexError, ValueError):
+        filename = None
+    if filename is None or (bus_name is None and not decode):
+        usage()
+        sys.exit(1)
+
+    replay = CanReplay(filename)
+    if decode:
+        from evms_can import evms_can
+        from evms_data_holder import DataHolder
+        dat = DataHolder()
+        started = time.perf_counter()
+        count = replay.play(DecoderSink(evms_can('/dev/null', ''), dat), speed=None, start=start, batch_size=1024)
+        elapsed = time.perf_counter() - started
+        dat.publish()
+        print('decoded %d frames in %.2f s (%.0f frames/sec)' % (count, elapsed, count / max(elapsed, 1e-9)))
+        print(dat.get_SysLog_str('a'))
+        print(dat.get_SysLog_str('b'))
+        print(dat.get_SysLog_str('c'))
+    else:
+        import can
+        bus = can.interface.Bus(channel=bus_name, bustype='socketcan')
+        try:
+            count = replay.play(BusSink(bus), speed=speed, start=start, batch_size=64)
+            print('replayed %d frames onto %s' % (count, bus_name))
+        finally:
+            bus.shutdown()
@@ -0,0 +1,124 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_rollup.py
+#
+#   Multi resolution history of one telemetry channel. Tier 0 holds the raw 10 Hz samples; every value of tier
+#   i + 1 is the mean (with the min and max) of the next `factor` values of tier i, promoted as soon as that many
+#   have arrived: 10 samples make a second, 60 seconds a minute, 60 minutes an hour. Every tier is a preallocated
+#   circular buffer with a head index and a running window sum, so adding a sample costs a few scalar updates and
+#   allocates nothing, whatever the tier sizes.
+#
+#   The buffers are stored twice (values[i] == values[i + size]), so latest() can return the whole window, newest
+#   value first (the order the bar history charts expect), as a numpy view without copying.
+#
+######################################################################################################################
+
+import numpy as np
+
+sw_ver_rollup = '0.1.0'
+
+# (name, size, values of the previous tier per value)
+TIERS = (('10hz', 10, 1), ('sec', 60, 10), ('min', 60, 60), ('hrs', 60, 60))
+
+
+class RollupTier:
+    __slots__ = ('name', 'size', 'factor', 'values', 'mins', 'maxs', 'head', 'sum',
+                 'acc_sum', 'acc_n', 'acc_min', 'acc_max')
+
+    def __init__(self, name, size, factor):
+        self.name = name
+        self.size = size
+        self.factor = factor
+        self.values = np.zeros(2 * size)
+        self.mins = np.zeros(2 * size)
+        self.maxs = np.zeros(2 * size)
+        self.head = size - 1  # newest value, the first add() writes slot 0
+        self.sum = 0.0  # of the values in the window
+        self.acc_sum = 0.0  # values of the previous tier collected for the next value of this tier
+        self.acc_n = 0
+        self.acc_min = 0.0
+        self.acc_max = 0.0
+
+    def push(self, value, low, high):
+        head = self.head + 1
+        if head == self.size:
+            head = 0
+            self.sum = float(self.values[:self.size].sum())  # once per lap, no rounding drift in the running sum
+        size = self.size
+        self.sum += value - self.values[head]
+        self.values[head] = self.values[head + size] = value
+        self.mins[head] = self.mins[head + size] = low
+        self.maxs[head] = self.maxs[head + size] = high
+        self.head = head
+
+    # one value of the previous tier, returns the completed value (mean, min, max) every factor values
+    def collect(self, value, low, high):
+        if self.acc_n == 0:
+            self.acc_sum = value
+            self.acc_min = low
+            self.acc_max = high
+        else:
+            self.acc_sum += value
+            if low < self.acc_min:
+                self.acc_min = low
+            if high > self.acc_max:
+                self.acc_max = high
+        self.acc_n += 1
+        if self.acc_n < self.factor:
+            return None
+        self.acc_n = 0
+        return self.acc_sum / self.factor, self.acc_min, self.acc_max
+
+
+class Rollup:
+    def __init__(self, tiers=TIERS):
+        self.tiers = [RollupTier(name, size, factor) for name, size, factor in tiers]
+        self.index = {tier.name: idx for idx, tier in enumerate(self.tiers)}
+
+    # one sample into tier (0: the raw samples, or e.g. 'sec' for values that arrive once a second), promoted
+    # to the coarser tiers
+    def add(self, value, tier=0):
+        if not isinstance(tier, int):
+            tier = self.index[tier]
+        value = float(value)
+        low = high = value
+        tiers = self.tiers
+        while True:
+            tiers[tier].push(value, low, high)
+            tier += 1
+            if tier == len(tiers):
+                return
+            completed = tiers[tier].collect(value, low, high)
+            if completed is None:
+                return
+            value, low, high = completed
+
+    def tier(self, tier):
+        return self.tiers[tier if isinstance(tier, int) else self.index[tier]]
+
+    # the window of a tier, newest value first (a view, valid until the next add())
+    def latest(self, tier):
+        t = self.tier(tier)
+        return t.values[t.head + t.size:t.head:-1]
+
+    def latest_min(self, tier):
+        t = self.tier(tier)
+        return t.mins[t.head + t.size:t.head:-1]
+
+    def latest_max(self, tier):
+        t = self.tier(tier)
+        return t.maxs[t.head + t.size:t.head:-1]
+
+    def last(self, tier):
+        t = self.tier(tier)
+        return float(t.values[t.head])
+
+    # sum and mean of the whole window (the slots not filled yet count as 0)
+    def sum(self, tier):
+        return self.tier(tier).sum
+
+    def mean(self, tier):
+        t = self.tier(tier)
+        return t.sum / t.size
@@ -0,0 +1,78 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_signal_bus.py
+#
+#   Change driven publish/subscribe between the decoders and the consumers of the telemetry. Producers (the CAN
+#   decode tables, GPS and JBD readers) add the name of every signal whose value actually changed to
+#   SignalBus.changed while they hold DataHolder.lock. DataHolder.publish() takes that set together with the new
+#   snapshot and dispatch() hands each subscriber the snapshot plus the changed signals it subscribed to, at most
+#   once per min_interval (changes in between are merged into the next delivery). Subscribers that see no change
+#   are not called at all.
+#
+######################################################################################################################
+
+from time import monotonic
+
+sw_ver_signal_bus = '0.1.0'
+
+
+class Subscription:
+    #  signals      : frozenset of signal names, None for every signal
+    #  callback     : callback(snapshot, changed) with changed the set of signal names since the last call
+    #  min_interval : rate limit in seconds (0: every publish() with a change)
+    __slots__ = ('name', 'signals', 'callback', 'min_interval', 'pending', 'next_time')
+
+    def __init__(self, name, signals, callback, min_interval):
+        self.name = name
+        self.signals = None if signals is None else frozenset(signals)
+        self.callback = callback
+        self.min_interval = min_interval
+        self.pending = set()
+        self.next_time = 0.0
+
+
+class SignalBus:
+    def __init__(self, log=None):
+        self.changed = set()  # filled by the producers under DataHolder.lock, swapped out by take()
+        self.subscriptions = ()
+        self.log = log
+
+    def subscribe(self, name, signals, callback, min_interval=0.0):
+        subscription = Subscription(name, signals, callback, min_interval)
+        self.subscriptions = self.subscriptions + (subscription,)  # copy on write, dispatch() may be running
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions = tuple(s for s in self.subscriptions if s is not subscription)
+
+    # producer side, call while holding DataHolder.lock
+    def mark(self, name):
+        self.changed.add(name)
+
+    # the signals changed since the last call, call while holding DataHolder.lock
+    def take(self):
+        changed = self.changed
+        self.changed = set()
+        return changed
+
+    # delivers the changes to the subscribers, from the thread that publishes the snapshots
+    def dispatch(self, snapshot, changed):
+        now = monotonic()
+        for subscription in self.subscriptions:
+            if changed:
+                if subscription.signals is None:
+                    subscription.pending |= changed
+                else:
+                    subscription.pending |= subscription.signals & changed
+            if not subscription.pending or now < subscription.next_time:
+                continue
+            pending = subscription.pending
+            subscription.pending = set()
+            subscription.next_time = now + subscription.min_interval
+            try:
+                subscription.callback(snapshot, pending)
+            except Exception as e:
+                if self.log is not None:
+                    self.log("SignalBus: subscriber " + subscription.name + " failed: " + str(e))
@@ -0,0 +1,258 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_syslog.py
+#
+#   Binary system log. Instead of the a/b/c CSV lines, every change of the logged telemetry is written as one
+#   fixed-width record (SYSLOG_DTYPE) after a self describing header, through a buffered writer that is fsync'ed
+#   periodically. The records can be loaded with numpy.fromfile / numpy.memmap without parsing (see load()), and
+#   the file can be converted back into the CSV system log for the existing tools (mapPlots, log replay).
+#
+#   usage: python3 evms_syslog.py <file_evms_system.bin> [<out.log>]
+#
+#   File layout:
+#       8 bytes   magic b'EVMSSLOG'
+#       uint32    header length in bytes (offset of the first record, multiple of 64)
+#       uint32    record size in bytes
+#       json      {"sw_ver_evms", "sw_ver_syslog", "created", "dtype", "kinds", "raw_fmt"} padded with spaces
+#       records   SYSLOG_DTYPE, little endian. None is NaN in float columns and none_value() in integer columns
+#
+######################################################################################################################
+
+import os
+import sys
+import json
+import struct
+import numpy as np
+from datetime import datetime
+from time import monotonic, time
+from evms_can_decoder import HEX_STR, BIN_STR, evms_frames
+
+sw_ver_syslog = '0.1.0'
+
+MAGIC = b'EVMSSLOG'
+PREAMBLE = struct.Struct('<8sII')
+
+# columns of the a/b/c lines of the CSV system log (DataHolder.get_SysLog_str)
+SYSLOG_COLUMNS = {
+    'a': ('date', 'time', 'latitude', 'longitude', 'spd', 'hdg', 'rpm', 'soc', 'pack_amps', 'pack_volts',
+          'mot_temp', 'mot_ctrl_temp', 'pack_amp_hrs', 'thrtl_inp', 'brake_inp', 'mot_amps', 'rev_bit', 'charging',
+          'econ_bit', 'regen_bit'),
+    'b': ('pack_status', 'pack_hlth', 'pack_cycles', 'pack_open_v', 'pack_avg_cell_v', 'pack_lo_cell_v',
+          'pack_hi_cell_v', 'pack_lo_tmp', 'pack_hi_tmp', 'pack_max_cell_v', 'pack_min_cell_v', 'dsch_rly_enbl',
+          'chg_rly_enbl', 'chg_sfty_enbl', 'alws_on_sig_stat', 'is_rdy_sig_stat', 'pack_12volt', 'pack_limits',
+          'pack_ccl', 'pack_dcl', 'pack_max_cell_num', 'pack_pop_cells'),
+    'c': ('pack_alert_status', 'mlfctn_ind_active', 'multi_prps_inp_sig', 'pid_resp_min', 'pid_resp_max',
+          'pid_fault_cnt', 'pid_err_one', 'pid_err_two'),
+}
+
+
+def csv_column_headers(sw_ver_evms):
+    header_string = str('\n\n*************** Newport Electric Boats, LLC ***************'
+                    + '\nEVMS version ' + sw_ver_evms + ')\n\n')
+
+    header_string = header_string + str('CAN bus columns are defined as:\n' +
+                    'A_HEADER,date,time,lat,lon,spd,hdg,rpm,soc,ibat,vbat,motor_tmp,mot_ctrl_temp,' +
+                    'pack_amp_hrs,thrtl_inp,brake_inp,mot_amps,rev,charging,econ_bit,regen_bit' + '\n'
+                    'B_HEADER,pack_status,pack_hlth,pack_cycles,pack_open_v,pack_avg_cell_v,lo_cell_v,hi_cell_v,' +
+                    'pack_lo_tmp,pack_hi_tmp,pack_max_cell_v,pack_min_cell_v,dsch_rly_enbl,chg_rly_enbl,chg_sfty_enbl,' +
+                    'alws_on_sig_stat,is_rdy_sig_stat,pack_12volt,pack_limits,pack_ccl,pack_dcl,pack_max_cell_num,pack_pop_cells' + '\n'
+                    'C_HEADER,pack_alert_status,mlfctn_ind_active,multi_ptps_inp_sig,pid_resp_min,' +
+                    'pid_resp_max,pid_fault_cnt,pid_err_one,pid_err_two \n' )
+    return header_string
+
+
+# ---------------------------------------------------------------------------------------------------------------
+# column kinds: 'S' text (GPS date/time), 'raw' CAN payload (bytes + dlc), 'f' float signal, or the numpy type of
+# an integer signal, chosen from the signal length so the record stays small. Integer signals are the ones the
+# decoder produces with an integer factor and offset and no rounding; None is stored as none_value() of their type.
+def column_kinds():
+    kinds = {'date': 'S10', 'time': 'S8', 'latitude': 'f8', 'longitude': 'f8', 'spd': 'f', 'hdg': 'f',
+             'pack_cycles': 'i4'}
+    raw_fmt = {}
+    for frame in evms_frames():
+        if frame.raw_attr is not None:
+            kinds[frame.raw_attr] = 'raw'
+            raw_fmt[frame.raw_attr] = frame.raw_fmt
+        for sig in frame.signals:
+            if not (isinstance(sig.factor, int) and isinstance(sig.offset, int) and sig.digits is None):
+                kinds[sig.name] = 'f'
+            elif abs(sig.factor) != 1 or sig.offset != 0:
+                kinds[sig.name] = 'i8'
+            elif sig.length < 8:
+                kinds[sig.name] = 'u1'
+            elif sig.length < 16:
+                kinds[sig.name] = 'i2'
+            elif sig.length < 32:
+                kinds[sig.name] = 'i4'
+            else:
+                kinds[sig.name] = 'i8'
+    return kinds, raw_fmt
+
+
+def none_value(dtype):
+    info = np.iinfo(dtype)
+    return info.max if info.min == 0 else info.min
+
+
+def syslog_dtype(kinds):
+    fields = [('t', '<f8')]
+    for line in 'abc':
+        for name in SYSLOG_COLUMNS[line]:
+            kind = kinds[name]
+            if kind == 'raw':
+                fields.append((name, 'u1', (8,)))
+                fields.append((name + '_dlc', 'u1'))
+            elif kind == 'f':
+                fields.append((name, '<f4'))
+            else:
+                fields.append((name, '<' + kind if kind[0] in 'if' else kind))
+    return np.dtype(fields)
+
+
+SYSLOG_KINDS, SYSLOG_RAW_FMT = column_kinds()
+SYSLOG_DTYPE = syslog_dtype(SYSLOG_KINDS)
+
+
+# raw payload string ('0x1 0xff ...' or '0b1 0b11111111 ...') back to its bytes
+def raw_bytes(raw_str):
+    data = [int(b, 0) for b in raw_str.split()]
+    return data + [0] * (8 - len(data)), len(data)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+class BinarySysLog:
+    def __init__(self, filename, sw_ver_evms, fsync_interval=60):
+        self.filename = filename
+        self.fsync_interval = fsync_interval
+        if os.path.exists(filename) and os.path.getsize(filename) > 0:
+            header = read_header(filename)
+            if header['dtype'] != SYSLOG_DTYPE:
+                raise ValueError(filename + ' was written with a different record layout')
+            self.file = open(filename, 'ab', buffering=64 * 1024)
+        else:
+            self.file = open(filename, 'ab', buffering=64 * 1024)
+            self.file.write(make_header(sw_ver_evms))
+        self.record = np.zeros((), dtype=SYSLOG_DTYPE)
+        self.none = {name: none_value(SYSLOG_DTYPE[name]) for name in SYSLOG_DTYPE.names
+                     if SYSLOG_DTYPE[name].kind in 'iu'}
+        self.last_values = None
+        self.next_sync = monotonic() + fsync_interval
+
+    # appends a record when any logged column of the snapshot changed, returns True if one was written
+    def write(self, snapshot):
+        values = []
+        for line in 'abc':
+            for name in SYSLOG_COLUMNS[line]:
+                value = getattr(snapshot, name)
+                kind = SYSLOG_KINDS[name]
+                if kind[0] == 'S':
+                    values.append(b'' if value is None else str(value).encode())
+                elif kind == 'raw':
+                    values.extend(raw_bytes(value))
+                elif value is None or value == '':
+                    values.append(self.none.get(name, np.nan))
+                else:
+                    values.append(value)
+        written = False
+        if values != self.last_values:
+            self.last_values = values
+            self.record[...] = tuple([time()] + values)
+            self.file.write(self.record.tobytes())
+            written = True
+        if monotonic() >= self.next_sync:
+            self.sync()
+        return written
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.next_sync = monotonic() + self.fsync_interval
+
+    def close(self):
+        self.sync()
+        self.file.close()
+
+
+def make_header(sw_ver_evms):
+    info = {'sw_ver_evms': sw_ver_evms,
+            'sw_ver_syslog': sw_ver_syslog,
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'dtype': SYSLOG_DTYPE.descr,
+            'kinds': SYSLOG_KINDS,
+            'raw_fmt': SYSLOG_RAW_FMT}
+    text = json.dumps(info).encode()
+    length = (PREAMBLE.size + len(text) + 1 + 63) // 64 * 64
+    return PREAMBLE.pack(MAGIC, length, SYSLOG_DTYPE.itemsize) + text.ljust(length - PREAMBLE.size - 1) + b'\n'
+
+
+# returns the header dict, with 'dtype' as a numpy dtype and 'offset' of the first record
+def read_header(filename):
+    with open(filename, 'rb') as file:
+        magic, length, itemsize = PREAMBLE.unpack(file.read(PREAMBLE.size))
+        if magic != MAGIC:
+            raise ValueError(filename + ' is not an EVMS binary system log')
+        header = json.loads(file.read(length - PREAMBLE.size).decode())
+    header['dtype'] = np.dtype([tuple(tuple(x) if isinstance(x, list) else x for x in field)
+                                for field in header['dtype']])
+    header['offset'] = length
+    if header['dtype'].itemsize != itemsize:
+        raise ValueError(filename + ': record size does not match the header')
+    return header
+
+
+# all complete records of the file as a structured array (memory mapped unless mmap=False)
+def load(filename, mmap=True):
+    header = read_header(filename)
+    count = (os.path.getsize(filename) - header['offset']) // header['dtype'].itemsize  # drops a torn last record
+    if mmap:
+        if count == 0:
+            return np.zeros(0, dtype=header['dtype'])
+        return np.memmap(filename, dtype=header['dtype'], mode='r', offset=header['offset'], shape=(count,))
+    return np.fromfile(filename, dtype=header['dtype'], count=count, offset=header['offset'])
+
+
+# ---------------------------------------------------------------------------------------------------------------
+def csv_value(record, name, kind, raw_fmt):
+    value = record[name]
+    if kind[0] == 'S':
+        return value.decode() if value else 'None'
+    if kind == 'raw':
+        table = BIN_STR if raw_fmt.get(name) == 'bin' else HEX_STR
+        return ''.join([table[b] for b in value[:record[name + '_dlc']]])
+    if value.dtype.kind in 'iu':
+        return 'None' if value == none_value(value.dtype) else str(int(value))
+    return 'None' if np.isnan(value) else str(value)  # shortest repr of the stored float32/float64
+
+
+# writes the records as the a/b/c line CSV system log, a line only when it differs from the previous one
+def to_csv(filename, out_filename):
+    header = read_header(filename)
+    kinds, raw_fmt = header['kinds'], header['raw_fmt']
+    last = {'a': None, 'b': None, 'c': None}
+    count = 0
+    with open(out_filename, 'w') as out:
+        out.write(csv_column_headers(header['sw_ver_evms']))
+        for record in load(filename):
+            for line in 'abc':
+                dataline = line + ',' + ','.join([csv_value(record, name, kinds[name], raw_fmt)
+                                                  for name in SYSLOG_COLUMNS[line]])
+                if dataline != last[line]:
+                    last[line] = dataline
+                    out.write(dataline + '\n')
+                    count += 1
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2:
+        print('USAGE: python3 evms_syslog.py <file_evms_system.bin> [<out.log>]')
+        sys.exit(1)
+    in_filename = sys.argv[1]
+    if len(sys.argv) > 2:
+        out_filename = sys.argv[2]
+    else:
+        out_filename = in_filename[:-4] + '.log' if in_filename.endswith('.bin') else in_filename + '.log'
+    lines = to_csv(in_filename, out_filename)
+    print('wrote %d lines to %s' % (lines, out_filename))
@@ -0,0 +1,163 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_triplog.py
+#
+#   Trip log reader for the system logs. The CSV log is memory mapped and the byte offsets of its 'a' records are
+#   found with numpy (no per line python loop). The offset index is cached next to the log (<log>.idx.npz) and only
+#   extended over the appended tail when the log grows, so re-opening the log of the running trip is cheap. Columns
+#   are parsed on demand into typed numpy arrays, with NaN for missing ('None') values.
+#   Binary system logs (evms_syslog, *.bin) are read through their memory mapped records.
+#
+######################################################################################################################
+
+import os
+import mmap
+import numpy as np
+
+sw_ver_triplog = '0.1.0'
+
+# 'a' record columns, named as in the A_HEADER line of the system log
+A_COLUMNS = ('a', 'date', 'time', 'lat', 'lon', 'spd', 'hdg', 'rpm', 'soc', 'ibat', 'vbat', 'motor_tmp',
+             'mot_ctrl_temp', 'pack_amp_hrs', 'thrtl_inp', 'brake_inp', 'mot_amps', 'rev', 'charging', 'econ_bit',
+             'regen_bit')
+
+# the same columns in a binary system log (evms_syslog.SYSLOG_COLUMNS['a'])
+BIN_COLUMNS = {'lat': 'latitude', 'lon': 'longitude', 'ibat': 'pack_amps', 'vbat': 'pack_volts',
+               'motor_tmp': 'mot_temp', 'rev': 'rev_bit'}
+
+INDEX_VERSION = 1
+MAX_FIELD_WIDTH = 24
+
+
+class TripLog:
+    def __init__(self, filename, use_index_cache=True):
+        self.filename = filename
+        self.records = None
+        self.mm = None
+        if filename.endswith('.bin'):
+            from evms_syslog import load
+            self.records = load(filename)
+            self.count = len(self.records)
+            return
+        with open(filename, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size > 0:
+                self.mm = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.buf = np.frombuffer(self.mm, dtype=np.uint8) if self.mm is not None else np.zeros(0, np.uint8)
+        self.starts, self.commas, self.ends = self.load_index(use_index_cache)
+        self.count = len(self.starts)
+
+    def __len__(self):
+        return self.count
+
+    def close(self):
+        self.buf = None
+        self.commas = None
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # index: start offset, offsets of the len(A_COLUMNS)-1 separating commas and end offset of every 'a' record
+    def index_filename(self):
+        return self.filename + '.idx.npz'
+
+    def load_index(self, use_index_cache):
+        starts = np.zeros(0, np.int64)
+        commas = np.zeros((0, len(A_COLUMNS) - 1), np.int64)
+        ends = np.zeros(0, np.int64)
+        indexed = 0
+        if use_index_cache:
+            try:
+                with np.load(self.index_filename()) as cached:
+                    head = bytes(cached['head'])
+                    if int(cached['version']) == INDEX_VERSION and int(cached['indexed']) <= len(self.buf) and \
+                            bytes(self.buf[:len(head)]) == head:
+                        starts, commas, ends = cached['starts'], cached['commas'], cached['ends']
+                        indexed = int(cached['indexed'])
+            except (OSError, KeyError, ValueError):
+                pass
+        if indexed < len(self.buf):
+            new_starts, new_commas, new_ends, indexed_to = self.index_records(indexed)
+            starts = np.concatenate((starts, new_starts))
+            commas = np.concatenate((commas, new_commas))
+            ends = np.concatenate((ends, new_ends))
+            if use_index_cache and indexed_to > indexed:
+                # an unterminated last line may still be written to, it is indexed again next time
+                complete = np.searchsorted(ends, indexed_to)
+                self.save_index(starts[:complete], commas[:complete], ends[:complete], indexed_to)
+        return starts, commas, ends
+
+    def save_index(self, starts, commas, ends, indexed):
+        try:
+            tmp = self.index_filename() + '.tmp.npz'
+            np.savez(tmp, version=INDEX_VERSION, indexed=indexed, head=self.buf[:64].copy(), starts=starts,
+                     commas=commas, ends=ends)
+            os.replace(tmp, self.index_filename())
+        except OSError:
+            pass  # read only log directory, the index is rebuilt next time
+
+    # indexes the lines from byte offset 'offset' on, returns (starts, commas, ends, end of the last complete line)
+    def index_records(self, offset):
+        buf = self.buf[offset:]
+        newlines = np.flatnonzero(buf == 10)
+        terminated = len(newlines) > 0 and newlines[-1] == len(buf) - 1
+        line_ends = newlines if terminated else np.append(newlines, len(buf))
+        line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+        has_cr = buf[np.maximum(line_ends - 1, 0)] == 13
+        line_ends[has_cr & (line_ends > line_starts)] -= 1
+        all_commas = np.flatnonzero(buf == 44)
+        first_comma = np.searchsorted(all_commas, line_starts)
+        n_commas = np.searchsorted(all_commas, line_ends) - first_comma
+
+        # 'a,' records with the full set of columns
+        is_a = (line_ends - line_starts > 2) & (n_commas == len(A_COLUMNS) - 1)
+        is_a[is_a] &= (buf[line_starts[is_a]] == ord('a')) & (buf[line_starts[is_a] + 1] == ord(','))
+        comma_idx = first_comma[is_a][:, None] + np.arange(len(A_COLUMNS) - 1)
+        indexed_to = offset + int(newlines[-1]) + 1 if len(newlines) else offset
+        return line_starts[is_a] + offset, all_commas[comma_idx] + offset, line_ends[is_a] + offset, indexed_to
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # raw bytes of one column as a fixed width 'S' array
+    def column_bytes(self, name):
+        col = A_COLUMNS.index(name)
+        begin = self.starts if col == 0 else self.commas[:, col - 1] + 1
+        end = self.ends if col == len(A_COLUMNS) - 1 else self.commas[:, col]
+        width = min(MAX_FIELD_WIDTH, int((end - begin).max(initial=1)))
+        pos = begin[:, None] + np.arange(width)
+        chars = self.buf[np.minimum(pos, len(self.buf) - 1)]
+        chars[pos >= end[:, None]] = 0
+        return np.ascontiguousarray(chars).view('S%d' % width).ravel()
+
+    def column(self, name, dtype=np.float64):
+        if self.records is not None:
+            values = self.records[BIN_COLUMNS.get(name, name)]
+            if dtype is str:
+                return np.char.decode(values) if values.dtype.kind == 'S' else values.astype(str)
+            values = values.astype(dtype)
+            if values.dtype.kind == 'f' and self.records.dtype[BIN_COLUMNS.get(name, name)].kind in 'iu':
+                from evms_syslog import none_value
+                raw = self.records[BIN_COLUMNS.get(name, name)]
+                values[raw == none_value(raw.dtype)] = np.nan
+            return values
+        if self.count == 0:
+            return np.zeros(0, dtype=str if dtype is str else dtype)
+        raw = self.column_bytes(name)
+        if dtype is str:
+            return np.char.decode(raw)
+        raw = np.where((raw == b'None') | (raw == b''), b'nan', raw)
+        try:
+            return raw.astype(dtype)
+        except ValueError:  # a corrupt field, fall back to parsing one value at a time
+            values = np.empty(len(raw), dtype=dtype)
+            for idx, text in enumerate(raw):
+                try:
+                    values[idx] = float(text)
+                except ValueError:
+                    values[idx] = np.nan
+            return values
+
+    def columns(self, *names):
+        return {name: self.column(name) for name in names}
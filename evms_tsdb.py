@@ -0,0 +1,348 @@
+######################################################################################################################
+#
+#   Copyright (c) 2022 Newport Electric Boats, LLC. All rights reserved.
+#   Electric Vessel Management System (EVMS)
+#   Filename: evms_tsdb.py
+#
+#   Long term telemetry store, one SQLite database in WAL mode. Three tiers:
+#       raw   every RECORD_DTYPE record (10 Hz), one row per wall clock minute: each column is zlib compressed on
+#             its own, so a query decompresses only the channels it asks for
+#       min   mean, min and max of every RECORD_CHANNELS channel per minute, one SQL column each
+#       hrs   the same per hour, computed from the minute rows (weighted by their sample count)
+#   Tsdb.record() only copies the record into the block of the running minute; the finished blocks are compressed,
+#   written and aggregated by the TsdbWriter thread, so the 10 Hz tasks never wait for the SD card. Queries run on
+#   a connection per thread (WAL: readers don't block the writer) and use the primary key range of one tier.
+#
+#   Retention: raw blocks older than raw_days and minute rows older than min_days (0: no age limit) are deleted,
+#   then the oldest raw blocks, then the oldest minute rows, until the pages in use are below max_mb. The hour rows
+#   are kept for the life of the boat. Deleted pages are reused by SQLite, so the file stops growing at max_mb.
+#
+#   usage: python3 evms_tsdb.py <tsdb file> <channel>[,<channel>...] [<hours back, default 1>] [raw|min|hrs]
+#
+######################################################################################################################
+
+import sys
+import json
+import zlib
+import queue
+import sqlite3
+import threading
+import numpy as np
+from collections import namedtuple
+from time import time, monotonic
+from evms_data_holder import RECORD_CHANNELS, RECORD_DTYPE
+
+sw_ver_tsdb = '0.1.0'
+
+TIERS = ('raw', 'min', 'hrs')
+TIER_SECONDS = {'min': 60, 'hrs': 3600}
+RAW_RATE = 10  # records per second written by the 10 Hz tasks
+BLOCK_RECORDS = 1200  # a block is written at the end of its minute, or when it holds this many records
+PRUNE_INTERVAL = 600  # seconds between retention checks
+
+# one query result: t (seconds since the epoch) and {channel: array} for each of values, lows and highs (lows and
+# highs are None for the raw tier)
+TsRange = namedtuple('TsRange', ('tier', 't', 'values', 'lows', 'highs'))
+
+
+def agg_columns(channels):
+    columns = []
+    for name in channels:
+        columns += [name, name + '__min', name + '__max']
+    return columns
+
+
+# a raw block: record count, the byte offsets of the compressed columns, then the columns ('t' first)
+def pack_block(times, records):
+    columns = [zlib.compress(times.tobytes(), 1)]
+    columns += [zlib.compress(np.ascontiguousarray(records[name]).tobytes(), 1) for name in records.dtype.names]
+    offsets = np.cumsum([0] + [len(c) for c in columns], dtype='<u4')
+    header = np.array([len(times), len(offsets)], dtype='<u4')
+    return header.tobytes() + offsets.tobytes() + b''.join(columns)
+
+
+def unpack_column(block, dtype, column):
+    count, noffsets = np.frombuffer(block, dtype='<u4', count=2)
+    offsets = np.frombuffer(block, dtype='<u4', count=noffsets, offset=8)
+    start = 8 + 4 * int(noffsets)
+    raw = zlib.decompress(block[start + offsets[column]:start + offsets[column + 1]])
+    if column == 0:
+        return np.frombuffer(raw, dtype='<f8')
+    field = dtype[dtype.names[column - 1]]
+    return np.frombuffer(raw, dtype=field.base).reshape((int(count),) + field.shape)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+class Tsdb:
+    def __init__(self, filename, raw_days=7, min_days=0, max_mb=2048, log=None):
+        self.filename = filename
+        self.raw_days = raw_days
+        self.min_days = min_days
+        self.max_mb = max_mb
+        self.log = log
+        self.channels = RECORD_CHANNELS
+        self.columns = agg_columns(self.channels)
+        self.local = threading.local()
+        self.lock = threading.Lock()  # the running block, shared by record() and the raw queries
+        self.times = np.zeros(BLOCK_RECORDS)
+        self.records = np.zeros(BLOCK_RECORDS, dtype=RECORD_DTYPE)
+        self.count = 0
+        self.minute = None
+        self.layouts = {}  # layout id: dtype of its raw blocks
+        self.create()
+        self.writer = TsdbWriter(self)
+        self.writer.start()
+
+    def connect(self):
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.filename, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self.local.db = db
+        return db
+
+    def create(self):
+        db = self.connect()
+        db.execute('CREATE TABLE IF NOT EXISTS layouts (id INTEGER PRIMARY KEY, descr TEXT UNIQUE)')
+        db.execute('CREATE TABLE IF NOT EXISTS raw (t0 REAL PRIMARY KEY, t1 REAL, layout INTEGER, data BLOB)')
+        for tier in ('min', 'hrs'):
+            db.execute('CREATE TABLE IF NOT EXISTS %s (t INTEGER PRIMARY KEY, n INTEGER)' % tier)
+            # channels added since the database was created
+            existing = {row[1] for row in db.execute('PRAGMA table_info(%s)' % tier)}
+            for column in self.columns:
+                if column not in existing:
+                    db.execute('ALTER TABLE %s ADD COLUMN %s REAL' % (tier, column))
+        descr = json.dumps(RECORD_DTYPE.descr)
+        db.execute('INSERT OR IGNORE INTO layouts (descr) VALUES (?)', (descr,))
+        self.layout = db.execute('SELECT id FROM layouts WHERE descr = ?', (descr,)).fetchone()[0]
+        db.commit()
+
+    def layout_dtype(self, layout):
+        dtype = self.layouts.get(layout)
+        if dtype is None:
+            descr = self.connect().execute('SELECT descr FROM layouts WHERE id = ?', (layout,)).fetchone()[0]
+            dtype = np.dtype([tuple(field) for field in json.loads(descr)])
+            self.layouts[layout] = dtype
+        return dtype
+
+    # 10 Hz tasks: fill(out) writes the current record into out (DataHolder.get_record)
+    def record(self, fill, t=None):
+        if t is None:
+            t = time()
+        minute = int(t // 60)
+        with self.lock:
+            if self.count and (minute != self.minute or self.count == BLOCK_RECORDS):
+                self.end_block()
+            self.minute = minute
+            self.times[self.count] = t
+            fill(out=self.records[self.count:self.count + 1].reshape(()))
+            self.count += 1
+
+    def end_block(self):
+        self.writer.blocks.put((self.times[:self.count].copy(), self.records[:self.count].copy()))
+        self.count = 0
+
+    # writes the running block, waits for the writer
+    def close(self):
+        with self.lock:
+            if self.count:
+                self.end_block()
+        self.writer.stop()
+
+    # -----------------------------------------------------------------------------------------------------------
+    # queries, any thread
+    def oldest(self, tier):
+        column = 't0' if tier == 'raw' else 't'
+        row = self.connect().execute('SELECT MIN(%s) FROM %s' % (column, tier)).fetchone()
+        return row[0]
+
+    # the finest tier that answers start..end with at most max_points points
+    def pick_tier(self, start, end, max_points):
+        span = end - start
+        if span * RAW_RATE <= max_points:
+            oldest = self.oldest('raw')
+            if oldest is None or oldest <= start + 60:  # None: nothing written yet, only the running block
+                return 'raw'
+        if span / TIER_SECONDS['min'] <= max_points:
+            oldest = self.oldest('min')
+            if oldest is not None and oldest <= start + 3600:
+                return 'min'
+        return 'hrs'
+
+    # channels between start and end (seconds since the epoch), tier None picks one (see pick_tier)
+    def query(self, channels, start, end, tier=None, max_points=5000):
+        if isinstance(channels, str):
+            channels = (channels,)
+        if tier is None:
+            tier = self.pick_tier(start, end, max_points)
+        if tier == 'raw':
+            return self.query_raw(channels, start, end)
+        unknown = set(channels).difference(self.channels)
+        if unknown:
+            raise ValueError('not a stored channel: ' + ', '.join(sorted(unknown)))
+        rows = self.connect().execute('SELECT t, ' + ', '.join(agg_columns(channels)) + ' FROM ' + tier +
+                                      ' WHERE t >= ? AND t <= ? ORDER BY t',
+                                      (int(start // TIER_SECONDS[tier]) * TIER_SECONDS[tier], end)).fetchall()
+        data = np.array(rows, dtype=np.float64).reshape(len(rows), 1 + 3 * len(channels))  # NULL -> NaN
+        values, lows, highs = {}, {}, {}
+        for i, name in enumerate(channels):
+            values[name] = data[:, 1 + 3 * i]
+            lows[name] = data[:, 2 + 3 * i]
+            highs[name] = data[:, 3 + 3 * i]
+        return TsRange(tier, data[:, 0], values, lows, highs)
+
+    def query_raw(self, channels, start, end):
+        unknown = set(channels).difference(RECORD_DTYPE.names)
+        if unknown:
+            raise ValueError('not a stored channel: ' + ', '.join(sorted(unknown)))
+        rows = self.connect().execute('SELECT layout, data FROM raw WHERE t0 > ? AND t0 <= ? ORDER BY t0',
+                                      (start - 60, end)).fetchall()
+        times = []
+        values = {name: [] for name in channels}
+        for layout, block in rows:
+            dtype = self.layout_dtype(layout)
+            t = unpack_column(block, dtype, 0)
+            keep = (t >= start) & (t <= end)
+            if not keep.any():
+                continue
+            times.append(t[keep])
+            for name in channels:
+                if name in dtype.names:
+                    values[name].append(unpack_column(block, dtype, 1 + dtype.names.index(name))[keep])
+                else:
+                    values[name].append(np.full(int(keep.sum()), np.nan))
+        # the records of the running minute
+        with self.lock:
+            t = self.times[:self.count]
+            keep = (t >= start) & (t <= end)
+            if keep.any():
+                times.append(t[keep].copy())
+                for name in channels:
+                    values[name].append(self.records[name][:self.count][keep].copy())
+        if not times:
+            return TsRange('raw', np.zeros(0), {name: np.zeros(0) for name in channels}, None, None)
+        return TsRange('raw', np.concatenate(times), {name: np.concatenate(values[name]) for name in channels},
+                       None, None)
+
+
+# ---------------------------------------------------------------------------------------------------------------
+class TsdbWriter(threading.Thread):
+    def __init__(self, tsdb):
+        super().__init__(name='TsdbWriter', daemon=True)
+        self.tsdb = tsdb
+        self.blocks = queue.SimpleQueue()
+        self.next_prune = 0
+        columns = tsdb.columns
+        self.min_insert = ('INSERT OR REPLACE INTO min (t, n, ' + ', '.join(columns) + ') VALUES (' +
+                           ', '.join('?' * (2 + len(columns))) + ')')
+        rollup = []
+        for name in tsdb.channels:
+            rollup += ['SUM(%s * n) / SUM(CASE WHEN %s IS NOT NULL THEN n END)' % (name, name),
+                       'MIN(%s__min)' % name, 'MAX(%s__max)' % name]
+        self.hrs_insert = ('INSERT OR REPLACE INTO hrs (t, n, ' + ', '.join(columns) + ') SELECT ?, SUM(n), ' +
+                           ', '.join(rollup) + ' FROM min WHERE t >= ? AND t < ?')
+
+    def run(self):
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            try:
+                self.write(*block)
+                if monotonic() >= self.next_prune:
+                    self.next_prune = monotonic() + PRUNE_INTERVAL
+                    self.prune()
+            except Exception as e:
+                if self.tsdb.log is not None:
+                    self.tsdb.log('TsdbWriter ERROR: ' + str(e))
+        db = getattr(self.tsdb.local, 'db', None)
+        if db is not None:
+            db.close()
+
+    def stop(self):
+        if self.is_alive():
+            self.blocks.put(None)
+            self.join(10)
+
+    # one raw block (the records of one minute) and the minute and hour rows it belongs to
+    def write(self, times, records):
+        tsdb = self.tsdb
+        db = tsdb.connect()
+        db.execute('INSERT OR REPLACE INTO raw (t0, t1, layout, data) VALUES (?, ?, ?, ?)',
+                   (float(times[0]), float(times[-1]), tsdb.layout, pack_block(times, records)))
+        minute = int(times[0] // 60) * 60
+        n = len(times)
+        values = np.column_stack([records[name] for name in tsdb.channels])
+        present = ~np.isnan(values)
+        counts = present.sum(axis=0)
+        sums = np.where(present, values, 0.0).sum(axis=0)
+        lows = np.where(present, values, np.inf).min(axis=0)
+        highs = np.where(present, values, -np.inf).max(axis=0)
+        # a minute already in the database (restart within the minute): merged, weighted by its sample count
+        row = db.execute('SELECT n, ' + ', '.join(tsdb.columns) + ' FROM min WHERE t = ?', (minute,)).fetchone()
+        if row is not None:
+            old = np.array(row[1:], dtype=np.float64).reshape(-1, 3)
+            old_present = ~np.isnan(old[:, 0])
+            counts = counts + np.where(old_present, row[0], 0)
+            sums = sums + np.where(old_present, old[:, 0] * row[0], 0.0)
+            lows = np.fmin(lows, old[:, 1])
+            highs = np.fmax(highs, old[:, 2])
+            n += row[0]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            means = sums / counts
+        aggregate = np.column_stack([means, lows, highs]).ravel()
+        aggregate[~np.isfinite(aggregate)] = np.nan
+        db.execute(self.min_insert, [minute, n] + [None if np.isnan(v) else float(v) for v in aggregate])
+        hour = minute - minute % 3600
+        db.execute(self.hrs_insert, (hour, hour, hour + 3600))
+        db.commit()
+
+    def used_bytes(self, db):
+        page_size = db.execute('PRAGMA page_size').fetchone()[0]
+        pages = db.execute('PRAGMA page_count').fetchone()[0] - db.execute('PRAGMA freelist_count').fetchone()[0]
+        return pages * page_size
+
+    # retention: age limits, then the size limit (oldest raw blocks first, then the oldest minute rows)
+    def prune(self):
+        tsdb = self.tsdb
+        db = tsdb.connect()
+        now = time()
+        if tsdb.raw_days > 0:
+            db.execute('DELETE FROM raw WHERE t0 < ?', (now - tsdb.raw_days * 86400,))
+        if tsdb.min_days > 0:
+            db.execute('DELETE FROM min WHERE t < ?', (now - tsdb.min_days * 86400,))
+        db.commit()
+        limit = tsdb.max_mb * 1024 * 1024
+        for table, column, batch in (('raw', 't0', 60), ('min', 't', 1440)):
+            while self.used_bytes(db) > limit:
+                deleted = db.execute('DELETE FROM %s WHERE %s IN (SELECT %s FROM %s ORDER BY %s LIMIT %d)' %
+                                     (table, column, column, table, column, batch)).rowcount
+                db.commit()
+                if deleted == 0:
+                    break
+        db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+
+
+# ---------------------------------------------------------------------------------------------------------------
+def main():
+    if len(sys.argv) < 3:
+        print('usage: python3 evms_tsdb.py <tsdb file> <channel>[,<channel>...] [<hours back>] [raw|min|hrs]')
+        return
+    channels = sys.argv[2].split(',')
+    hours = float(sys.argv[3]) if len(sys.argv) > 3 else 1.0
+    tier = sys.argv[4] if len(sys.argv) > 4 else None
+    tsdb = Tsdb(sys.argv[1])
+    end = time()
+    started = monotonic()
+    result = tsdb.query(channels, end - hours * 3600, end, tier)
+    elapsed = monotonic() - started
+    tsdb.close()
+    print('# tier ' + result.tier + ', ' + str(len(result.t)) + ' points in ' +
+          '{:.1f} ms'.format(elapsed * 1000))
+    for i, t in enumerate(result.t):
+        print('{:.1f}'.format(t) + ',' + ','.join(str(result.values[name][i]) for name in channels))
+
+
+if __name__ == "__main__":
+    main()
@@ -17,20 +17,37 @@ import plotly.express as px
 import pandas as pd
 import logging
 import sys
+import hashlib
+import threading
+from evms_triplog import TripLog
 
 max_pwr = 12
 
+image_width = 1280
+image_height = 640
+map_style = 'carto-positron'  # part of the render cache key
+map_layout_ver = 2  # bump when the plotted points or layout change, invalidates cached images
+map_cache_max_bytes = 64 * 1024 * 1024
+map_prerender_logs = 3  # newest finished logs rendered ahead of time
+map_prerender_bytes = map_cache_max_bytes // 2  # prerendered images stop here, the rest is left for viewed logs
+map_stats = ('pwr', 'soc', 'spd', 'pack_amp_hrs')
+map_stat_columns = {'soc': 'soc', 'spd': 'spd', 'pack_amp_hrs': 'pack_amp_hrs'}  # TripLog column of each stat
+map_stat_labels = {'pwr': ('kW', 'Power'), 'soc': ('%', 'State of Charge'), 'spd': ('kts', 'Speed'),
+                   'pack_amp_hrs': ('Ah', 'Pack Amp Hrs')}
+map_max_points = 1000
+map_min_spacing_m = 5
+earth_radius_m = 6371000
+
 maps_dir = '/home/neb/evms2/maps/'
 #maps_dir = '/home/walt/evms2/maps/'
 
 class mapPlots():
     def __init__(self, applog, buffer):
-        self.sw_ver_maps = '0.4.2'
+        self.sw_ver_maps = '0.7.0'
         self.applog = applog
         self.buffer = buffer
-        logging.basicConfig(format='%(asctime)s - %(message)s', level=logging.INFO, handlers=[
-            logging.FileHandler(applog),
-            logging.StreamHandler(sys.stdout)])
+        self.render_lock = threading.Lock()
+        self.prerender_thread = None
 
     def is_str_Float(self, string):
         try:
@@ -40,180 +57,158 @@ class mapPlots():
             return False
 
     def log(self, message):
-        self.buffer += message + '\n'
-        logging.info(message)
+        logging.info(message)  # queued, written by the evms_log LogWriter thread
 
 
     def usage(self):
         self.log('USAGE: python3 mapPlots.py ../../self.logs/test_evms_system.self.log')
 
-    def plot_coords(self, filename, stat):
-        #needed for input into the gmplot tool, as it takes DDmmmmm format (RMC outputs DDmmmmm)
-        base_name = filename.split('/')[-1]
-        image_name = base_name + '_trip_map_'+ stat +'.png'
-        # if os.path.isfile(maps_dir + image_name):
-        #     return maps_dir + image_name
+    # ---------------------------------------------------------------------------------------------------------------
+    # Render cache: the image name carries a hash of everything the image depends on, so a log that is still
+    # growing (new size / mtime) or a changed plot style renders a new image and stale ones are never shown.
+    def cached_image_name(self, filename, stat):
+        st = os.stat(filename)
+        key = '%s|%d|%d|%s|%dx%d|%s|%d' % (os.path.abspath(filename), st.st_size, st.st_mtime_ns, stat,
+                                            image_width, image_height, map_style, map_layout_ver)
+        digest = hashlib.sha1(key.encode()).hexdigest()[:12]
+        return filename.split('/')[-1] + '_trip_map_' + stat + '_' + digest + '.png'
+
+    # deletes the least recently used map images until the cache fits in map_cache_max_bytes
+    def evict_map_cache(self):
         try:
-            f = open(filename, 'r+')
-            f.readline()
-            sw_ver = 11 #FIXME... int(f.readline().split(' ')[-1].rstrip().split('.')[1])
-            if sw_ver < 10:
-                table = np.genfromtxt(filename, dtype=str, delimiter=',', skip_header=4, invalid_raise=False)
-                lats = table[:, 14]
-                lons = table[:, 15]
-                ibats = table[:, 4]
-                vbats = table[:, 5]
-                socs = table[:, 13]
-                spds = table[:, 16]
-                pack_amp_hrs_list = table[:, 12]
-                convert_to_DDmmmmm = True
-            else:
-                tmp = filename + '_tmp'
-                file = open(filename, 'r+')
-                tmp_file = open(tmp, 'w+')
-                line = file.readline()
-                count = 0
-                while line != '':
-                    if count >= 9:
-                        if line[0] == 'a':
-                            l = len(line.split(','))
-                            if  l == 21:
-                                tmp_file.write(line)
-                    line = file.readline()
-                    count+=1
-                tmp_file.close()
-                file.close()
-                convert_to_DDmmmmm = False
-
-            #convert_to_DDmmmmm = True # until May 14th at noon, the self.logs have been written using DD mm.mmmm
+            images = []
+            for name in os.listdir(maps_dir):
+                if '_trip_map_' in name and name.endswith('.png'):
+                    st = os.stat(maps_dir + name)
+                    images.append((st.st_mtime, st.st_size, name))
+            total = sum(size for mtime, size, name in images)
+            for mtime, size, name in sorted(images):
+                if total <= map_cache_max_bytes:
+                    break
+                os.remove(maps_dir + name)
+                total -= size
         except Exception as e:
-            return 'plot_coords part 1 - File access ERROR: ' + str(e)
+            self.log('evict_map_cache ERROR: ' + str(e))
+
+    # renders all map_stats of the newest finished (no longer written) logs in a background thread, so switching
+    # between them in the TripLog tab only loads the cached images. filenames: newest first. Only the newest
+    # map_prerender_logs logs are rendered, and only while their images fit in map_prerender_bytes, so the
+    # prerendered set is never evicted by itself (and rendered again on the next start).
+    def prerender(self, filenames):
+        if self.prerender_thread is not None and self.prerender_thread.is_alive():
+            return
+        self.prerender_thread = threading.Thread(target=self.prerender_logs, args=(list(filenames),), daemon=True)
+        self.prerender_thread.start()
+
+    def prerender_logs(self, filenames):
+        budget = map_prerender_bytes
+        for filename in filenames[:map_prerender_logs]:
+            for stat in map_stats:
+                try:
+                    image = self.plot_coords(filename, stat)  # cached: only marked most recently used
+                    if os.path.isfile(image):
+                        budget -= os.path.getsize(image)
+                except Exception as e:
+                    self.log('prerender ERROR: ' + filename + ' ' + stat + ': ' + str(e))
+                if budget <= 0:
+                    self.log('prerender stopped at ' + filename + ', map_prerender_bytes reached')
+                    return
 
+    def plot_coords(self, filename, stat):
         try:
-            table = np.genfromtxt(tmp, dtype=str, delimiter=',', skip_header=1, invalid_raise=False)
-            # table = np.delete(table, np.where(
-            # (table[:, 0] == 'b') | (table[:, 0] == 'c')), axis=0)
-            lats = table[:, 3]
-            lons = table[:, 4]
-            ibats = table[:, 9]
-            vbats = table[:, 10]
-            socs = table[:, 8]
-            spds = table[:, 5]
-            pack_amp_hrs_list = table[:, 13]
-
-            for idx, lat in enumerate(lats):
-                if self.is_str_Float(lat):
-                    lat = float(lat)
-                    if convert_to_DDmmmmm == True:
-                        lat = float(lat) / 100
-                        DD = math.trunc(lat)
-                        mmmmm = lat - DD
-                        ddddd = mmmmm * 100 / 60
-                        lats[idx] = DD + ddddd
-                    else:
-                        lats[idx] = float(lat) #/ 100
-
-            for idx, lon in enumerate(lons):
-                if self.is_str_Float(lon):
-                    lon = float(lon)
-                    if convert_to_DDmmmmm == True:
-                        lon = float(lon) / 100
-                        DD = math.trunc(lon)
-                        mmmmm = lon - DD
-                        ddddd = mmmmm * 100 / 60
-                        lons[idx] = (DD + ddddd) * -1
-                    else:
-                        lons[idx] = float(lon) #/ -100
+            image_name = self.cached_image_name(filename, stat)
         except Exception as e:
-            return 'plot_coords part 2 - ERROR: ' + str(e)
-
+            return 'plot_coords - File access ERROR: ' + str(e)
+        # a cache hit doesn't wait for a render in progress (render_lock)
         try:
-            colors = []
+            os.utime(maps_dir + image_name)  # most recently used
+            return maps_dir + image_name
+        except OSError:
+            pass  # not rendered yet (or just evicted)
+        with self.render_lock:
+            if os.path.isfile(maps_dir + image_name):  # rendered while waiting for the lock
+                return maps_dir + image_name
+            result = self.render_coords(filename, stat, image_name)
+        if result == maps_dir + image_name:
+            self.evict_map_cache()
+        return result
+
+    # ---------------------------------------------------------------------------------------------------------------
+    # DD.dddd from the NMEA DDMM.mmmm notation (logs written before May 14th 2022 noon), element wise
+    @staticmethod
+    def ddmm_to_decimal(ddmm):
+        DD = np.trunc(ddmm / 100)
+        return DD + (ddmm - DD * 100) / 60
+
+    # along track distance in m from the first point, haversine between consecutive points
+    @staticmethod
+    def track_distance(lats, lons):
+        lat = np.radians(lats)
+        lon = np.radians(lons)
+        a = np.sin(np.diff(lat) / 2) ** 2 + np.cos(lat[:-1]) * np.cos(lat[1:]) * np.sin(np.diff(lon) / 2) ** 2
+        step = 2 * earth_radius_m * np.arcsin(np.sqrt(np.minimum(a, 1)))
+        return np.concatenate(([0], np.cumsum(step)))
+
+    # keeps the first point of every min_spacing (at least track length / max_points) stretch of the track,
+    # plus the last point, so slow harbour manoeuvres don't crowd out the rest of the trip
+    def downsample(self, lats, lons):
+        if len(lats) < 2:
+            return np.arange(len(lats))
+        dist = self.track_distance(lats, lons)
+        spacing = max(map_min_spacing_m, dist[-1] / map_max_points)
+        keep = np.unique((dist // spacing).astype(np.int64), return_index=True)[1]
+        if keep[-1] != len(lats) - 1:
+            keep = np.append(keep, len(lats) - 1)
+        return keep
+
+    # reads the trip log and returns (lats, lons, stat values, stat_symbol, stat_name) of the points to plot
+    def trip_points(self, filename, stat):
+        triplog = TripLog(filename)
+        try:
+            lats = triplog.column('lat')
+            lons = triplog.column('lon')
             if stat == 'pwr':
-                stat_symbol = "kW"
-                stat_name = "Power"
-                for idx, ibat in enumerate(ibats):
-                    if self.is_str_Float(ibat):
-                        ibat = float(ibat)
-                        pwr = abs((float(ibat) * float(vbats[idx])) / 1000) #we don't want to show charging as a negitive power....
-                        colors.append(pwr) # power color selection could be improved here.
-                    else:
-                        colors.append(0)
-            elif stat == 'soc':
-                stat_symbol = "%"
-                stat_name = "State of Charge"
-                colors.append(0.0) #set min for color scale
-                lons = np.append(lons, lons[-1])
-                lats = np.append(lats, lats[-1])
-                colors.append(100.0) #set max for color scale
-                lons = np.append(lons, lons[-1])
-                lats = np.append(lats, lats[-1])
-                for idx, soc in enumerate(socs):
-                    if self.is_str_Float(soc):
-                        soc = float(soc)
-                        colors.append(float(soc))
-                    else:
-                        colors.append(0)
-            elif stat == 'pack_amp_hrs':
-                stat_symbol = "Ah"
-                stat_name = "Pack Amp Hrs"
-                for idx, pack_amp_hrs in enumerate(pack_amp_hrs_list):
-                    if self.is_str_Float(pack_amp_hrs):
-                        pack_amp_hrs = float(pack_amp_hrs)
-                        colors.append(float(pack_amp_hrs))
-                    else:
-                        colors.append(0)
-            elif stat == 'spd':
-                stat_symbol = "kts"
-                stat_name = "Speed"
-                for idx, spd in enumerate(spds):
-                    if self.is_str_Float(spd):
-                        spd = float(spd)
-                        colors.append(float(spd))
-                    else:
-                        colors.append(0)
-
+                values = np.abs(triplog.column('ibat') * triplog.column('vbat') / 1000)  # don't show charging as negative power
+            else:
+                values = triplog.column(map_stat_columns[stat])
+        finally:
+            triplog.close()
+        stat_symbol, stat_name = map_stat_labels[stat]
+
+        # the GPS position was logged as DDMM.mmmm (west longitudes unsigned) by the older software
+        ddmm = (np.abs(lats) > 90) | (np.abs(lons) > 180)
+        lats = np.where(ddmm, self.ddmm_to_decimal(lats), lats)
+        lons = np.where(ddmm, -self.ddmm_to_decimal(lons), lons)
+
+        values = np.where(np.isnan(values), 0.0, values)  # a missing value plots as 0, a missing position is dropped
+        valid = np.isfinite(lats) & np.isfinite(lons) & (lats != 0.0) & (lons != 0.0)
+        lats, lons, values = lats[valid], lons[valid], values[valid]
+        keep = self.downsample(lats, lons)
+        return lats[keep], lons[keep], values[keep], stat_symbol, stat_name
+
+    def render_coords(self, filename, stat, image_name):
+        try:
+            lats, lons, values, stat_symbol, stat_name = self.trip_points(filename, stat)
+            if len(lats) == 0:
+                return 'plot_coords - no GPS positions in ' + filename
         except Exception as e:
-            return 'plot_coords part 3 - ERROR: ' + str(e)
+            return 'plot_coords part 1 - File access ERROR: ' + str(e)
 
         try:
-            df = pd.DataFrame({'lats': lats, 'lons': lons, stat_symbol: colors})
-            df = df.dropna()
-            df = df[df.lats != '']
-            df = df[df.lons != '']
-            df = df[df.lats != 0.0]
-            df = df[df.lons != 0.0]
-            df = df[df.lats != 'None']
-            df = df[df.lons != 'None']
-            df = df[df.lats != 'lat']
-            df = df[df.lons != 'lon']
-            df.lats = df.lats.astype(float)
-            df.lons = df.lons.astype(float)
-            df[stat_symbol] = df[stat_symbol].astype(float)
-
-            #down sample before plotting
-            df=df.iloc[2::10, :]
-
-            max_bound = max(abs(df.lats.max() - df.lats.min()), abs(df.lons.min() - df.lons.max())) * 111 #todo: change this const to a variable with a discription of what it is
-            zoom = 14 - np.log(max_bound)
-            y1 = df.lats.min()
-            y2 = df.lats.max()
-            x1 = df.lons.min()
-            x2 = df.lons.max()
-            xspan = x2- x1
-            yspan = y2 - y1
-            center_lon = (xspan/2) + x1
-            center_lat = (yspan/2) + y1
+            df = pd.DataFrame({'lats': lats, 'lons': lons, stat_symbol: values})
+            center_lat = (lats.min() + lats.max()) / 2
+            center_lon = (lons.min() + lons.max()) / 2
 
             if stat == 'soc':
-                fig = px.scatter_mapbox(df, lat=df.lats, lon=df.lons, color=df[stat_symbol], color_continuous_scale='aggrnyl')  # 'rainbow')
+                fig = px.scatter_mapbox(df, lat=df.lats, lon=df.lons, color=df[stat_symbol],
+                                        color_continuous_scale='aggrnyl', range_color=(0.0, 100.0))
             else:
                 fig = px.scatter_mapbox(df, lat=df.lats, lon=df.lons, color=df[stat_symbol], color_continuous_scale='rainbow')
 
             #for zoom in range(12,13,1): #TODO zero in on good zoom level
             zoom=12
             fig.update_mapboxes(zoom=zoom, center_lat=center_lat, center_lon=center_lon)
-            fig.update_layout(title='Trip Map: ' + stat_name, title_x=0.5, mapbox_style='carto-positron',
+            fig.update_layout(title='Trip Map: ' + stat_name, title_x=0.5, mapbox_style=map_style,
                               font_family='Helvetica',
                               font_size=10,
                               font_color='blue',
@@ -221,12 +216,9 @@ class mapPlots():
                               title_font_size=20,
                               title_font_color='blue',
                               )
-       #     fig.data[0].update(zmin=0.0, zmax=100)
-            fig.write_image(maps_dir + image_name, width=1280, height=640)
+            fig.write_image(maps_dir + image_name, width=image_width, height=image_height)
         except Exception as e:
-            return 'plot_coords part 4 - ERROR: ' + str(e)
-            self.usage()
+            return 'plot_coords part 2 - ERROR: ' + str(e)
         #image_name = 'zoomlevel_' + str(zoom) + '_' + image_name
         return maps_dir + image_name
 
-
@@ -3,13 +3,12 @@ echo "replaying candump file..."
 
 echo "sudo ip link add dev vcan0 type vcan"
 echo "sudo ip link set up vcan0"
-echo "logfile=2022-05-14_evms_gps.log can0"
-echo "canplayer -I $logfile vcan0=can0"
+echo "logfile=2022-05-14_evms_can.log can0"
+echo "python3 evms_replay.py $logfile --bus vcan0 --speed 1"
 
 sudo ip link add dev vcan0 type vcan
 sudo ip link set up vcan0
 logfile=./logs/2022-05-14_evms_can.log
 
-canplayer -I $logfile vcan0=can0
-
-
+# evms_replay.py also takes --speed N (N x real time), --max and --seek <unix time>
+python3 evms_replay.py $logfile --bus vcan0 --speed 1 &